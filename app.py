@@ -11,6 +11,11 @@ Modules:
     flask_cors: Enables Cross-Origin Resource Sharing (CORS) for the application.
     routers: Contains the application's route definitions.
     error_handlers: Contains custom error handler registrations.
+    profiler: Contains the opt-in request profiler.
+    slow_queries: Contains the slow-query log.
+    snapshot: Contains the shared read snapshot of movies and actors.
+    jobs: Contains the workers applying asynchronous bulk writes.
+    unit_of_work: Contains the request-scoped transaction hooks.
     settings: Includes configuration values, such as `DATABASE_URL`.
     models: Defines database setup and initialization.
 
@@ -27,6 +32,11 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 from routers import register_routes
 from error_handlers import register_error_handlers
+from profiler import register_profiler
+from slow_queries import register_slow_query_log
+from snapshot import register_snapshot
+from jobs import register_jobs
+from unit_of_work import register_unit_of_work
 from settings import DATABASE_URL
 from models import setup_db, create_tables
 
@@ -47,19 +57,36 @@ def create_app(test_config=None):
     """
     # Create and configure the application
     app = Flask(__name__)
+    if test_config:
+        app.config.from_mapping(test_config)
     
     # Enable CORS (Cross-Origin Resource Sharing)
-    CORS(app, resources={r'/api/': {'origins': '*'}})
+    CORS(app, resources={r'/api/': {'origins': '*'}}, expose_headers=['X-Total-Count'])
 
     # Set up the database and create tables
     setup_db(app)
     create_tables()
 
+    # Commit once per request
+    register_unit_of_work(app)
+
     # Register the routes
     register_routes(app)
     
     # Register custom error handlers
     register_error_handlers(app)
+
+    # Install the request profiler (no-op unless enabled)
+    register_profiler(app)
+
+    # Log slow statements with their query plans
+    register_slow_query_log(app)
+
+    # Serve movie and actor reads from the shared snapshot (no-op unless enabled)
+    register_snapshot(app)
+
+    # Apply writes queued with ?async=true in background workers
+    register_jobs(app)
     
     return app
 
@@ -4,7 +4,7 @@ import urllib.request
 from functools import wraps
 from flask import request, jsonify, _request_ctx_stack
 from jose import jwt
-from settings import AUTH0_DOMAIN, ALGORITHMS, API_IDENTIFIER
+from settings import AUTH0_DOMAIN, ALGORITHMS, API_IDENTIFIER, AUTH0_JWKS_URL
 
 
 class AuthError(Exception):
@@ -14,7 +14,7 @@ class AuthError(Exception):
 
 def verify_decode_jwt(token):
     try:
-        jsonurl = urllib.request.urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
+        jsonurl = urllib.request.urlopen(AUTH0_JWKS_URL)
         jwks = json.loads(jsonurl.read())
         unverified_header = jwt.get_unverified_header(token)
         rsa_key = {}
@@ -56,36 +56,39 @@ def verify_decode_jwt(token):
             'description': 'Unable to parse authentication token.'
         }, 400)
 
+def get_token_auth_header():
+    auth = request.headers.get('Authorization', None)
+    if not auth:
+        raise AuthError({
+            'code': 'authorization_header_missing',
+            'description': 'Authorization header is expected.'
+        }, 401)
+    parts = auth.split()
+    if parts[0].lower() != 'bearer':
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Authorization header must start with Bearer.'
+        }, 401)
+    elif len(parts) == 1:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Token not found.'
+        }, 401)
+    elif len(parts) > 2:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Authorization header must be Bearer token.'
+        }, 401)
+    return parts[1]
+
 def requires_auth(permission=''):
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
-            auth = request.headers.get('Authorization', None)
-            if not auth:
-                raise AuthError({
-                    'code': 'authorization_header_missing',
-                    'description': 'Authorization header is expected.'
-                }, 401)
-            parts = auth.split()
-            if parts[0].lower() != 'bearer':
-                raise AuthError({
-                    'code': 'invalid_header',
-                    'description': 'Authorization header must start with Bearer.'
-                }, 401)
-            elif len(parts) == 1:
-                raise AuthError({
-                    'code': 'invalid_header',
-                    'description': 'Token not found.'
-                }, 401)
-            elif len(parts) > 2:
-                raise AuthError({
-                    'code': 'invalid_header',
-                    'description': 'Authorization header must be Bearer token.'
-                }, 401)
-
-            token = parts[1]
+            token = get_token_auth_header()
             payload = verify_decode_jwt(token)
-            if permission not in payload.get('permissions', []):
+            # Without a permission any valid token is accepted; the view checks permissions itself
+            if permission and permission not in payload.get('permissions', []):
                 raise AuthError({
                     'code': 'unauthorized',
                     'description': 'Permission not found.'
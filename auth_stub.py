@@ -0,0 +1,137 @@
+"""
+Local Auth0 Stand-in for Benchmarks and Tests
+
+This module replaces Auth0 when the API is exercised locally. It generates an RSA signing key, serves the
+matching JWKS document over HTTP on localhost and signs RS256 access tokens carrying the requested
+permissions, with the issuer and audience `auth.verify_decode_jwt` expects.
+
+Point the application at the stub by exporting `AUTH0_JWKS_URL` with the URL returned by `start()`, and
+`AUTH0_DOMAIN`/`API_IDENTIFIER` with the values the stub was created with.
+
+Classes:
+    AuthStub: Signing key, token factory and JWKS HTTP server.
+"""
+import base64
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import rsa
+from jose import jwt
+
+
+def _b64url_uint(value):
+    """
+    Encodes an unsigned integer as unpadded base64url, as used by the `n` and `e` members of a JWK.
+    """
+    length = (value.bit_length() + 7) // 8
+    return base64.urlsafe_b64encode(value.to_bytes(length, 'big')).rstrip(b'=').decode('ascii')
+
+
+class _JWKSServer(ThreadingHTTPServer):
+    request_queue_size = 128
+
+
+class AuthStub:
+    """
+    A local identity provider issuing tokens the application accepts.
+
+    Args:
+        domain (str): Value of `AUTH0_DOMAIN`; the issuer claim is `https://{domain}/`.
+        audience (str): Value of `API_IDENTIFIER`; used as the audience claim.
+        kid (str, optional): Key id advertised in the JWKS and token header.
+        key_size (int, optional): RSA modulus size in bits. Defaults to 1024 to keep key generation fast.
+    """
+
+    def __init__(self, domain, audience, kid='local-stub-key', key_size=1024):
+        self.domain = domain
+        self.audience = audience
+        self.kid = kid
+
+        public_key, private_key = rsa.newkeys(key_size)
+        self.private_pem = private_key.save_pkcs1().decode('ascii')
+        self.jwks = {
+            'keys': [{
+                'kty': 'RSA',
+                'kid': kid,
+                'use': 'sig',
+                'alg': 'RS256',
+                'n': _b64url_uint(public_key.n),
+                'e': _b64url_uint(public_key.e)
+            }]
+        }
+        self.server = None
+
+    def token(self, permissions, expires_in=3600, **claims):
+        """
+        Signs an access token.
+
+        Args:
+            permissions (list): Permissions to put in the `permissions` claim.
+            expires_in (int, optional): Lifetime in seconds. Negative values produce an expired token.
+            **claims: Extra claims, overriding the defaults.
+
+        Returns:
+            str: The encoded JWT.
+        """
+        now = int(time.time())
+        payload = {
+            'iss': f'https://{self.domain}/',
+            'sub': 'auth-stub|user',
+            'aud': self.audience,
+            'iat': now,
+            'exp': now + expires_in,
+            'permissions': list(permissions)
+        }
+        payload.update(claims)
+        return jwt.encode(payload, self.private_pem, algorithm='RS256', headers={'kid': self.kid})
+
+    def start(self, host='127.0.0.1', port=0):
+        """
+        Serves the JWKS document from a background thread.
+
+        Args:
+            host (str, optional): Interface to bind. Defaults to localhost.
+            port (int, optional): Port to bind. Defaults to 0 (any free port).
+
+        Returns:
+            str: The URL of the JWKS document.
+        """
+        body = json.dumps(self.jwks).encode('utf-8')
+
+        class JWKSHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        # Every request fetches the JWKS, so bursts of concurrent requests need more than the default backlog of 5
+        self.server = _JWKSServer((host, port), JWKSHandler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.jwks_url
+
+    @property
+    def jwks_url(self):
+        """
+        str: The URL of the JWKS document, or None if the server is not running.
+        """
+        if self.server is None:
+            return None
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/.well-known/jwks.json'
+
+    def stop(self):
+        """
+        Stops the JWKS server.
+        """
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
@@ -0,0 +1,126 @@
+"""
+Batch Reads for a Flask Application
+
+This module executes the read operations of a `POST /batch` request. A page that needs a movie, its cast and a
+few individual actors sends them as one list instead of one HTTP request each, so the token is verified once.
+Lookups of the same kind are grouped: all movie IDs are fetched with one `IN` query, all actor IDs with
+another and the casts of all requested movies with a third, whatever the number of operations.
+
+Operations and the permission each requires:
+    {"op": "get_movie", "id": 1}                 view:movies
+    {"op": "get_actor", "id": 4}                 view:actors
+    {"op": "list_movie_actors", "movie_id": 1}   view:actors
+
+Every operation gets a result at its position in the request, shaped like the response of the matching
+single-resource route, or an error entry (`400` for an ID outside 1 to 2**63 - 1, `403` without the permission,
+`404` for an unknown ID). When the shared snapshot is enabled (see `snapshot.py`), the lookups read it instead of
+the database.
+
+Functions:
+    parse_operations(body, limit): Validates a batch request body.
+    run_batch(operations, permissions, snapshot=None): Executes validated operations, returning results in order.
+"""
+from models import Movie, Actor
+
+# Operation name: (argument holding the ID, required permission)
+OPERATIONS = {
+    'get_movie': ('id', 'view:movies'),
+    'get_actor': ('id', 'view:actors'),
+    'list_movie_actors': ('movie_id', 'view:actors')
+}
+# IDs outside this range cannot exist and would overflow the database's integer parameters
+MAX_ID = 2 ** 63 - 1
+
+
+def parse_operations(body, limit):
+    """
+    Validates a batch request body.
+
+    Args:
+        body (dict): The decoded JSON body, `{"operations": [...]}`.
+        limit (int): Maximum number of operations.
+
+    Returns:
+        list: `(operation, id)` tuples in request order.
+
+    Raises:
+        ValueError: If the body is malformed, empty, over the limit or names an unknown operation.
+    """
+    if not isinstance(body, dict) or not isinstance(body.get('operations'), list):
+        raise ValueError('Expected an object with an operations list.')
+    operations = body['operations']
+    if not operations or len(operations) > limit:
+        raise ValueError(f'Expected between 1 and {limit} operations.')
+
+    parsed = []
+    for operation in operations:
+        if not isinstance(operation, dict) or operation.get('op') not in OPERATIONS:
+            raise ValueError(f'Unknown operation: {operation!r}.')
+        argument, permission = OPERATIONS[operation['op']]
+        record_id = operation.get(argument)
+        if not isinstance(record_id, int) or isinstance(record_id, bool):
+            raise ValueError(f'Operation {operation["op"]} requires an integer {argument}.')
+        parsed.append((operation['op'], record_id))
+    return parsed
+
+
+def _error(status, message):
+    return {
+        'success': False,
+        'error': status,
+        'message': message
+    }
+
+
+def run_batch(operations, permissions, snapshot=None):
+    """
+    Executes validated operations with at most one query per kind of lookup.
+
+    Args:
+        operations (list): `(operation, id)` tuples returned by `parse_operations`.
+        permissions (list): Permissions of the caller's token.
+        snapshot (Snapshot, optional): Snapshot to read from instead of the database.
+
+    Returns:
+        list: One result dictionary per operation, in request order.
+    """
+    allowed = [
+        (operation, record_id) for operation, record_id in operations
+        if OPERATIONS[operation][1] in permissions and 1 <= record_id <= MAX_ID
+    ]
+    movie_ids = [record_id for operation, record_id in allowed if operation in ('get_movie', 'list_movie_actors')]
+    actor_ids = [record_id for operation, record_id in allowed if operation == 'get_actor']
+    cast_ids = [record_id for operation, record_id in allowed if operation == 'list_movie_actors']
+
+    if snapshot is not None:
+        movies = snapshot.table('movies').get_many(movie_ids)
+        actors = snapshot.table('actors').get_many(actor_ids)
+        casts = snapshot.table('actors').group('movie_id', cast_ids)
+    else:
+        movies = {movie.id: movie.format() for movie in Movie.get_many(movie_ids)}
+        actors = {actor.id: actor.format() for actor in Actor.get_many(actor_ids)}
+        casts = {
+            movie_id: [actor.format() for actor in cast]
+            for movie_id, cast in Actor.get_actors_by_movie_ids(cast_ids).items()
+        }
+
+    results = []
+    for operation, record_id in operations:
+        if not 1 <= record_id <= MAX_ID:
+            results.append(_error(400, 'Bad request'))
+        elif OPERATIONS[operation][1] not in permissions:
+            results.append(_error(403, 'Forbidden'))
+        elif operation == 'get_movie':
+            movie = movies.get(record_id)
+            results.append({'success': True, 'movie': movie} if movie else _error(404, 'Resource not found'))
+        elif operation == 'get_actor':
+            actor = actors.get(record_id)
+            results.append({'success': True, 'actor': actor} if actor else _error(404, 'Resource not found'))
+        elif record_id in movies:
+            results.append({
+                'success': True,
+                'actors': casts.get(record_id, [])
+            })
+        else:
+            results.append(_error(404, 'Resource not found'))
+    return results
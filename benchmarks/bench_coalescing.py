@@ -0,0 +1,115 @@
+"""
+Request-Coalescing Stress Test
+
+Fires bursts of identical concurrent `GET /actors` requests, released together by a barrier, once with
+`REQUEST_COALESCING` off and once with it on. It counts the statements that reach the database during each
+burst and reports them next to the wall time of the burst. With coalescing on, the whole burst shares one
+list query and one count query; without it, every request runs its own.
+
+Tokens are signed by a local `AuthStub`, so every request still runs the full `requires_auth` path.
+
+Usage:
+    python benchmarks/bench_coalescing.py [--burst 100] [--rows 20000] [--rounds 3]
+
+The database is taken from `DATABASE_URL`; without it a temporary SQLite file is used. Rows created by the
+benchmark are deleted afterwards.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from auth_stub import AuthStub
+
+DOMAIN = 'auth-stub.local'
+AUDIENCE = 'casting-benchmark'
+
+auth_stub = AuthStub(DOMAIN, AUDIENCE)
+os.environ.update({
+    'AUTH0_DOMAIN': DOMAIN,
+    'API_IDENTIFIER': AUDIENCE,
+    'ALGORITHMS': 'RS256',
+    'AUTH0_JWKS_URL': auth_stub.start(),
+    'SLOW_QUERY_THRESHOLD_MS': '0'
+})
+if not os.getenv('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench-coalescing-'), 'bench.db')}"
+
+from sqlalchemy import event, func
+from app import app
+from models import db, Movie, Actor
+from seed_data import seed
+
+
+def burst(client_factory, token, size):
+    """
+    Sends `size` identical requests at once and returns the number of database statements and the wall time.
+    """
+    statements = []
+    barrier = threading.Barrier(size)
+    statuses = []
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append(statement)
+
+    def send():
+        client = client_factory()
+        barrier.wait()
+        statuses.append(client.get('/actors', headers={'Authorization': f'Bearer {token}'}).status_code)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', count_statement)
+    threads = [threading.Thread(target=send) for _ in range(size)]
+    started = time.perf_counter()
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        event.remove(engine, 'before_cursor_execute', count_statement)
+    elapsed = time.perf_counter() - started
+
+    if statuses.count(200) != size:
+        raise RuntimeError(f'unexpected responses: {sorted(set(statuses))}')
+    return len(statements), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--burst', type=int, default=100, help='concurrent identical requests per burst')
+    parser.add_argument('--rows', type=int, default=20000, help='actors returned by each request')
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    token = auth_stub.token(['view:actors'])
+    with app.app_context():
+        last_movie_id = db.session.query(func.max(Movie.id)).scalar() or 0
+        last_actor_id = db.session.query(func.max(Actor.id)).scalar() or 0
+        seed(movies=max(args.rows // 8, 1), actors=args.rows, report=lambda message: None)
+
+    print(f"{'coalescing':<14}{'round':>6}{'requests':>10}{'queries':>10}{'seconds':>10}")
+    try:
+        for enabled in (False, True):
+            app.config['REQUEST_COALESCING'] = enabled
+            for round_number in range(1, args.rounds + 1):
+                queries, elapsed = burst(app.test_client, token, args.burst)
+                label = 'on' if enabled else 'off'
+                print(f'{label:<14}{round_number:>6}{args.burst:>10}{queries:>10}{elapsed:>10.2f}')
+    finally:
+        with app.app_context():
+            db.session.query(Actor).filter(Actor.id > last_actor_id).delete()
+            db.session.query(Movie).filter(Movie.id > last_movie_id).delete()
+            db.session.commit()
+        auth_stub.stop()
+
+
+if __name__ == '__main__':
+    main()
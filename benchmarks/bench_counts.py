@@ -0,0 +1,80 @@
+"""
+Total-Count Strategy Benchmark
+
+Compares the counting strategies behind `X-Total-Count` on the `actors` table:
+    - `exact`: `SELECT COUNT(*)` on every call,
+    - `cached`: served from the result cache while the table is unchanged,
+    - `cached` when every call follows a write (the cache is invalidated each time),
+    - `estimate`: `pg_class.reltuples` on PostgreSQL; an exact count elsewhere.
+
+With `STATS_SUMMARY_TABLE=true` both `cached` runs read the row counter of `stats_summary` instead, which writes
+keep up to date rather than invalidate.
+
+For each strategy it prints the calls/sec, the mean latency and the returned count next to the exact one.
+
+Usage:
+    python benchmarks/bench_counts.py [--rows 200000] [--calls 200]
+
+The database is taken from `DATABASE_URL`; without it a temporary SQLite file is used, where `estimate`
+falls back to an exact count. Rows created by the benchmark are deleted afterwards.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+if not os.getenv('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench-counts-'), 'bench.db')}"
+
+from sqlalchemy import func
+from app import create_app
+from cache import bump_table_version
+from models import db, Movie, Actor
+from seed_data import seed
+
+
+def measure(label, calls, fn):
+    started = time.perf_counter()
+    for _ in range(calls):
+        value = fn()
+    elapsed = time.perf_counter() - started
+    print(f'{label:<32}{calls / elapsed:>12.0f}{elapsed / calls * 1000:>12.3f}{value:>14}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000, help='actors to create')
+    parser.add_argument('--calls', type=int, default=200, help='counts per strategy')
+    args = parser.parse_args()
+
+    create_app({'SLOW_QUERY_THRESHOLD_MS': 0})
+    last_movie_id = db.session.query(func.max(Movie.id)).scalar() or 0
+    last_actor_id = db.session.query(func.max(Actor.id)).scalar() or 0
+    seed(movies=max(args.rows // 8, 1), actors=args.rows, report=lambda message: None)
+
+    if db.engine.dialect.name == 'postgresql':
+        with db.engine.connect() as conn:
+            conn.exec_driver_sql('ANALYZE actors')
+
+    def invalidated():
+        bump_table_version('actors')
+        return Actor.count('cached')
+
+    print(f"{'strategy':<32}{'calls/s':>12}{'ms/call':>12}{'count':>14}")
+    try:
+        measure('exact', args.calls, lambda: Actor.count('exact'))
+        measure('cached', args.calls, lambda: Actor.count('cached'))
+        measure('cached, written between calls', args.calls, invalidated)
+        measure('estimate', args.calls, lambda: Actor.count('estimate'))
+    finally:
+        db.session.rollback()
+        db.session.query(Actor).filter(Actor.id > last_actor_id).delete()
+        db.session.query(Movie).filter(Movie.id > last_movie_id).delete()
+        db.session.commit()
+
+
+if __name__ == '__main__':
+    main()
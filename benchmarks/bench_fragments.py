@@ -0,0 +1,97 @@
+"""
+JSON Fragment Cache Benchmark
+
+Times the assembly of the `GET /actors` response body for:
+    - `jsonify` of every row (the previous path),
+    - `list_response` with an empty fragment cache,
+    - `list_response` with every row cached,
+    - `list_response` after updating a share of the rows, which are encoded again.
+
+The query is the same in every case; it is timed on its own first, so the rest of each timing is the
+encoding cost.
+
+Usage:
+    python benchmarks/bench_fragments.py [--rows 100000] [--changed 0.01] [--repeat 5]
+
+The database is taken from `DATABASE_URL`; without it a temporary SQLite file is used. Rows created by the
+benchmark are deleted afterwards.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+if not os.getenv('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench-fragments-'), 'bench.db')}"
+# The cache is off by default; give it room for every row
+os.environ.setdefault('FRAGMENT_CACHE_SIZE', '10000000')
+
+from flask import jsonify
+from sqlalchemy import func
+from app import create_app
+from cache import clear_cache
+from fragments import list_response
+from models import db, unit_of_work, Movie, Actor
+from seed_data import seed
+
+
+def measure(label, repeat, fn, before=None):
+    timings = []
+    for _ in range(repeat):
+        if before:
+            before()
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    print(f'{label:<40}{min(timings) * 1000:>12.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000, help='actors to create')
+    parser.add_argument('--changed', type=float, default=0.01, help='share of rows updated between requests')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = create_app({'SLOW_QUERY_THRESHOLD_MS': 0})
+    last_movie_id = db.session.query(func.max(Movie.id)).scalar() or 0
+    last_actor_id = db.session.query(func.max(Actor.id)).scalar() or 0
+    seed(movies=max(args.rows // 8, 1), actors=args.rows, report=lambda message: None)
+    ids = [actor_id for actor_id, in db.session.query(Actor.id).filter(Actor.id > last_actor_id)]
+    rng = random.Random(0)
+    fields = Actor.FIELDS
+
+    def update_rows():
+        with unit_of_work():
+            for actor in Actor.get_many(rng.sample(ids, max(int(len(ids) * args.changed), 1))):
+                actor.age = (actor.age or 0) + 1
+                actor.update()
+        db.session.expunge_all()
+
+    print(f"{'response body':<40}{'ms (best)':>12}")
+    try:
+        with app.test_request_context():
+            measure('query only', args.repeat,
+                    lambda: db.session.query(Actor.id, Actor.version, *(getattr(Actor, f) for f in fields)).all())
+            measure('jsonify', args.repeat, lambda: jsonify({'success': True, 'actors': [
+                dict(zip(fields, row)) for row in db.session.query(*(getattr(Actor, f) for f in fields))
+            ]}).get_data())
+            measure('fragments, cold cache', args.repeat,
+                    lambda: list_response(Actor, 'actors', fields).get_data(), before=clear_cache)
+            list_response(Actor, 'actors', fields)
+            measure('fragments, warm cache', args.repeat, lambda: list_response(Actor, 'actors', fields).get_data())
+            measure(f'fragments, {args.changed:.0%} of rows changed', args.repeat,
+                    lambda: list_response(Actor, 'actors', fields).get_data(), before=update_rows)
+    finally:
+        db.session.rollback()
+        db.session.query(Actor).filter(Actor.id > last_actor_id).delete()
+        db.session.query(Movie).filter(Movie.id > last_movie_id).delete()
+        db.session.commit()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Bulk Job Benchmark
+
+Uploads a casting sheet of `--rows` actors and compares:
+    - one transaction per actor, what as many synchronous `POST /actors/new` requests commit,
+    - jobs queued with `enqueue` (what `POST /actors/new?async=true` does) and applied by `JobWorkers`
+      with each of the `--batch-sizes`.
+
+For the jobs it prints the time the request spends queueing the sheet, which is all a client waits for, and
+the rows/sec the job reports. Jobs are applied in this thread, one after the other.
+
+Usage:
+    python benchmarks/bench_jobs.py [--rows 10000] [--sync-rows 1000] [--batch-sizes 10 100 500 2000]
+
+The database is taken from `DATABASE_URL`; without it a temporary SQLite file is used. Rows created by the
+benchmark are deleted afterwards.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+if not os.getenv('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench-jobs-'), 'bench.db')}"
+# Jobs are applied explicitly below
+os.environ['JOB_WORKERS'] = '0'
+
+from sqlalchemy import func
+from app import create_app
+from jobs import JobWorkers, enqueue
+from models import db, unit_of_work, Movie, Actor, Job
+from seed_data import seed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000, help='actors per job')
+    parser.add_argument('--sync-rows', dest='sync_rows', type=int, default=1000,
+                        help='actors written one transaction each')
+    parser.add_argument('--batch-sizes', dest='batch_sizes', type=int, nargs='+', default=[10, 100, 500, 2000])
+    parser.add_argument('--movies', type=int, default=1000)
+    args = parser.parse_args()
+
+    app = create_app({'SLOW_QUERY_THRESHOLD_MS': 0})
+    last_movie_id = db.session.query(func.max(Movie.id)).scalar() or 0
+    last_actor_id = db.session.query(func.max(Actor.id)).scalar() or 0
+    last_job_id = db.session.query(func.max(Job.id)).scalar() or 0
+    seed(movies=args.movies, actors=0, report=lambda message: None)
+    movie_ids = [movie_id for movie_id, in db.session.query(Movie.id).filter(Movie.id > last_movie_id)]
+    rng = random.Random(0)
+    sheet = [
+        {'name': f'Bench Actor {i}', 'age': rng.randint(18, 80), 'gender': rng.choice(('female', 'male')),
+         'movie_id': rng.choice(movie_ids)}
+        for i in range(args.rows)
+    ]
+
+    print(f"{'write path':<32}{'queue ms':>12}{'rows/s':>12}")
+    try:
+        started = time.perf_counter()
+        for item in sheet[:args.sync_rows]:
+            with unit_of_work():
+                Actor(**item).insert()
+        print(f"{'transaction per row':<32}{'-':>12}{args.sync_rows / (time.perf_counter() - started):>12.1f}")
+
+        for batch_size in args.batch_sizes:
+            with app.test_request_context():
+                started = time.perf_counter()
+                job_id = enqueue('create_actors', sheet).id
+                queued = time.perf_counter() - started
+            JobWorkers(app, 0, batch_size, 3, 1, 300).run_next()
+            db.session.expunge_all()
+            job = Job.get_by_id(job_id).format()
+            assert job['status'] == 'succeeded' and not job['failed'], job
+            print(f"{f'job, batches of {batch_size}':<32}{queued * 1000:>12.1f}{job['rows_per_second']:>12.1f}")
+    finally:
+        db.session.rollback()
+        db.session.query(Job).filter(Job.id > last_job_id).delete()
+        db.session.query(Actor).filter(Actor.id > last_actor_id).delete()
+        db.session.query(Movie).filter(Movie.id > last_movie_id).delete()
+        db.session.commit()
+
+
+if __name__ == '__main__':
+    main()
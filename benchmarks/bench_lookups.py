@@ -0,0 +1,103 @@
+"""
+Primary-Key Lookup Benchmark
+
+Compares lookups/sec of:
+    - the legacy `db.session.query(cls).get(id)` with an empty identity map,
+    - `Actor.get_by_id` (cached lambda statement) with an empty identity map,
+    - `Actor.get_by_id` served from the per-request identity map,
+    - one `Actor.get_by_id` per id against a single batched `Actor.get_many(ids)`.
+
+Usage:
+    python benchmarks/bench_lookups.py [--rows 1000] [--lookups 5000] [--batch 25]
+
+The database is taken from `DATABASE_URL`; without it a temporary SQLite file is used. Rows created by the
+benchmark are deleted afterwards.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+if not os.getenv('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench-lookups-'), 'bench.db')}"
+
+from app import create_app
+from models import db, unit_of_work, Movie, Actor
+
+
+def measure(label, lookups, fn):
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    print(f'{label:<40}{lookups / elapsed:>14.0f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--lookups', type=int, default=5000)
+    parser.add_argument('--batch', type=int, default=25, help='ids per get_many call')
+    args = parser.parse_args()
+
+    create_app({'SLOW_QUERY_THRESHOLD_MS': 0})
+    with unit_of_work():
+        movie = Movie(title='Lookup Benchmark', release_year=2000)
+        movie.insert()
+        movie_id = movie.id
+        db.session.bulk_insert_mappings(Actor, [
+            {'name': f'Bench Actor {i}', 'age': 30, 'gender': 'male', 'movie_id': movie_id}
+            for i in range(args.rows)
+        ])
+    ids = [actor_id for actor_id, in db.session.query(Actor.id).filter(Actor.movie_id == movie_id)]
+    rng = random.Random(0)
+    sample = [rng.choice(ids) for _ in range(args.lookups)]
+    batches = [sample[i:i + args.batch] for i in range(0, len(sample), args.batch)]
+
+    def legacy_cold():
+        for actor_id in sample:
+            db.session.query(Actor).get(actor_id)
+            db.session.expunge_all()
+
+    def cached_cold():
+        for actor_id in sample:
+            Actor.get_by_id(actor_id)
+            db.session.expunge_all()
+
+    def identity_warm():
+        # The identity map holds instances weakly; a request keeps the rows it loaded alive
+        loaded = []
+        for actor_id in sample:
+            loaded.append(Actor.get_by_id(actor_id))
+
+    def one_by_one():
+        for batch in batches:
+            for actor_id in batch:
+                Actor.get_by_id(actor_id)
+            db.session.expunge_all()
+
+    def batched():
+        for batch in batches:
+            Actor.get_many(batch)
+            db.session.expunge_all()
+
+    print(f"{'lookup path':<40}{'lookups/s':>14}")
+    try:
+        db.session.expunge_all()
+        measure('legacy query.get (cold)', args.lookups, legacy_cold)
+        measure('get_by_id cached statement (cold)', args.lookups, cached_cold)
+        measure('get_by_id identity map (warm)', args.lookups, identity_warm)
+        db.session.expunge_all()
+        measure(f'get_by_id x {args.batch} (cold)', args.lookups, one_by_one)
+        measure(f'get_many({args.batch}) (cold)', args.lookups, batched)
+    finally:
+        db.session.query(Actor).filter(Actor.movie_id == movie_id).delete()
+        db.session.query(Movie).filter(Movie.id == movie_id).delete()
+        db.session.commit()
+
+
+if __name__ == '__main__':
+    main()
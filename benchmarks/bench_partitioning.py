@@ -0,0 +1,159 @@
+"""
+Actors Partitioning Benchmark
+
+Builds two copies of an actors table with the same rows, server-side with `generate_series`:
+    - `bench_actors_plain`, one table with a primary key on `id` and an index on `movie_id`,
+    - `bench_actors_partitioned`, partitioned by `movie_id` as migration 0004 does (`--method hash` or `range`),
+
+and compares:
+    - the cast of one movie (`movie_id = ...`, what `Actor.get_actors_by_movie_id` runs),
+    - the casts of several movies (`movie_id IN (...)`, what `Actor.get_actors_by_movie_ids` runs),
+    - deleting the cast of one movie (what the `ON DELETE` rule runs when a movie is deleted; rolled back),
+    - `VACUUM` after updating the actors of the newest `--churn` share of movies, where new activity goes.
+
+Lookup latencies are percentiles over `--lookups` random movies. For the partitioned table, vacuum is timed
+over the partitions with updated rows, which is what autovacuum processes: it vacuums partitions one by one
+and skips the unchanged ones. With `--method hash` the changes spread over every partition.
+
+Usage:
+    python benchmarks/bench_partitioning.py [--rows 100000000] [--movies 12500000] [--method range]
+        [--partitions 16] [--range-size 100000] [--lookups 2000] [--churn 0.05] [--keep]
+
+Needs a PostgreSQL `DATABASE_URL`. Loading 100M rows twice takes a while and about 30 GB of disk; try
+`--rows 1000000` first. The tables have no foreign key, so `movies` is left alone; both are dropped afterwards
+unless `--keep` is given.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import create_engine, text
+from partitioning import partition_clause, create_partitions
+
+PLAIN = 'bench_actors_plain'
+PARTITIONED = 'bench_actors_partitioned'
+COLUMNS = 'id, name, age, gender, movie_id, version'
+
+
+def percentiles(timings):
+    timings = sorted(timings)
+    return [timings[min(int(len(timings) * share), len(timings) - 1)] * 1000 for share in (0.5, 0.95, 0.99)]
+
+
+def build(connection, args):
+    # Actors of a movie are written together, so IDs and movie IDs grow together like in the real table
+    connection.exec_driver_sql(f'CREATE TABLE {PLAIN} (LIKE actors INCLUDING CONSTRAINTS)')
+    connection.execute(text(
+        f'INSERT INTO {PLAIN} ({COLUMNS}) SELECT g, \'Actor \' || g, 18 + g % 60, '
+        f'(ARRAY[\'female\', \'male\', \'non-binary\'])[1 + g % 3], 1 + ((g - 1) * CAST(:movies AS bigint) / :rows), 1 '
+        f'FROM generate_series(1, :rows) g'
+    ), {'rows': args.rows, 'movies': args.movies})
+    connection.exec_driver_sql(f'ALTER TABLE {PLAIN} ADD PRIMARY KEY (id)')
+    connection.exec_driver_sql(f'CREATE INDEX ON {PLAIN} (movie_id)')
+
+    connection.exec_driver_sql(f'CREATE TABLE {PARTITIONED} (LIKE {PLAIN}) {partition_clause(args.method)}')
+    create_partitions(connection, PARTITIONED, args.method, args.partitions, args.range_size, args.movies)
+    connection.exec_driver_sql(f'INSERT INTO {PARTITIONED} SELECT * FROM {PLAIN}')
+    connection.exec_driver_sql(f'ALTER TABLE {PARTITIONED} ADD PRIMARY KEY (id, movie_id)')
+    connection.exec_driver_sql(f'CREATE INDEX ON {PARTITIONED} (movie_id)')
+
+
+def vacuum(autocommit, tables):
+    started = time.perf_counter()
+    for table in tables:
+        autocommit.exec_driver_sql(f'VACUUM {table}')
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000000)
+    parser.add_argument('--movies', type=int, default=12500000)
+    parser.add_argument('--method', choices=('hash', 'range'), default='range')
+    parser.add_argument('--partitions', type=int, default=16, help='hash partitions')
+    parser.add_argument('--range-size', dest='range_size', type=int, default=100000, help='movie IDs per range')
+    parser.add_argument('--lookups', type=int, default=2000)
+    parser.add_argument('--cast-movies', dest='cast_movies', type=int, default=20, help='movies per IN lookup')
+    parser.add_argument('--churn', type=float, default=0.05, help='share of the newest movies whose actors change')
+    parser.add_argument('--keep', action='store_true', help='keep the tables afterwards')
+    args = parser.parse_args()
+
+    url = os.getenv('DATABASE_URL', '')
+    if not url.startswith('postgres'):
+        sys.exit('Partitioning needs PostgreSQL; set DATABASE_URL.')
+    engine = create_engine(url.replace('postgres://', 'postgresql://', 1))
+    autocommit = engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+
+    try:
+        started = time.perf_counter()
+        with engine.begin() as connection:
+            build(connection, args)
+        for table in (PLAIN, PARTITIONED):
+            autocommit.exec_driver_sql(f'VACUUM ANALYZE {table}')
+        print(f'Built {args.rows} rows over {args.movies} movies twice in {time.perf_counter() - started:.1f}s')
+
+        rng = random.Random(0)
+        movie_ids = [rng.randint(1, args.movies) for _ in range(args.lookups)]
+        casts = [rng.sample(range(1, args.movies + 1), args.cast_movies) for _ in range(max(args.lookups // 10, 1))]
+
+        def lookups(table, statement, values):
+            timings = []
+            with engine.connect() as connection:
+                for value in values:
+                    began = time.perf_counter()
+                    connection.execute(text(statement.format(table=table)), value).fetchall()
+                    timings.append(time.perf_counter() - began)
+            return percentiles(timings)
+
+        def deletes(table):
+            timings = []
+            with engine.connect() as connection:
+                for movie_id in movie_ids[:max(args.lookups // 10, 1)]:
+                    transaction = connection.begin()
+                    began = time.perf_counter()
+                    connection.execute(text(f'DELETE FROM {table} WHERE movie_id = :movie_id'), {'movie_id': movie_id})
+                    timings.append(time.perf_counter() - began)
+                    transaction.rollback()
+            return percentiles(timings)
+
+        print(f"\n{'query':<44}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for label, table in (('plain', PLAIN), (f'{args.method} partitioned', PARTITIONED)):
+            for name, timings in (
+                ('cast of a movie', lookups(table, f'SELECT {COLUMNS} FROM {{table}} WHERE movie_id = :movie_id',
+                                            [{'movie_id': movie_id} for movie_id in movie_ids])),
+                (f'casts of {args.cast_movies} movies', lookups(
+                    table, f'SELECT {COLUMNS} FROM {{table}} WHERE movie_id IN :movie_ids',
+                    [{'movie_ids': tuple(cast)} for cast in casts])),
+                ('delete cast of a movie', deletes(table))
+            ):
+                print(f'{f"{name}, {label}":<44}' + ''.join(f'{ms:>10.2f}' for ms in timings))
+
+        cutoff = int(args.movies * (1 - args.churn))
+        with engine.begin() as connection:
+            for table in (PLAIN, PARTITIONED):
+                connection.execute(text(f'UPDATE {table} SET age = age + 1 WHERE movie_id > :cutoff'),
+                                   {'cutoff': cutoff})
+            changed = [name for name, in connection.execute(text(
+                f'SELECT DISTINCT tableoid::regclass::text FROM {PARTITIONED} WHERE movie_id > :cutoff'
+            ), {'cutoff': cutoff})]
+            partitions = [name for name, in connection.execute(text(
+                'SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = CAST(:table AS regclass)'
+            ), {'table': PARTITIONED})]
+
+        print(f"\n{f'VACUUM after updating the newest {args.churn:.0%} of movies':<44}{'seconds':>10}")
+        print(f"{'plain table':<44}{vacuum(autocommit, [PLAIN]):>10.2f}")
+        print(f"{f'{len(changed)} changed of {len(partitions)} partitions':<44}{vacuum(autocommit, changed):>10.2f}")
+    finally:
+        if not args.keep:
+            for table in (PLAIN, PARTITIONED):
+                autocommit.exec_driver_sql(f'DROP TABLE IF EXISTS {table}')
+        autocommit.close()
+
+
+if __name__ == '__main__':
+    main()
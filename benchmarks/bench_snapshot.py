@@ -0,0 +1,167 @@
+"""
+Shared Snapshot Benchmark
+
+Compares reads served by the database with reads served by the memory-mapped snapshot (`snapshot.py`):
+    - the `GET /actors` response, built with `jsonify`, from cached fragments (`fragments.py`) and from the
+      JSON stored in the snapshot,
+    - primary-key lookups of single actors,
+    - the casts of a group of movies.
+
+First it forks 1, 2, 4 and 8 processes that map the snapshot and read every row. For each count it prints the
+resident and proportional set size of the mapping summed over all of them. Proportional set size (PSS) splits
+shared pages among their users, so its total stays at the file size however many workers map it.
+
+Usage:
+    python benchmarks/bench_snapshot.py [--rows 200000] [--lookups 5000] [--workers 1 2 4 8]
+
+The database is taken from `DATABASE_URL`; without it a temporary SQLite file is used. Rows created by the
+benchmark are deleted afterwards. The memory figures need Linux (`/proc/<pid>/smaps`).
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+if not os.getenv('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench-snapshot-'), 'bench.db')}"
+# The fragment cache is off by default; give it room for every row
+os.environ.setdefault('FRAGMENT_CACHE_SIZE', '10000000')
+
+from flask import jsonify
+from sqlalchemy import func
+from app import create_app
+from fragments import list_response, encoded_list_response
+from models import db, Movie, Actor
+from seed_data import seed
+from snapshot import build_snapshot, Snapshot
+
+
+def measure(label, operations, fn):
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    print(f'{label:<40}{operations / elapsed:>14.1f}{elapsed / operations * 1000:>12.3f}')
+
+
+def mapping_memory(path):
+    """
+    Returns the Rss and Pss in kB of this process's mappings of `path`.
+    """
+    rss = pss = 0
+    inside = False
+    with open('/proc/self/smaps') as f:
+        for line in f:
+            fields = line.split()
+            if '-' in fields[0] and len(fields) >= 5:
+                inside = fields[-1] == path
+            elif inside and fields[0] == 'Rss:':
+                rss += int(fields[1])
+            elif inside and fields[0] == 'Pss:':
+                pss += int(fields[1])
+    return rss, pss
+
+
+def worker(path, mapped, measured, results):
+    snapshot = Snapshot(path)
+    for table in snapshot.tables.values():
+        table.rows()
+    # Measure only once every worker has the file mapped, so shared pages are split between all of them
+    mapped.wait()
+    results.put(mapping_memory(path))
+    measured.wait()
+
+
+def memory_by_workers(path, counts):
+    context = multiprocessing.get_context('fork')
+    print(f"\n{'workers':<10}{'total Rss kB':>16}{'total Pss kB':>16}")
+    for count in counts:
+        mapped, measured = context.Barrier(count), context.Barrier(count + 1)
+        results = context.Queue()
+        processes = [context.Process(target=worker, args=(path, mapped, measured, results)) for _ in range(count)]
+        for process in processes:
+            process.start()
+        usage = [results.get() for _ in processes]
+        measured.wait()
+        for process in processes:
+            process.join()
+        print(f'{count:<10}{sum(rss for rss, pss in usage):>16}{sum(pss for rss, pss in usage):>16}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000, help='actors to create')
+    parser.add_argument('--lookups', type=int, default=5000)
+    parser.add_argument('--casts', type=int, default=200, help='movies per cast lookup')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    app = create_app({'SLOW_QUERY_THRESHOLD_MS': 0})
+    last_movie_id = db.session.query(func.max(Movie.id)).scalar() or 0
+    last_actor_id = db.session.query(func.max(Actor.id)).scalar() or 0
+    seed(movies=max(args.rows // 8, 1), actors=args.rows, report=lambda message: None)
+    path = os.path.join(tempfile.mkdtemp(prefix='bench-snapshot-'), 'snapshot.bin')
+
+    try:
+        started = time.perf_counter()
+        with app.app_context():
+            counts = build_snapshot(path)
+        print(f'Built snapshot of {counts} in {time.perf_counter() - started:.2f}s, '
+              f'{os.path.getsize(path) / 1024 / 1024:.1f} MiB')
+
+        # Before this process maps the file itself, so the forked workers are its only users
+        if os.path.exists('/proc/self/smaps'):
+            memory_by_workers(path, args.workers)
+
+        snapshot = Snapshot(path)
+        actors = snapshot.table('actors')
+
+        rng = random.Random(0)
+        all_actor_ids = [row['id'] for row in actors.rows(('id',))]
+        all_movie_ids = [row['id'] for row in snapshot.table('movies').rows(('id',))]
+        actor_ids = [rng.choice(all_actor_ids) for _ in range(args.lookups)]
+        cast_ids = rng.sample(all_movie_ids, min(args.casts, len(all_movie_ids)))
+
+        def database_lookups():
+            for actor_id in actor_ids:
+                Actor.get_fields_by_id(actor_id, Actor.FIELDS)
+
+        def snapshot_lookups():
+            for actor_id in actor_ids:
+                actors.get(actor_id)
+
+        def database_casts():
+            for cast in Actor.get_actors_by_movie_ids(cast_ids).values():
+                [actor.format() for actor in cast]
+            db.session.expunge_all()
+
+        def database_list():
+            return jsonify({'success': True, 'actors': [actor.format() for actor in Actor.get_all()]})
+
+        print(f"\n{'read path':<40}{'operations/s':>14}{'ms/op':>12}")
+        with app.test_request_context():
+            measure('list all actors: database', 1, database_list)
+            db.session.expunge_all()
+            # Encodes and caches every row, so the measured call only reads versions
+            list_response(Actor, 'actors', Actor.FIELDS)
+            measure('list all actors: fragments', 1, lambda: list_response(Actor, 'actors', Actor.FIELDS))
+            measure('list all actors: snapshot', 1, lambda: encoded_list_response('actors', actors.encoded_rows()))
+        measure('actor by id: database', args.lookups, database_lookups)
+        measure('actor by id: snapshot', args.lookups, snapshot_lookups)
+        measure(f'casts of {len(cast_ids)} movies: database', 1, database_casts)
+        measure(f'casts of {len(cast_ids)} movies: snapshot', 1, lambda: actors.group('movie_id', cast_ids))
+    finally:
+        db.session.rollback()
+        db.session.query(Actor).filter(Actor.id > last_actor_id).delete()
+        db.session.query(Movie).filter(Movie.id > last_movie_id).delete()
+        db.session.commit()
+        if os.path.exists(path):
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Unit-of-Work Benchmark
+
+Measures a multi-row write handler with commit-per-method (`UNIT_OF_WORK=false`, the old behaviour) against
+the request-scoped unit of work. A benchmark-only route inserts `--rows` actors per request through
+`Actor.insert()`; requests go through the Flask test client, so only the database path is measured.
+
+Usage:
+    python benchmarks/bench_unit_of_work.py [--requests 50] [--rows 20]
+
+The database is taken from `DATABASE_URL`; without it a temporary SQLite file is used. Rows created by the
+benchmark are deleted afterwards.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+if not os.getenv('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench-uow-'), 'bench.db')}"
+
+from flask import jsonify
+from app import create_app
+from models import db, Movie, Actor
+
+
+def build_app(unit_of_work, rows):
+    app = create_app({'UNIT_OF_WORK': unit_of_work, 'SLOW_QUERY_THRESHOLD_MS': 0})
+
+    @app.route('/bench/cast/<int:movie_id>', methods=['POST'])
+    def cast(movie_id):
+        for i in range(rows):
+            Actor(name=f'Bench Actor {i}', age=20 + i % 50, gender='female', movie_id=movie_id).insert()
+        return jsonify({'success': True})
+
+    return app
+
+
+def run(unit_of_work, requests, rows, movie_id):
+    app = build_app(unit_of_work, rows)
+    client = app.test_client()
+    started = time.perf_counter()
+    for _ in range(requests):
+        assert client.post(f'/bench/cast/{movie_id}').status_code == 200
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--rows', type=int, default=20, help='rows written per request')
+    args = parser.parse_args()
+
+    movie = Movie(title='Unit of Work Benchmark', release_year=2000)
+    movie.insert()
+    movie_id = movie.id
+
+    print(f"{'mode':<20}{'req/s':>10}{'rows/s':>12}{'commits/req':>14}")
+    try:
+        for label, unit_of_work in [('commit-per-method', False), ('unit-of-work', True)]:
+            elapsed = run(unit_of_work, args.requests, args.rows, movie_id)
+            commits = 1 if unit_of_work else args.rows
+            print(f'{label:<20}{args.requests / elapsed:>10.1f}'
+                  f'{args.requests * args.rows / elapsed:>12.0f}{commits:>14}')
+    finally:
+        db.session.query(Actor).filter(Actor.movie_id == movie_id).delete()
+        db.session.query(Movie).filter(Movie.id == movie_id).delete()
+        db.session.commit()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""
+Worker-Model Benchmark
+
+Starts the application under gunicorn once per worker class, using `gunicorn.conf.py`, and drives the
+existing routes with concurrent keep-alive clients. Tokens are signed by a local `AuthStub`, so the full
+`requires_auth` path (JWKS fetch and RS256 verification) runs without Auth0.
+
+Usage:
+    python benchmarks/bench_workers.py [--worker-classes sync gthread gevent] [--concurrency 32] [--duration 10]
+
+The database is taken from `DATABASE_URL`; without it a temporary SQLite file is used. Worker classes
+whose packages are not installed (e.g. gevent) are skipped.
+"""
+import argparse
+import http.client
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from auth_stub import AuthStub
+
+DOMAIN = 'auth-stub.local'
+AUDIENCE = 'casting-benchmark'
+ROUTES = ['/', '/movies', '/actors']
+ALL_PERMISSIONS = [
+    'view:actors', 'view:movies', 'delete:actor', 'create:actor',
+    'edit:actor', 'edit:movie', 'create:movie', 'delete:movie'
+]
+
+
+def request(conn, method, path, token=None, body=None):
+    headers = {'Content-Type': 'application/json'}
+    if token:
+        headers['Authorization'] = f'Bearer {token}'
+    conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+    response = conn.getresponse()
+    response.read()
+    return response.status
+
+
+def wait_until_up(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            if request(conn, 'GET', '/') == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'gunicorn did not come up on port {port}')
+
+
+def seed(port, token, movies, actors_per_movie):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    for i in range(movies):
+        request(conn, 'POST', '/movies/new', token, {'title': f'Movie {i}', 'release_year': 1950 + i % 70})
+    for i in range(movies * actors_per_movie):
+        request(conn, 'POST', '/actors/new', token, {
+            'name': f'Actor {i}', 'age': 18 + i % 60, 'gender': 'female' if i % 2 else 'male',
+            'movie_id': 1 + i % movies
+        })
+
+
+def drive(port, path, token, concurrency, duration):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def client():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        local = []
+        while time.monotonic() < stop_at:
+            started = time.perf_counter()
+            try:
+                status = request(conn, 'GET', path, token)
+            except (OSError, http.client.HTTPException):
+                # sync workers and max_requests recycling close kept-alive connections; retry once
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                try:
+                    status = request(conn, 'GET', path, token)
+                except (OSError, http.client.HTTPException):
+                    status = None
+            if status == 200:
+                local.append(time.perf_counter() - started)
+            else:
+                with lock:
+                    errors[0] += 1
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    if not latencies:
+        return 0.0, None, None, errors[0]
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    return len(latencies) / duration, p50, p99, errors[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--worker-classes', nargs='+', default=['sync', 'gthread', 'gevent'])
+    parser.add_argument('--workers', type=int, default=None, help='processes per run (default: gunicorn.conf.py)')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--movies', type=int, default=50)
+    parser.add_argument('--actors-per-movie', type=int, default=10)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    stub = AuthStub(DOMAIN, AUDIENCE)
+    jwks_url = stub.start()
+    token = stub.token(ALL_PERMISSIONS)
+
+    workdir = tempfile.mkdtemp(prefix='bench-workers-')
+    env = dict(os.environ)
+    env.update({
+        'AUTH0_DOMAIN': DOMAIN,
+        'API_IDENTIFIER': AUDIENCE,
+        'ALGORITHMS': 'RS256',
+        'AUTH0_JWKS_URL': jwks_url,
+        'GUNICORN_BIND': f'127.0.0.1:{args.port}'
+    })
+    env.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    if args.workers:
+        env['GUNICORN_WORKERS'] = str(args.workers)
+
+    print(f"{'worker class':<14}{'route':<10}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    seeded = False
+    for worker_class in args.worker_classes:
+        if worker_class == 'gevent' and importlib.util.find_spec('gevent') is None:
+            print(f'{worker_class:<14}skipped: gevent is not installed')
+            continue
+
+        env['GUNICORN_WORKER_CLASS'] = worker_class
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', 'app:app'],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            wait_until_up(args.port)
+            if not seeded:
+                seed(args.port, token, args.movies, args.actors_per_movie)
+                seeded = True
+            for path in ROUTES:
+                drive(args.port, path, token, args.concurrency, 1.0)
+                rate, p50, p99, errors = drive(args.port, path, token, args.concurrency, args.duration)
+                p50 = f'{p50:.1f}' if p50 is not None else '-'
+                p99 = f'{p99:.1f}' if p99 is not None else '-'
+                print(f'{worker_class:<14}{path:<10}{rate:>10.0f}{p50:>10}{p99:>10}{errors:>8}')
+        finally:
+            server.terminate()
+            server.wait()
+
+    stub.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""
+In-Process Result Cache for a Flask Application
+
+This module provides a small, thread-safe cache for computed results (aggregates, counts, serialised
+payloads) that depend on the contents of one or more database tables. Every table has a version
+counter which the model write methods bump; a cached entry is only served while the versions of the
+tables it was computed from are unchanged and its optional TTL has not expired.
+
+Version counters live in the memory of a single process, so writes made by another gunicorn worker
+are only observed once the TTL of an entry expires. Pick the TTL accordingly.
+
+The module also keeps the encoded JSON of individual rows, keyed by table, ID, row version and the
+selected fields, so list responses only encode rows that changed (see `fragments.py`). Row versions are
+stored in the database and incremented by the model update methods, so these fragments need no TTL; the delete
+methods drop the fragments of the rows they delete. Writes that leave `version` unchanged (raw SQL,
+`Query.update()`, other applications) are never seen: the old fragment is served until it is evicted. At most
+`FRAGMENT_CACHE_SIZE` rows are kept; the oldest are evicted first.
+
+Functions:
+    get_table_version(table): Returns the current version counter of a table.
+    bump_table_version(*tables): Invalidates every cached entry that depends on the given tables.
+    add_version_listener(listener): Calls `listener(tables)` after every version bump.
+    cached(key, tables, loader, ttl=None): Returns a cached value or computes and stores it.
+    get_fragment(table, record_id, version, fields): Returns the cached JSON of a row version, or None.
+    set_fragment(table, record_id, version, fields, fragment): Stores the JSON of a row version.
+    forget_fragment(table, record_id): Drops the cached JSON of a row.
+    clear_cache(): Drops every cached entry.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from settings import FRAGMENT_CACHE_SIZE
+
+_lock = threading.Lock()
+_table_versions = {}
+_entries = {}
+_listeners = []
+# (table, record_id) -> (version, {fields: fragment}), oldest first
+_fragments = OrderedDict()
+
+
+def get_table_version(table):
+    """
+    Returns the current version counter of a table.
+
+    Args:
+        table (str): Name of the table.
+
+    Returns:
+        int: The version counter, starting at 0.
+    """
+    return _table_versions.get(table, 0)
+
+
+def bump_table_version(*tables):
+    """
+    Increments the version counter of the given tables, invalidating the entries computed from them.
+
+    Args:
+        *tables (str): Names of the tables that were written to.
+    """
+    with _lock:
+        for table in tables:
+            _table_versions[table] = _table_versions.get(table, 0) + 1
+    if tables:
+        for listener in _listeners:
+            listener(tables)
+
+
+def add_version_listener(listener):
+    """
+    Registers a function called with the table names after every `bump_table_version`, e.g. to tell other
+    processes that their copies of the data are stale.
+
+    Args:
+        listener (callable): Function taking a tuple of table names.
+    """
+    _listeners.append(listener)
+
+
+def cached(key, tables, loader, ttl=None):
+    """
+    Returns the cached value for `key`, computing it with `loader` when missing or stale.
+
+    Args:
+        key (hashable): Cache key of the value.
+        tables (tuple): Names of the tables the value is computed from.
+        loader (callable): Zero-argument function computing the value.
+        ttl (float, optional): Maximum age of the entry in seconds. Defaults to None (no expiry).
+
+    Returns:
+        The cached or freshly computed value.
+    """
+    versions = tuple(get_table_version(table) for table in tables)
+    now = time.monotonic()
+
+    entry = _entries.get(key)
+    if entry is not None:
+        entry_versions, expires_at, value = entry
+        if entry_versions == versions and (expires_at is None or expires_at > now):
+            return value
+
+    value = loader()
+    expires_at = now + ttl if ttl else None
+    with _lock:
+        _entries[key] = (versions, expires_at, value)
+    return value
+
+
+def get_fragment(table, record_id, version, fields):
+    """
+    Returns the cached JSON of a row version.
+
+    Args:
+        table (str): Name of the table.
+        record_id (int): Primary key of the row.
+        version (int): Row version the fragment must have been encoded from.
+        fields (tuple): The encoded fields.
+
+    Returns:
+        bytes: The encoded row, or None if it is not cached for this version and fields.
+    """
+    entry = _fragments.get((table, record_id))
+    if entry is None or entry[0] != version:
+        return None
+    return entry[1].get(fields)
+
+
+def set_fragment(table, record_id, version, fields, fragment):
+    """
+    Stores the JSON of a row version, replacing fragments of older versions.
+
+    Args:
+        table (str): Name of the table.
+        record_id (int): Primary key of the row.
+        version (int): Row version the fragment was encoded from.
+        fields (tuple): The encoded fields.
+        fragment (bytes): The encoded row.
+    """
+    if FRAGMENT_CACHE_SIZE <= 0:
+        return
+    key = (table, record_id)
+    with _lock:
+        entry = _fragments.get(key)
+        if entry is None or entry[0] != version:
+            entry = _fragments[key] = (version, {})
+        entry[1][fields] = fragment
+        while len(_fragments) > FRAGMENT_CACHE_SIZE:
+            _fragments.popitem(last=False)
+
+
+def forget_fragment(table, record_id):
+    """
+    Drops the cached JSON of a row, e.g. after it was updated or deleted.
+
+    Args:
+        table (str): Name of the table.
+        record_id (int): Primary key of the row.
+    """
+    with _lock:
+        _fragments.pop((table, record_id), None)
+
+
+def clear_cache():
+    """
+    Drops every cached entry and row fragment. Table version counters are kept.
+    """
+    with _lock:
+        _entries.clear()
+        _fragments.clear()
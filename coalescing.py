@@ -0,0 +1,119 @@
+"""
+Single-Flight Coalescing of Identical Read Requests
+
+When a cached result expires, many clients tend to request the same resource in the same instant and each
+of them would run the same query and serialisation. The `coalesced` route decorator lets the first of a
+group of concurrent identical requests compute the response while the others wait for it and reply with a
+copy of the serialised result.
+
+Requests are identical when they share the method, path, query string and permission scope (the sorted
+`permissions` of the token), so callers never receive a response computed for broader permissions than their
+own. Coalescing only joins requests that are in flight at the same time within one process; nothing is kept
+once the response is computed. A request that arrives while an identical one is running may therefore get a
+result computed before its own request started, as with any cache. Set `REQUEST_COALESCING=false` to turn it off.
+
+Classes:
+    SingleFlight: Runs one computation per key at a time and hands its result to every concurrent caller.
+
+Functions:
+    coalesced(f): Route decorator sharing one response among concurrent identical requests.
+"""
+import threading
+from functools import wraps
+
+from flask import current_app, request
+from settings import REQUEST_COALESCING
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent computations of the same key.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def do(self, key, fn):
+        """
+        Returns the result of `fn()`, running it only if no computation of `key` is already in flight.
+
+        Callers that join an in-flight computation block until it finishes and receive its result, or its
+        exception.
+
+        Args:
+            key (hashable): Identity of the computation.
+            fn (callable): Zero-argument function computing the result.
+
+        Returns:
+            The result of `fn()`.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = fn()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.value
+
+
+_requests = SingleFlight()
+
+
+def coalesced(f):
+    """
+    Shares one response among concurrent identical requests to a route.
+
+    Apply below `requires_auth`, so every request is authenticated and authorised on its own and the decorated
+    view receives the decoded payload. The response is shared as its body, status and headers; an exception
+    raised by the view, such as `abort(400)`, is raised in every waiting request.
+
+    Args:
+        f (callable): The view function, taking the JWT payload first.
+
+    Returns:
+        callable: The wrapped view function.
+    """
+    @wraps(f)
+    def wrapper(payload, *args, **kwargs):
+        app = current_app._get_current_object()
+        if not app.config.get('REQUEST_COALESCING', REQUEST_COALESCING):
+            return f(payload, *args, **kwargs)
+
+        key = (
+            id(app),
+            request.method,
+            request.path,
+            request.query_string,
+            tuple(sorted(payload.get('permissions', [])))
+        )
+
+        def respond():
+            response = app.make_response(f(payload, *args, **kwargs))
+            return response.get_data(), response.status_code, list(response.headers)
+
+        body, status, headers = _requests.do(key, respond)
+        return app.response_class(body, status=status, headers=headers)
+    return wrapper
@@ -0,0 +1,98 @@
+"""
+Pre-Serialised JSON Fragments for List Responses
+
+`jsonify` encodes every row of a list response again on every request. This module keeps the encoded JSON of
+each row in the fragment cache of `cache.py`, keyed by table, ID, row version and the selected fields, and
+assembles list responses by joining the cached fragments into the usual `{"movies": [...], "success": true}`
+envelope. Only rows that are new or whose `version` changed since they were last encoded in this process are
+encoded again, so the encoding cost follows the number of changed rows instead of the size of the list.
+
+`update()` and `update_many()` increment `version` in SQL and drop the fragments of the rows they change, and the
+delete methods drop the fragments of every row they delete, so an ID reused by SQLite never serves the JSON of the
+deleted row. Because the version is read from the database together with the row, updates made by other workers
+are picked up as well. Writes that bypass the model methods, such as raw SQL, `Query.update()` or other
+applications, are never seen unless they increment `version` themselves (`SET version = version + 1`); until then
+the old JSON of those rows is served.
+
+With `FRAGMENT_CACHE_SIZE=0` (the default) nothing is cached and `list_response` encodes the list with `jsonify`.
+
+Rows are encoded with the app's JSON encoder and `JSON_SORT_KEYS`/`JSON_AS_ASCII` settings, in the compact
+form `jsonify` uses outside debug mode, so responses are byte-for-byte what `jsonify` would return there.
+
+Functions:
+    row_encoder(): Returns a JSON encoder with the settings `jsonify` applies.
+    encoded_list_response(name, rows): Wraps rows encoded in advance in the list envelope.
+    list_response(model, name, fields): Builds the JSON list response of the given model columns.
+"""
+from flask import current_app, jsonify
+from cache import get_fragment, set_fragment
+from models import db
+from settings import FRAGMENT_CACHE_SIZE
+
+SEPARATORS = (',', ':')
+# Stands in for the list while the envelope is encoded
+PLACEHOLDER = '__fragments__'
+
+
+def row_encoder():
+    """
+    Returns an encoder with the settings `jsonify` applies, built once per response instead of once per row.
+    """
+    return current_app.json_encoder(
+        separators=SEPARATORS,
+        sort_keys=current_app.config['JSON_SORT_KEYS'],
+        ensure_ascii=current_app.config['JSON_AS_ASCII']
+    )
+
+
+def _row_fragments(model, fields, encoder):
+    """
+    Yields the encoded JSON of the given columns of every row, encoding only rows missing from the cache.
+    """
+    table = model.__tablename__
+    query = db.session.query(model.id, model.version, *(getattr(model, field) for field in fields))
+    for record_id, version, *values in query:
+        fragment = get_fragment(table, record_id, version, fields)
+        if fragment is None:
+            fragment = encoder.encode(dict(zip(fields, values))).encode('utf-8')
+            set_fragment(table, record_id, version, fields, fragment)
+        yield fragment
+
+
+def encoded_list_response(name, rows, encoder=None):
+    """
+    Builds a JSON list response from rows encoded in advance.
+
+    Args:
+        name (str): Key of the list in the envelope, e.g. `movies`.
+        rows (bytes): The encoded rows joined with commas; any bytes-like object, such as a `memoryview`.
+        encoder (JSONEncoder, optional): The encoder of the rows. Defaults to `row_encoder()`.
+
+    Returns:
+        Response: The JSON response, equal to `jsonify(success=True, <name>=[...])`.
+    """
+    # Encode the envelope with a placeholder so key order and formatting follow the app's settings
+    encoder = encoder or row_encoder()
+    envelope = encoder.encode({'success': True, name: PLACEHOLDER}).encode('utf-8')
+    prefix, suffix = envelope.split(encoder.encode(PLACEHOLDER).encode('utf-8'))
+    body = b''.join((prefix, b'[', rows, b']', suffix, b'\n'))
+    return current_app.response_class(body, mimetype=current_app.config['JSONIFY_MIMETYPE'])
+
+
+def list_response(model, name, fields):
+    """
+    Builds a JSON response listing the given columns of every row of a model.
+
+    Args:
+        model (db.Model): The model class, with an `id` and a `version` column.
+        name (str): Key of the list in the envelope, e.g. `movies`.
+        fields (tuple): Field names returned by `parse_fields`.
+
+    Returns:
+        Response: The JSON response, equal to `jsonify(success=True, <name>=[...])`.
+    """
+    if FRAGMENT_CACHE_SIZE <= 0:
+        rows = db.session.query(*(getattr(model, field) for field in fields))
+        return jsonify({'success': True, name: [dict(zip(fields, row)) for row in rows]})
+    encoder = row_encoder()
+    return encoded_list_response(name, b','.join(_row_fragments(model, fields, encoder)), encoder)
@@ -0,0 +1,73 @@
+"""
+Production Gunicorn Configuration
+
+Gunicorn loads this file automatically when started from the project directory:
+
+    gunicorn app:app
+
+Every setting can be overridden through the environment:
+    GUNICORN_BIND: Address to bind. Defaults to `0.0.0.0:$PORT`, or `0.0.0.0:8000` without `PORT`.
+    GUNICORN_WORKER_CLASS: `gthread` (default) or `gevent`. gevent needs `pip install gevent psycogreen`.
+    GUNICORN_WORKERS: Number of worker processes. Defaults to `2 * cores + 1`, or `cores + 1` for gthread.
+    GUNICORN_THREADS: Threads per gthread worker. Defaults to 4.
+    GUNICORN_WORKER_CONNECTIONS: Concurrent greenlets per gevent worker. Defaults to 100.
+    GUNICORN_MAX_REQUESTS / GUNICORN_MAX_REQUESTS_JITTER: Recycle a worker after this many requests,
+        plus a random jitter so workers do not restart together. Default to 1000 and 100.
+    GUNICORN_TIMEOUT / GUNICORN_KEEPALIVE: Worker timeout and keep-alive in seconds. Default to 30 and 5.
+
+The application is imported once in the master (`preload_app`), so workers share its code pages and start
+fast. The SQLAlchemy engine is disposed in the master before the first fork and again in every worker
+right after it, so no pooled database connection is ever shared between processes.
+"""
+import multiprocessing
+import os
+
+cores = multiprocessing.cpu_count()
+
+bind = os.getenv('GUNICORN_BIND', f"0.0.0.0:{os.getenv('PORT', '8000')}")
+
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+if worker_class == 'gthread':
+    # Threads already provide concurrency within a worker, so fewer processes are needed
+    workers = int(os.getenv('GUNICORN_WORKERS', cores + 1))
+else:
+    workers = int(os.getenv('GUNICORN_WORKERS', 2 * cores + 1))
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '100'))
+
+preload_app = True
+
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '1000'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '100'))
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = timeout
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+
+accesslog = '-'
+errorlog = '-'
+
+
+def _dispose_engine():
+    from models import db
+    db.engine.dispose()
+
+
+def when_ready(server):
+    """
+    Closes the connections the master opened while loading the application (e.g. `create_tables()`).
+    """
+    _dispose_engine()
+
+
+def post_fork(server, worker):
+    """
+    Gives the new worker an empty connection pool and, for gevent, makes psycopg2 cooperative.
+    """
+    if worker_class == 'gevent':
+        try:
+            from psycogreen.gevent import patch_psycopg
+            patch_psycopg()
+        except ImportError:
+            server.log.warning('psycogreen is not installed; database calls will block the gevent worker')
+    _dispose_engine()
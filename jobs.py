@@ -0,0 +1,394 @@
+"""
+Asynchronous Bulk Jobs
+
+Uploading a whole casting sheet through `POST /actors/new` or the update routes keeps a gunicorn worker busy
+for as long as the writes take. With `?async=true` those routes accept a list of objects (or a single one),
+store it as a row of the `jobs` table and answer `202 Accepted` with the job ID straight away. Worker threads
+then apply the items with `insert_many`/`update_many` of `Movie`/`Actor`, `JOB_BATCH_SIZE` items per transaction
+and flush, and `GET /jobs/<id>` reports their progress.
+
+Job kinds, the route that submits them and the permission they require:
+    create_movies   POST /movies/new?async=true                 create:movie
+    create_actors   POST /actors/new?async=true                 create:actor
+    update_movies   PATCH /movies/update/<id>?async=true        edit:movie
+    update_actors   PATCH /actors/update/<id>?async=true        edit:actor
+
+Items are validated like the synchronous routes validate their body. An item that fails validation, refers to
+an unknown movie or updates an unknown row is skipped and reported in the job's `errors`; the rest of the job
+goes on. Each batch commits together with the job's progress, so a batch is applied exactly once: a batch
+interrupted by an error is rolled back and started again. Transient database errors (lost connections,
+deadlocks, locked SQLite files) are retried up to `JOB_MAX_RETRIES` times with a growing delay; any other error,
+or a transient one that keeps failing, stops the job with status `failed`, keeping the batches committed so far.
+
+The queue is the `jobs` table itself, so it works on SQLite and PostgreSQL and survives restarts. Every app
+process runs `JOB_WORKERS` threads (default `1`) that claim queued jobs one at a time (see `Job.claim`);
+`python manage.py work` runs workers in a process of their own. A job whose worker stops making progress for
+`JOB_STALE_AFTER` seconds is claimed again and resumes after its last committed batch.
+
+Classes:
+    JobWorkers: The worker threads of one process.
+
+Functions:
+    parse_items(body): Validates the body of an asynchronous create request.
+    enqueue(kind, items): Stores a job and wakes the local workers.
+    run_job(job, batch_size, max_retries): Applies a claimed job batch by batch.
+    register_jobs(app): Sets up the workers of the app.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy.exc import DBAPIError, OperationalError
+
+from models import db, unit_of_work, commit_session, rollback_session, Job, Movie, Actor
+from settings import JOB_WORKERS, JOB_BATCH_SIZE, JOB_MAX_RETRIES, JOB_POLL_INTERVAL, JOB_STALE_AFTER
+
+logger = logging.getLogger(__name__)
+
+# Rejected items recorded per job; `failed` counts all of them
+MAX_RECORDED_ERRORS = 100
+# Seconds before the first retry of a batch, doubled for every further one
+RETRY_DELAY = 0.5
+# PostgreSQL SQLSTATEs worth retrying: serialization failure, deadlock, lock not available; class 08 (connection
+# exceptions) is matched by prefix
+TRANSIENT_SQLSTATES = ('40001', '40P01', '55P03')
+# SQLite reports lock contention only in the message
+TRANSIENT_SQLITE_ERRORS = ('database is locked', 'database table is locked')
+# Range of the integer columns; larger values would fail the whole batch in the database
+MAX_INTEGER = 2 ** 31 - 1
+
+
+def _integer(value):
+    """
+    Returns `value` as an int if it is one or a string of digits within the range of an integer column,
+    otherwise None.
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, str) and value.strip().isdigit():
+        value = int(value)
+    if isinstance(value, int) and -MAX_INTEGER - 1 <= value <= MAX_INTEGER:
+        return value
+    return None
+
+
+def _text(value):
+    """
+    Returns `value` if it is a string with more than whitespace, otherwise None.
+    """
+    if isinstance(value, str) and value.strip():
+        return value
+    return None
+
+
+def _existing_movie_ids(items):
+    movie_ids = {_integer(item.get('movie_id')) for item in items} - {None}
+    return {movie.id for movie in Movie.get_many(movie_ids)}
+
+
+def _create_movies(items):
+    failures = []
+    movies = []
+    for index, item in enumerate(items):
+        title = _text(item.get('title'))
+        release_year = _integer(item.get('release_year'))
+        if not (title and release_year):
+            failures.append((index, 'title and an integer release_year are required'))
+            continue
+        movies.append(Movie(title=title, release_year=release_year))
+    Movie.insert_many(movies)
+    return failures
+
+
+def _create_actors(items):
+    failures = []
+    actors = []
+    movie_ids = _existing_movie_ids(items)
+    for index, item in enumerate(items):
+        name = _text(item.get('name'))
+        age = _integer(item.get('age'))
+        gender = _text(item.get('gender'))
+        movie_id = _integer(item.get('movie_id'))
+        if not (name and age and gender and movie_id):
+            failures.append((index, 'name, gender and integer age and movie_id are required'))
+        elif movie_id not in movie_ids:
+            failures.append((index, f'Movie {movie_id} not found'))
+        else:
+            actors.append(Actor(name=name, age=age, gender=gender, movie_id=movie_id))
+    Actor.insert_many(actors)
+    return failures
+
+
+def _update_movies(items):
+    failures = []
+    changed = []
+    movies = {movie.id: movie for movie in Movie.get_many([item['id'] for item in items])}
+    for index, item in enumerate(items):
+        movie = movies.get(item['id'])
+        title, release_year = item.get('title'), item.get('release_year')
+        if movie is None:
+            failures.append((index, 'Resource not found'))
+        elif title and _text(title) is None:
+            failures.append((index, 'title must be a string'))
+        elif release_year and _integer(release_year) is None:
+            failures.append((index, 'release_year must be an integer'))
+        else:
+            if title:
+                movie.title = title
+            if release_year:
+                movie.release_year = _integer(release_year)
+            changed.append(movie)
+    Movie.update_many(changed)
+    return failures
+
+
+def _update_actors(items):
+    failures = []
+    changed = []
+    actors = {actor.id: actor for actor in Actor.get_many([item['id'] for item in items])}
+    movie_ids = _existing_movie_ids(items)
+    for index, item in enumerate(items):
+        actor = actors.get(item['id'])
+        name, gender = item.get('name'), item.get('gender')
+        age, movie_id = item.get('age'), item.get('movie_id')
+        if actor is None:
+            failures.append((index, 'Resource not found'))
+        elif (name and _text(name) is None) or (gender and _text(gender) is None):
+            failures.append((index, 'name and gender must be strings'))
+        elif (age and _integer(age) is None) or (movie_id and _integer(movie_id) is None):
+            failures.append((index, 'age and movie_id must be integers'))
+        elif movie_id and _integer(movie_id) not in movie_ids:
+            failures.append((index, f'Movie {movie_id} not found'))
+        else:
+            if name:
+                actor.name = name
+            if age:
+                actor.age = _integer(age)
+            if gender:
+                actor.gender = gender
+            if movie_id:
+                actor.movie_id = _integer(movie_id)
+            changed.append(actor)
+    Actor.update_many(changed)
+    return failures
+
+
+# Job kind: (required permission, function applying a batch and returning the rejected items)
+KINDS = {
+    'create_movies': ('create:movie', _create_movies),
+    'create_actors': ('create:actor', _create_actors),
+    'update_movies': ('edit:movie', _update_movies),
+    'update_actors': ('edit:actor', _update_actors)
+}
+
+
+def parse_items(body):
+    """
+    Validates the body of an asynchronous create request.
+
+    Args:
+        body: The decoded JSON body, an object or a list of objects.
+
+    Returns:
+        list: The objects to create.
+
+    Raises:
+        ValueError: If the body is neither an object nor a non-empty list of objects.
+    """
+    items = [body] if isinstance(body, dict) else body
+    if not isinstance(items, list) or not items or not all(isinstance(item, dict) for item in items):
+        raise ValueError('Expected an object or a non-empty list of objects.')
+    return items
+
+
+def enqueue(kind, items):
+    """
+    Stores a job, commits it and wakes the workers of this process.
+
+    Args:
+        kind (str): One of `KINDS`.
+        items (list): The objects to apply; update items carry the row's `id`.
+
+    Returns:
+        Job: The queued job.
+    """
+    job = Job(kind=kind, permission=KINDS[kind][0], items=items, total=len(items), errors=[])
+    db.session.add(job)
+    # Commit before answering, so the job exists when the client polls for it
+    commit_session()
+    workers = current_app.extensions.get('jobs')
+    if workers is not None:
+        workers.wake()
+    return job
+
+
+def _is_transient(error):
+    """
+    Returns True for database errors worth retrying: lost connections, deadlocks, serialization failures
+    and locked rows, tables or SQLite databases. Other errors, such as a missing table, fail the job.
+    """
+    if error.connection_invalidated:
+        return True
+    code = getattr(error.orig, 'pgcode', None)
+    if code:
+        return code in TRANSIENT_SQLSTATES or code.startswith('08')
+    return isinstance(error, OperationalError) and str(error.orig).startswith(TRANSIENT_SQLITE_ERRORS)
+
+
+def _apply_batch(job, apply, items, start, max_retries):
+    """
+    Applies one batch and records it in the job in the same transaction, retrying transient errors.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            with unit_of_work():
+                failures = apply(items)
+                job.processed = start + len(items)
+                job.failed += len(failures)
+                if failures and len(job.errors) < MAX_RECORDED_ERRORS:
+                    recorded = [{'index': start + index, 'message': message} for index, message in failures]
+                    job.errors = (job.errors + recorded)[:MAX_RECORDED_ERRORS]
+                job.heartbeat_at = datetime.utcnow()
+            return
+        except DBAPIError as error:
+            if attempt == max_retries or not _is_transient(error):
+                raise
+            logger.warning('Retrying batch at item %s of job %s after %s', start, job.id, error.orig)
+            time.sleep(RETRY_DELAY * 2 ** attempt)
+
+
+def run_job(job, batch_size, max_retries):
+    """
+    Applies a claimed job from its last committed batch on and records the outcome.
+
+    Args:
+        job (Job): A job returned by `Job.claim`.
+        batch_size (int): Items per transaction.
+        max_retries (int): Retries of a batch failing with a transient error.
+
+    Returns:
+        Job: The job, `succeeded` or `failed`.
+    """
+    apply = KINDS[job.kind][1]
+    # Loaded once; the deferred column is not reloaded when the job expires after each commit
+    items = job.items
+    try:
+        while job.processed < job.total:
+            start = job.processed
+            _apply_batch(job, apply, items[start:start + batch_size], start, max_retries)
+        job.status = 'succeeded'
+    except Exception as error:
+        logger.exception('Job %s failed', job.id)
+        rollback_session()
+        job.status = 'failed'
+        job.error = str(getattr(error, 'orig', error))
+    job.finished_at = datetime.utcnow()
+    commit_session()
+    return job
+
+
+class JobWorkers:
+    """
+    The threads applying queued jobs in one process.
+
+    Args:
+        app (Flask): The application, whose database holds the queue.
+        workers (int): Number of threads.
+        batch_size (int): Items per transaction.
+        max_retries (int): Retries of a batch failing with a transient error.
+        poll_interval (float): Seconds an idle thread waits before looking for jobs again.
+        stale_after (float): Seconds without progress after which a running job is claimed again.
+    """
+
+    def __init__(self, app, workers, batch_size, max_retries, poll_interval, stale_after):
+        self.app = app
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self._pid = None
+        self._threads = []
+        self._wakeup = threading.Event()
+
+    def wake(self):
+        """
+        Lets idle threads of this process look for jobs now instead of after the poll interval.
+        """
+        self._wakeup.set()
+
+    def ensure_started(self):
+        """
+        Starts the threads once in every process, including workers forked from a preloaded master.
+        """
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._wakeup = threading.Event()
+        self._threads = [
+            threading.Thread(target=self._run, name=f'job-worker-{number}', daemon=True)
+            for number in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def serve(self):
+        """
+        Starts the threads and blocks; used by `python manage.py work`.
+        """
+        self.ensure_started()
+        for thread in self._threads:
+            thread.join()
+
+    def _run(self):
+        while True:
+            with self.app.app_context():
+                try:
+                    ran = self.run_next()
+                except Exception:
+                    logger.exception('Job worker failed')
+                    ran = False
+                finally:
+                    db.session.remove()
+            if not ran:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def run_next(self):
+        """
+        Claims the next job and applies it.
+
+        Returns:
+            bool: Whether a job was run.
+        """
+        job = Job.claim(datetime.utcnow() - timedelta(seconds=self.stale_after))
+        if job is None:
+            return False
+        run_job(job, self.batch_size, self.max_retries)
+        return True
+
+
+def register_jobs(app):
+    """
+    Sets up the job workers of the app and starts `JOB_WORKERS` threads with the first request.
+
+    Settings are read from `app.config` first, falling back to `settings.py`. With `JOB_WORKERS=0` jobs are still
+    accepted and are left to `python manage.py work` or to other processes.
+
+    Args:
+        app (Flask): The Flask application instance.
+    """
+    workers = JobWorkers(
+        app,
+        app.config.get('JOB_WORKERS', JOB_WORKERS),
+        app.config.get('JOB_BATCH_SIZE', JOB_BATCH_SIZE),
+        app.config.get('JOB_MAX_RETRIES', JOB_MAX_RETRIES),
+        app.config.get('JOB_POLL_INTERVAL', JOB_POLL_INTERVAL),
+        app.config.get('JOB_STALE_AFTER', JOB_STALE_AFTER)
+    )
+    app.extensions['jobs'] = workers
+    if workers.workers > 0:
+        app.before_request(workers.ensure_started)
@@ -1,8 +1,11 @@
-from flask_script import Manager
+from flask_script import Manager, Command, Option
 from flask_migrate import Migrate, MigrateCommand
 
 from app import app
-from models import db
+from models import db, rebuild_stats_summary
+from seed_data import seed, DEFAULT_GENDER_MIX
+from partitioning import extend_actor_partitions
+from settings import JOB_WORKERS, ACTORS_RANGE_SIZE
 
 migrate = Migrate(app, db)
 manager = Manager(app)
@@ -10,5 +13,72 @@ manager = Manager(app)
 manager.add_command('db', MigrateCommand)
 
 
+class RebuildStats(Command):
+    """Recompute the stats_summary table from the movies and actors tables."""
+
+    def run(self):
+        rebuild_stats_summary()
+
+
+manager.add_command('rebuild_stats', RebuildStats())
+
+
+class Seed(Command):
+    """Generate synthetic movies and actors (see seed_data.py)."""
+
+    option_list = (
+        Option('--movies', type=int, default=1000),
+        Option('--actors', type=int, default=None, help='defaults to movies * actors-per-movie'),
+        Option('--actors-per-movie', dest='actors_per_movie', type=int, default=8),
+        Option('--cast-skew', dest='cast_skew', type=float, default=1.0),
+        Option('--age-mean', dest='age_mean', type=float, default=38.0),
+        Option('--age-std', dest='age_std', type=float, default=12.0),
+        Option('--gender-mix', dest='gender_mix', default=DEFAULT_GENDER_MIX),
+        Option('--title-words', dest='title_words', type=int, nargs=2, default=(1, 4)),
+        Option('--release-years', dest='release_years', type=int, nargs=2, default=(1920, 2025)),
+        Option('--seed', type=int, default=0),
+        Option('--batch-size', dest='batch_size', type=int, default=10000),
+        Option('--no-copy', dest='use_copy', action='store_false', default=None)
+    )
+
+    def run(self, **options):
+        seed(**options)
+
+
+manager.add_command('seed', Seed())
+
+
+class ExtendPartitions(Command):
+    """Add range partitions of actors up to the newest movie (see partitioning.py)."""
+
+    option_list = (
+        Option('--ahead', type=int, default=1, help='empty ranges to create past the newest movie'),
+    )
+
+    def run(self, ahead):
+        with db.engine.begin() as connection:
+            created = extend_actor_partitions(connection, ACTORS_RANGE_SIZE, ahead)
+        print(f"Created {', '.join(created) or 'no partitions'}")
+
+
+manager.add_command('extend_partitions', ExtendPartitions())
+
+
+class Work(Command):
+    """Apply jobs queued with ?async=true in this process (see jobs.py)."""
+
+    option_list = (
+        Option('--threads', type=int, default=max(JOB_WORKERS, 1)),
+    )
+
+    def run(self, threads):
+        workers = app.extensions['jobs']
+        workers.workers = threads
+        workers.serve()
+
+
+manager.add_command('work', Work())
+
+
 if __name__ == '__main__':
     manager.run()
\ No newline at end of file
@@ -0,0 +1,41 @@
+"""Apply MOVIE_DELETE_POLICY as the ON DELETE rule of actors.movie_id
+
+Tables are created by `create_tables()` at start-up, so this revision starts from that schema. It replaces
+the foreign key from `actors.movie_id` to `movies.id` with one carrying `ON DELETE CASCADE` or
+`ON DELETE RESTRICT`, following `MOVIE_DELETE_POLICY`. After changing the policy, run
+`python manage.py db downgrade base` and `python manage.py db upgrade` to rebuild the constraint.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+
+from settings import MOVIE_DELETE_POLICY
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# PostgreSQL's default name; the naming convention gives SQLite's unnamed constraint the same name
+CONSTRAINT = 'actors_movie_id_fkey'
+NAMING_CONVENTION = {'fk': '%(table_name)s_%(column_0_name)s_fkey'}
+
+
+def _replace_foreign_key(ondelete):
+    # Batch mode recreates the table on SQLite, which cannot alter constraints in place
+    with op.batch_alter_table('actors', naming_convention=NAMING_CONVENTION) as batch_op:
+        batch_op.drop_constraint(CONSTRAINT, type_='foreignkey')
+        batch_op.create_foreign_key(CONSTRAINT, 'movies', ['movie_id'], ['id'], ondelete=ondelete)
+
+
+def upgrade():
+    _replace_foreign_key(MOVIE_DELETE_POLICY.upper())
+
+
+def downgrade():
+    _replace_foreign_key(None)
@@ -0,0 +1,45 @@
+"""Add the row version columns of movies and actors
+
+`Movie.update()` and `Actor.update()` increment `version`; list responses use it to reuse the encoded JSON of
+unchanged rows (see `fragments.py`). Existing rows start at version 1. Databases whose tables were created by
+`create_tables()` after this change already have the columns and are left as they are.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+TABLES = ('movies', 'actors')
+
+
+def _has_version(table):
+    columns = sa.inspect(op.get_bind()).get_columns(table)
+    return any(column['name'] == 'version' for column in columns)
+
+
+def upgrade():
+    for table in TABLES:
+        if not _has_version(table):
+            op.add_column(table, sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade():
+    # SQLite recreates the tables; dropping the old movies table would cascade to the actors
+    sqlite = op.get_bind().dialect.name == 'sqlite'
+    if sqlite:
+        op.execute('PRAGMA foreign_keys=OFF')
+    for table in TABLES:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('version')
+    if sqlite:
+        op.execute('PRAGMA foreign_keys=ON')
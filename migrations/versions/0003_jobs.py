@@ -0,0 +1,48 @@
+"""Add the jobs table queueing asynchronous bulk writes
+
+Writes submitted with `?async=true` are stored in `jobs` and applied by the workers in `jobs.py`. Databases
+whose tables were created by `create_tables()` after this change already have the table and are left as they are.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if sa.inspect(op.get_bind()).has_table('jobs'):
+        return
+    op.create_table(
+        'jobs',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('kind', sa.String(), nullable=False),
+        sa.Column('permission', sa.String(), nullable=False),
+        sa.Column('items', sa.JSON(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('total', sa.Integer(), nullable=False),
+        sa.Column('processed', sa.Integer(), nullable=False),
+        sa.Column('failed', sa.Integer(), nullable=False),
+        sa.Column('errors', sa.JSON(), nullable=False),
+        sa.Column('error', sa.String()),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('started_at', sa.DateTime()),
+        sa.Column('heartbeat_at', sa.DateTime()),
+        sa.Column('finished_at', sa.DateTime())
+    )
+    op.create_index('ix_jobs_status', 'jobs', ['status'])
+
+
+def downgrade():
+    op.drop_index('ix_jobs_status', table_name='jobs')
+    op.drop_table('jobs')
@@ -0,0 +1,35 @@
+"""Partition the actors table by movie_id on PostgreSQL
+
+Follows `ACTORS_PARTITIONING`: with `hash` or `range` the table is rebuilt as a partitioned table (see
+`partitioning.py`), with `none` and on other databases nothing changes. The rows are copied under an exclusive
+lock. To switch layouts, run `python manage.py db downgrade 0003` and upgrade again with the new settings.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+
+from partitioning import partition_method, partition_actors, unpartition_actors
+from settings import ACTORS_PARTITIONING, ACTORS_HASH_PARTITIONS, ACTORS_RANGE_SIZE
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql' or ACTORS_PARTITIONING == 'none' or partition_method(bind):
+        return
+    partition_actors(bind, ACTORS_PARTITIONING, ACTORS_HASH_PARTITIONS, ACTORS_RANGE_SIZE)
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql' and partition_method(bind):
+        unpartition_actors(bind)
@@ -13,34 +13,62 @@ Modules:
 Classes:
     Movie: Represents a movie record in the database.
     Actor: Represents an actor record in the database.
+    StatsSummary: Incrementally maintained aggregate counts.
+    Job: A queued bulk write, applied by the workers in `jobs.py`.
 
 Functions:
     setup_db(app): Configures and initializes the database for the Flask application.
     create_tables(): Creates all database tables based on defined models.
+    unit_of_work(): Context manager committing all model writes inside it once.
+    commit_session(): Commits the session and invalidates the caches of the written tables.
+    rollback_session(): Rolls the session back and forgets the written tables.
+    rebuild_stats_summary(): Recomputes the `stats_summary` table from the base tables.
 
 """
 import os
-from sqlalchemy import Column, String, Integer
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+import sqlite3
+from sqlalchemy import Column, String, Integer, DateTime, JSON, func, inspect, select, lambda_stmt, event, text, \
+    and_, or_
+from sqlalchemy.orm import deferred
+from sqlalchemy.engine import Engine
+from sqlalchemy.dialects import postgresql, sqlite
 from flask_sqlalchemy import SQLAlchemy
-from settings import DATABASE_URL
+from settings import DATABASE_URL, STATS_SUMMARY_TABLE, STATS_CACHE_TTL, MOVIE_DELETE_POLICY, TOTAL_COUNT_STRATEGY
+from cache import bump_table_version, cached, forget_fragment
 
 db = SQLAlchemy()
 
+COUNT_STRATEGIES = ('exact', 'cached', 'estimate')
+# `stats_summary` metric holding the number of rows of each table, served by the `cached` count strategy
+ROW_COUNT_METRIC = 'table_rows'
+
 def setup_db(app):
     """
     Sets up the database for the Flask application.
 
     Configures the database URI and disables SQLAlchemy track modifications to enhance performance.
-    Binds the SQLAlchemy object to the Flask app.
+    Binds the SQLAlchemy object to the Flask app. A URI already present in the app config takes precedence
+    over `DATABASE_URL`.
 
     Args:
         app (Flask): The Flask application instance.
     """
-    app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
+    app.config.setdefault('SQLALCHEMY_DATABASE_URI', DATABASE_URL)
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     db.app = app
     db.init_app(app)
 
+@event.listens_for(Engine, 'connect')
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # SQLite ignores foreign keys, and with them the ON DELETE policy, unless asked per connection
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
 def create_tables():
     """
     Creates all database tables based on the defined models.
@@ -50,6 +78,271 @@ def create_tables():
     """
     db.create_all()
 
+def begin_unit_of_work():
+    """
+    Defers the commits of the model write methods until `commit_session()` is called.
+    """
+    db.session.info['unit_of_work'] = True
+
+def end_unit_of_work():
+    """
+    Restores immediate commits in the model write methods.
+    """
+    db.session.info.pop('unit_of_work', None)
+
+def in_unit_of_work():
+    """
+    Returns True while the model write methods defer their commits.
+    """
+    return db.session.info.get('unit_of_work', False)
+
+def commit_session():
+    """
+    Commits the session and invalidates the cached results of every table written since the last commit.
+    """
+    tables = db.session.info.pop('written_tables', set())
+    try:
+        db.session.commit()
+    except Exception:
+        # Leave the session usable for the next statement instead of failing it with PendingRollbackError
+        rollback_session()
+        raise
+    bump_table_version(*tables)
+
+def rollback_session():
+    """
+    Rolls the session back and forgets the tables written since the last commit.
+    """
+    db.session.info.pop('written_tables', None)
+    db.session.rollback()
+
+@contextmanager
+def unit_of_work():
+    """
+    Runs a block as one transaction: model writes inside it are flushed but committed once on exit,
+    or rolled back if the block raises. Inside an active unit of work the block simply joins it.
+    """
+    if in_unit_of_work():
+        yield
+        return
+    begin_unit_of_work()
+    try:
+        yield
+        commit_session()
+    except Exception:
+        rollback_session()
+        raise
+    finally:
+        end_unit_of_work()
+
+def _save(commit, *tables):
+    """
+    Finishes a model write: commits immediately when `commit` is set or no unit of work is active,
+    otherwise flushes so errors surface in the caller and leaves the commit to the unit of work.
+
+    Args:
+        commit (bool): Whether to commit immediately regardless of the unit of work.
+        *tables (str): Names of the tables written to, whose caches are invalidated after the commit.
+    """
+    db.session.info.setdefault('written_tables', set()).update(tables)
+    if commit or not in_unit_of_work():
+        commit_session()
+    else:
+        db.session.flush()
+
+def _attribute_change(instance, attribute):
+    """
+    Returns the pending change of an attribute as an `(old, new)` tuple.
+
+    Args:
+        instance (db.Model): A persistent model instance.
+        attribute (str): Name of the attribute.
+
+    Returns:
+        tuple: The old and new values, or None if the attribute is unchanged.
+    """
+    history = inspect(instance).attrs[attribute].history
+    if not history.has_changes():
+        return None
+    old = history.deleted[0] if history.deleted else None
+    new = history.added[0] if history.added else None
+    return old, new
+
+def _identity_lookup(model, record_id):
+    """
+    Returns the instance with the given ID if the session already holds it in a usable state.
+
+    The session, and with it the identity map, lives for one request, so repeated lookups of the same row
+    within a request are served without a round-trip.
+    """
+    key = inspect(model).identity_key_from_primary_key((record_id,))
+    instance = db.session.identity_map.get(key)
+    if instance is None:
+        return None
+    state = inspect(instance)
+    if state.expired or state.deleted or instance in db.session.deleted:
+        return None
+    return instance
+
+def _get_by_id(model, record_id):
+    """
+    Looks a row up by primary key through the identity map, then through a cached lambda statement.
+
+    `lambda_stmt` caches the constructed statement and its compiled SQL per model, so repeated lookups only
+    bind a new ID instead of rebuilding and recompiling the query.
+    """
+    instance = _identity_lookup(model, record_id)
+    if instance is not None:
+        return instance
+    stmt = lambda_stmt(lambda: select(model).where(model.id == record_id))
+    return db.session.execute(stmt).scalars().first()
+
+def _get_many(model, record_ids):
+    """
+    Looks many rows up by primary key in one round-trip, skipping those already in the identity map.
+
+    Returns the instances found, in the order of `record_ids`; unknown and duplicate IDs are dropped.
+    """
+    record_ids = list(dict.fromkeys(record_ids))
+    found = {}
+    missing = []
+    for record_id in record_ids:
+        instance = _identity_lookup(model, record_id)
+        if instance is not None:
+            found[record_id] = instance
+        else:
+            missing.append(record_id)
+    if missing:
+        stmt = lambda_stmt(lambda: select(model).where(model.id.in_(missing)))
+        for instance in db.session.execute(stmt).scalars():
+            found[instance.id] = instance
+    return [found[record_id] for record_id in record_ids if record_id in found]
+
+def _parse_fields(model, value):
+    """
+    Parses a comma-separated `?fields=` value against the whitelist of a model.
+
+    Args:
+        model (db.Model): The model class, which lists its selectable columns in `FIELDS`.
+        value (str): The raw query string value, or None for every field.
+
+    Returns:
+        tuple: The requested field names in request order, without duplicates.
+
+    Raises:
+        ValueError: If the value is empty or names a field outside the whitelist.
+    """
+    if value is None:
+        return model.FIELDS
+    fields = tuple(dict.fromkeys(field.strip() for field in value.split(',') if field.strip()))
+    if not fields:
+        raise ValueError('No fields requested.')
+    unknown = [field for field in fields if field not in model.FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}.")
+    return fields
+
+def _query_fields(model, fields):
+    """
+    Builds a query selecting only the given columns of a model.
+    """
+    return db.session.query(*(getattr(model, field) for field in fields))
+
+def _track_summary(metric, old, new):
+    """
+    Moves one row of the `stats_summary` counts from bucket `old` to bucket `new`.
+
+    Either bucket may be None for inserts and deletes. Does nothing unless `STATS_SUMMARY_TABLE` is enabled.
+    """
+    _track_summaries(metric, [(old, new)])
+
+def _track_summaries(metric, changes):
+    """
+    Applies many `(old, new)` moves of `_track_summary` with one adjustment per bucket.
+    """
+    if not STATS_SUMMARY_TABLE:
+        return
+    deltas = Counter()
+    for old, new in changes:
+        if old == new:
+            continue
+        if old is not None:
+            deltas[old] -= 1
+        if new is not None:
+            deltas[new] += 1
+    for bucket, delta in deltas.items():
+        if delta:
+            StatsSummary.adjust(metric, bucket, delta)
+
+def _bump_row_version(instance):
+    """
+    Increments the `version` of a modified row and drops its cached JSON fragments in this process.
+
+    The increment is `SET version = version + 1` in the flushed UPDATE, so concurrent writes to the row each
+    get a version of their own instead of both writing the one they read. Other processes notice the new version
+    when they next read the row.
+    """
+    if db.session.is_modified(instance):
+        instance.version = type(instance).version + 1
+        forget_fragment(instance.__tablename__, instance.id)
+
+def _count_rows(model, strategy=None):
+    """
+    Counts the rows of a model's table with the given strategy.
+
+    - `exact` runs `SELECT COUNT(*)`.
+    - `cached` reads the row counter the write methods keep in `stats_summary` when `STATS_SUMMARY_TABLE` is
+      enabled, one primary-key lookup. Without the table, or before `rebuild_stats_summary()` has seeded the
+      counter of an existing table, it serves the last exact count until a write method commits to the table
+      (see `cache.py`) or `STATS_CACHE_TTL` expires.
+    - `estimate` reads `pg_class.reltuples`, which `ANALYZE` and autovacuum keep up to date, summed over the
+      partitions of a partitioned table. It falls back to an exact count on other databases and for tables
+      that were never analyzed.
+
+    Args:
+        model (db.Model): The model class.
+        strategy (str, optional): One of `COUNT_STRATEGIES`. Defaults to `TOTAL_COUNT_STRATEGY`.
+
+    Returns:
+        int: The number of rows.
+
+    Raises:
+        ValueError: If the strategy is unknown.
+    """
+    strategy = strategy or TOTAL_COUNT_STRATEGY
+    if strategy not in COUNT_STRATEGIES:
+        raise ValueError(f'Unknown count strategy: {strategy}.')
+    table = model.__tablename__
+
+    if strategy == 'cached':
+        if STATS_SUMMARY_TABLE:
+            count = db.session.query(StatsSummary.count) \
+                .filter(StatsSummary.metric == ROW_COUNT_METRIC, StatsSummary.bucket == table) \
+                .scalar()
+            if count is not None:
+                return count
+        return cached(f'count:{table}', (table,), lambda: _count_rows(model, 'exact'), STATS_CACHE_TTL)
+    if strategy == 'estimate' and db.engine.dialect.name == 'postgresql':
+        relkind, estimate = db.session.execute(
+            text('SELECT relkind, reltuples::bigint FROM pg_class WHERE oid = CAST(:table AS regclass)'),
+            {'table': table}
+        ).one()
+        if relkind == 'p':
+            # A partitioned table has no statistics of its own; add up its leaf partitions (see partitioning.py).
+            # pg_inherits instead of pg_partition_tree(), which needs PostgreSQL 12
+            estimate = db.session.execute(
+                text('WITH RECURSIVE tree(relid) AS ('
+                     ' SELECT CAST(CAST(:table AS regclass) AS oid)'
+                     ' UNION ALL SELECT i.inhrelid FROM pg_inherits i JOIN tree t ON i.inhparent = t.relid)'
+                     ' SELECT (CASE WHEN min(c.reltuples) < 0 THEN -1 ELSE sum(c.reltuples) END)::bigint'
+                     " FROM tree t JOIN pg_class c ON c.oid = t.relid WHERE c.relkind <> 'p'"),
+                {'table': table}
+            ).scalar()
+        # -1 (PostgreSQL 14+) or 0 with pages unknown means the table was never analyzed
+        if estimate and estimate > 0:
+            return estimate
+    return db.session.query(func.count(model.id)).scalar()
+
 class Movie(db.Model):
     """
     Represents the `movies` table in the database.
@@ -58,42 +351,142 @@ class Movie(db.Model):
         id (int): Primary key of the movie.
         title (str): Title of the movie.
         release_year (int): Release year of the movie.
+        version (int): Row version, incremented by `update()` and `update_many()` (see `_bump_row_version`).
         actors (relationship): Relationship to the `Actor` model.
 
     Methods:
         insert(): Adds the current instance to the database.
+        insert_many(movies): Adds many movies with a single flush.
         update(): Commits changes for the current instance to the database.
+        update_many(movies): Commits changes for many movies with a single flush.
         delete(): Removes the current instance from the database.
         format(): Returns a dictionary representation of the movie.
         get_by_id(record_id): Retrieves a movie by its ID.
+        get_many(record_ids): Retrieves many movies by ID in one query.
         get_all(): Retrieves all movies from the database.
+        count(strategy): Counts the movies exactly, from the cache or from planner statistics.
+        count_by_release_year(): Counts movies per release year.
+        parse_fields(value): Validates a `?fields=` value against `FIELDS`.
+        get_fields_by_id(record_id, fields): Retrieves the given columns of a movie.
     """
     __tablename__ = 'movies'
 
+    # Columns that may be requested with `?fields=`
+    FIELDS = ('id', 'title', 'release_year')
+
     id = Column(Integer(), primary_key=True)
     title = Column(String())
     release_year = Column(Integer())
-    actors = db.relationship('Actor', backref='movies')
+    version = Column(Integer(), nullable=False, default=1, server_default='1')
+    # The database applies MOVIE_DELETE_POLICY to the actors; the ORM neither loads nor updates them on delete
+    actors = db.relationship('Actor', backref='movies', passive_deletes='all')
 
-    def insert(self):
+    def insert(self, commit=False):
         """
         Adds the current movie instance to the database and commits the transaction.
+
+        Inside a unit of work the insert is only flushed and committed with the rest of the request.
+
+        Args:
+            commit (bool, optional): Commit immediately even inside a unit of work. Defaults to False.
         """
         db.session.add(self)
-        db.session.commit()
+        _track_summary('movies_by_release_year', None, self.release_year)
+        _track_summary(ROW_COUNT_METRIC, None, 'movies')
+        _save(commit, 'movies')
 
-    def update(self):
+    @classmethod
+    def insert_many(cls, movies, commit=False):
+        """
+        Adds many movie instances to the database with a single flush.
+
+        Inside a unit of work the inserts are only flushed and committed with the rest of the request.
+
+        Args:
+            movies (list): The `Movie` instances to add.
+            commit (bool, optional): Commit immediately even inside a unit of work. Defaults to False.
+        """
+        db.session.add_all(movies)
+        _track_summaries('movies_by_release_year', [(None, movie.release_year) for movie in movies])
+        _track_summaries(ROW_COUNT_METRIC, [(None, 'movies')] * len(movies))
+        _save(commit, 'movies')
+
+    def update(self, commit=False):
         """
         Commits changes for the current movie instance to the database.
+
+        Inside a unit of work the changes are only flushed and committed with the rest of the request.
+
+        Args:
+            commit (bool, optional): Commit immediately even inside a unit of work. Defaults to False.
         """
-        db.session.commit()
+        change = _attribute_change(self, 'release_year')
+        if change:
+            _track_summary('movies_by_release_year', *change)
+        _bump_row_version(self)
+        _save(commit, 'movies')
 
-    def delete(self):
+    @classmethod
+    def update_many(cls, movies, commit=False):
+        """
+        Commits changes for many movie instances to the database with a single flush.
+
+        Inside a unit of work the changes are only flushed and committed with the rest of the request.
+
+        Args:
+            movies (list): The changed `Movie` instances.
+            commit (bool, optional): Commit immediately even inside a unit of work. Defaults to False.
+        """
+        changes = [_attribute_change(movie, 'release_year') for movie in movies]
+        _track_summaries('movies_by_release_year', [change for change in changes if change])
+        for movie in movies:
+            _bump_row_version(movie)
+        _save(commit, 'movies')
+
+    def delete(self, commit=False):
         """
         Removes the current movie instance from the database and commits the transaction.
+
+        The movie's actors are handled by the `ON DELETE` rule of `actors.movie_id` (see `MOVIE_DELETE_POLICY`)
+        in the same statement, without loading them as objects; only their IDs and genders are read, to count
+        them and drop their cached JSON fragments. Under the `restrict` policy the delete fails while the movie
+        still has actors.
+
+        Inside a unit of work the delete is only flushed and committed with the rest of the request.
+
+        Args:
+            commit (bool, optional): Commit immediately even inside a unit of work. Defaults to False.
+
+        Returns:
+            int: The number of actors deleted along with the movie. On PostgreSQL the movie row is locked
+            before counting, so actors inserted concurrently wait for the delete; SQLite has no row locks and
+            the count may miss an actor another connection adds between the count and the delete.
         """
+        if db.engine.dialect.name == 'postgresql':
+            # Inserting an actor takes a KEY SHARE lock on its movie, which conflicts with this one
+            db.session.query(Movie.id).filter(Movie.id == self.id).with_for_update().scalar()
+        cast = db.session.query(Actor.id, Actor.gender).filter(Actor.movie_id == self.id).all()
+        # Actors of this movie the session already holds; read from the state so nothing is loaded
+        held = [
+            instance for instance in db.session.identity_map.values()
+            if isinstance(instance, Actor) and inspect(instance).dict.get('movie_id') == self.id
+        ]
+        # The summary adjustments autoflush; track them before the delete so the row can still be read
+        _track_summary('movies_by_release_year', self.release_year, None)
+        _track_summary(ROW_COUNT_METRIC, 'movies', None)
+        forget_fragment('movies', self.id)
+        if MOVIE_DELETE_POLICY == 'cascade':
+            _track_summaries('actors_by_gender', [(gender, None) for actor_id, gender in cast])
+            _track_summaries(ROW_COUNT_METRIC, [('actors', None)] * len(cast))
         db.session.delete(self)
-        db.session.commit()
+        _save(commit, 'movies', 'actors')
+        # A new actor may reuse the ID of a deleted one (SQLite), so none of their JSON may be served again
+        for actor_id, gender in cast:
+            forget_fragment('actors', actor_id)
+        # The database deleted them behind the ORM's back; later lookups must not find them in the identity map
+        for actor in held:
+            db.session.expunge(actor)
+        return len(cast)
 
     def format(self):
         """
@@ -119,7 +512,20 @@ class Movie(db.Model):
         Returns:
             Movie: The movie instance if found, or None if not found.
         """
-        return db.session.query(cls).get(record_id)
+        return _get_by_id(cls, record_id)
+
+    @classmethod
+    def get_many(cls, record_ids):
+        """
+        Retrieves many movie records by ID in a single query.
+
+        Args:
+            record_ids (list): The IDs of the movies to retrieve.
+
+        Returns:
+            list: The movie instances found, in the order of `record_ids`. Unknown IDs are skipped.
+        """
+        return _get_many(cls, record_ids)
 
     @classmethod
     def get_all(cls):
@@ -131,6 +537,72 @@ class Movie(db.Model):
         """
         return db.session.query(cls).all()
 
+    @classmethod
+    def count(cls, strategy=None):
+        """
+        Counts the movies with `exact`, `cached` or `estimate` (see `_count_rows`).
+
+        Args:
+            strategy (str, optional): The counting strategy. Defaults to `TOTAL_COUNT_STRATEGY`.
+
+        Returns:
+            int: The number of movies.
+
+        Raises:
+            ValueError: If the strategy is unknown.
+        """
+        return _count_rows(cls, strategy)
+
+    @classmethod
+    def parse_fields(cls, value):
+        """
+        Validates a comma-separated `?fields=` value against `FIELDS`.
+
+        Args:
+            value (str): The raw value, or None for every field.
+
+        Returns:
+            tuple: The requested field names.
+
+        Raises:
+            ValueError: If a field is not selectable.
+        """
+        return _parse_fields(cls, value)
+
+    @classmethod
+    def get_fields_by_id(cls, record_id, fields):
+        """
+        Retrieves the given columns of a movie by its ID, selecting nothing else in SQL.
+
+        Args:
+            record_id (int): The ID of the movie to retrieve.
+            fields (tuple): Field names returned by `parse_fields`.
+
+        Returns:
+            dict: The movie's fields, or None if not found.
+        """
+        row = _query_fields(cls, fields).filter(cls.id == record_id).first()
+        return dict(zip(fields, row)) if row else None
+
+    @classmethod
+    def count_by_release_year(cls):
+        """
+        Counts movies per release year.
+
+        Reads the `stats_summary` table when `STATS_SUMMARY_TABLE` is enabled, otherwise aggregates with `GROUP BY`.
+
+        Returns:
+            list: A list of `(release_year, count)` tuples ordered by release year.
+        """
+        if STATS_SUMMARY_TABLE:
+            counts = StatsSummary.read('movies_by_release_year')
+            return sorted((int(year), count) for year, count in counts.items())
+        return db.session.query(cls.release_year, func.count(cls.id)) \
+            .filter(cls.release_year.isnot(None)) \
+            .group_by(cls.release_year) \
+            .order_by(cls.release_year) \
+            .all()
+
 class Actor(db.Model):
     """
     Represents the `actors` table in the database.
@@ -141,17 +613,31 @@ class Actor(db.Model):
         age (int): Age of the actor.
         gender (str): Gender of the actor.
         movie_id (int): Foreign key referencing the `movies` table.
+        version (int): Row version, incremented by `update()` and `update_many()` (see `_bump_row_version`).
 
     Methods:
         insert(): Adds the current instance to the database.
+        insert_many(actors): Adds many actors with a single flush.
         update(): Commits changes for the current instance to the database.
+        update_many(actors): Commits changes for many actors with a single flush.
         delete(): Removes the current instance from the database.
         format(): Returns a dictionary representation of the actor.
         get_by_id(record_id): Retrieves an actor by its ID.
+        get_many(record_ids): Retrieves many actors by ID in one query.
         get_all(): Retrieves all actors from the database.
+        count(strategy): Counts the actors exactly, from the cache or from planner statistics.
+        get_actors_by_movie_id(movie_id): Retrieves the actors of a movie.
+        get_actors_by_movie_ids(movie_ids): Retrieves the actors of many movies in one query.
+        count_by_gender(): Counts actors per gender.
+        age_distribution_by_movie(): Computes the age distribution per movie.
+        parse_fields(value): Validates a `?fields=` value against `FIELDS`.
+        get_fields_by_id(record_id, fields): Retrieves the given columns of an actor.
     """
     __tablename__ = 'actors'
 
+    # Columns that may be requested with `?fields=`
+    FIELDS = ('id', 'name', 'age', 'gender', 'movie_id')
+
     id = Column(Integer(), primary_key=True)
     name = Column(String())
     age = Column(Integer())
@@ -159,29 +645,88 @@ class Actor(db.Model):
 
     movie_id = db.Column(
         db.Integer,
-        db.ForeignKey('movies.id'),
+        db.ForeignKey('movies.id', ondelete=MOVIE_DELETE_POLICY.upper()),
         nullable=False
     )
+    version = Column(Integer(), nullable=False, default=1, server_default='1')
 
-    def insert(self):
+    def insert(self, commit=False):
         """
         Adds the current actor instance to the database and commits the transaction.
+
+        Inside a unit of work the insert is only flushed and committed with the rest of the request.
+
+        Args:
+            commit (bool, optional): Commit immediately even inside a unit of work. Defaults to False.
         """
         db.session.add(self)
-        db.session.commit()
+        _track_summary('actors_by_gender', None, self.gender)
+        _track_summary(ROW_COUNT_METRIC, None, 'actors')
+        _save(commit, 'actors')
 
-    def update(self):
+    @classmethod
+    def insert_many(cls, actors, commit=False):
+        """
+        Adds many actor instances to the database with a single flush.
+
+        Inside a unit of work the inserts are only flushed and committed with the rest of the request.
+
+        Args:
+            actors (list): The `Actor` instances to add.
+            commit (bool, optional): Commit immediately even inside a unit of work. Defaults to False.
+        """
+        db.session.add_all(actors)
+        _track_summaries('actors_by_gender', [(None, actor.gender) for actor in actors])
+        _track_summaries(ROW_COUNT_METRIC, [(None, 'actors')] * len(actors))
+        _save(commit, 'actors')
+
+    def update(self, commit=False):
         """
         Commits changes for the current actor instance to the database.
+
+        Inside a unit of work the changes are only flushed and committed with the rest of the request.
+
+        Args:
+            commit (bool, optional): Commit immediately even inside a unit of work. Defaults to False.
         """
-        db.session.commit()
+        change = _attribute_change(self, 'gender')
+        if change:
+            _track_summary('actors_by_gender', *change)
+        _bump_row_version(self)
+        _save(commit, 'actors')
 
-    def delete(self):
+    @classmethod
+    def update_many(cls, actors, commit=False):
+        """
+        Commits changes for many actor instances to the database with a single flush.
+
+        Inside a unit of work the changes are only flushed and committed with the rest of the request.
+
+        Args:
+            actors (list): The changed `Actor` instances.
+            commit (bool, optional): Commit immediately even inside a unit of work. Defaults to False.
+        """
+        changes = [_attribute_change(actor, 'gender') for actor in actors]
+        _track_summaries('actors_by_gender', [change for change in changes if change])
+        for actor in actors:
+            _bump_row_version(actor)
+        _save(commit, 'actors')
+
+    def delete(self, commit=False):
         """
         Removes the current actor instance from the database and commits the transaction.
+
+        Inside a unit of work the delete is only flushed and committed with the rest of the request.
+
+        Args:
+            commit (bool, optional): Commit immediately even inside a unit of work. Defaults to False.
         """
+        # The summary adjustments autoflush; track them before the delete so the row can still be read
+        _track_summary('actors_by_gender', self.gender, None)
+        _track_summary(ROW_COUNT_METRIC, 'actors', None)
+        forget_fragment('actors', self.id)
         db.session.delete(self)
-        db.session.commit()
+        _save(commit, 'actors')
 
     def format(self):
         """
@@ -209,7 +754,20 @@ class Actor(db.Model):
         Returns:
             Actor: The actor instance if found, or None if not found.
         """
-        return db.session.query(cls).get(record_id)
+        return _get_by_id(cls, record_id)
+
+    @classmethod
+    def get_many(cls, record_ids):
+        """
+        Retrieves many actor records by ID in a single query.
+
+        Args:
+            record_ids (list): The IDs of the actors to retrieve.
+
+        Returns:
+            list: The actor instances found, in the order of `record_ids`. Unknown IDs are skipped.
+        """
+        return _get_many(cls, record_ids)
 
     @classmethod
     def get_all(cls):
@@ -220,7 +778,54 @@ class Actor(db.Model):
             list: A list of all actor instances.
         """
         return db.session.query(cls).all()
-    
+
+    @classmethod
+    def count(cls, strategy=None):
+        """
+        Counts the actors with `exact`, `cached` or `estimate` (see `_count_rows`).
+
+        Args:
+            strategy (str, optional): The counting strategy. Defaults to `TOTAL_COUNT_STRATEGY`.
+
+        Returns:
+            int: The number of actors.
+
+        Raises:
+            ValueError: If the strategy is unknown.
+        """
+        return _count_rows(cls, strategy)
+
+    @classmethod
+    def parse_fields(cls, value):
+        """
+        Validates a comma-separated `?fields=` value against `FIELDS`.
+
+        Args:
+            value (str): The raw value, or None for every field.
+
+        Returns:
+            tuple: The requested field names.
+
+        Raises:
+            ValueError: If a field is not selectable.
+        """
+        return _parse_fields(cls, value)
+
+    @classmethod
+    def get_fields_by_id(cls, record_id, fields):
+        """
+        Retrieves the given columns of an actor by its ID, selecting nothing else in SQL.
+
+        Args:
+            record_id (int): The ID of the actor to retrieve.
+            fields (tuple): Field names returned by `parse_fields`.
+
+        Returns:
+            dict: The actor's fields, or None if not found.
+        """
+        row = _query_fields(cls, fields).filter(cls.id == record_id).first()
+        return dict(zip(fields, row)) if row else None
+
     @classmethod
     def get_actors_by_movie_id(cls, movie_id):
         """
@@ -229,7 +834,258 @@ class Actor(db.Model):
         Args:
             movie_id (int): The ID of the movie to filter actors by.
 
+        When `actors` is partitioned (see `partitioning.py`), only the movie's partition is read.
+
         Returns:
             list: A list of Actor instances associated with the given movie_id.
         """
         return db.session.query(cls).filter(cls.movie_id == movie_id).all()
+
+    @classmethod
+    def get_actors_by_movie_ids(cls, movie_ids):
+        """
+        Retrieves the actors of many movies in one query.
+
+        Args:
+            movie_ids (list): The IDs of the movies.
+
+        Returns:
+            dict: A mapping of movie ID to its Actor instances ordered by ID. Movies without actors are left out.
+        """
+        casts = {}
+        if not movie_ids:
+            return casts
+        actors = db.session.query(cls).filter(cls.movie_id.in_(set(movie_ids))).order_by(cls.id)
+        for actor in actors:
+            casts.setdefault(actor.movie_id, []).append(actor)
+        return casts
+
+    @classmethod
+    def count_by_gender(cls):
+        """
+        Counts actors per gender.
+
+        Reads the `stats_summary` table when `STATS_SUMMARY_TABLE` is enabled, otherwise aggregates with `GROUP BY`.
+
+        Returns:
+            list: A list of `(gender, count)` tuples ordered by gender.
+        """
+        if STATS_SUMMARY_TABLE:
+            return sorted(StatsSummary.read('actors_by_gender').items())
+        return db.session.query(cls.gender, func.count(cls.id)) \
+            .filter(cls.gender.isnot(None)) \
+            .group_by(cls.gender) \
+            .order_by(cls.gender) \
+            .all()
+
+    @classmethod
+    def age_distribution_by_movie(cls):
+        """
+        Computes the age distribution of the cast of every movie.
+
+        Returns:
+            list: A list of `(movie_id, count, min_age, max_age, avg_age)` tuples ordered by movie_id.
+        """
+        return db.session.query(
+            cls.movie_id,
+            func.count(cls.id),
+            func.min(cls.age),
+            func.max(cls.age),
+            func.avg(cls.age)
+        ).group_by(cls.movie_id).order_by(cls.movie_id).all()
+
+class StatsSummary(db.Model):
+    """
+    Represents the `stats_summary` table in the database.
+
+    Holds one counter per `(metric, bucket)` pair, e.g. `('actors_by_gender', 'female')`. The counters are
+    adjusted by the `Movie` and `Actor` write methods inside the same transaction when `STATS_SUMMARY_TABLE`
+    is enabled, so reading an aggregate is a single primary-key range scan instead of a `GROUP BY`.
+
+    Attributes:
+        metric (str): Name of the aggregate.
+        bucket (str): Group key within the aggregate.
+        count (int): Number of rows in the group.
+    """
+    __tablename__ = 'stats_summary'
+
+    metric = Column(String(), primary_key=True)
+    bucket = Column(String(), primary_key=True)
+    count = Column(Integer(), nullable=False, default=0)
+
+    @classmethod
+    def adjust(cls, metric, bucket, delta):
+        """
+        Adds `delta` to the counter of a bucket, creating the row if needed. Does not commit.
+
+        Runs as one `INSERT ... ON CONFLICT (metric, bucket) DO UPDATE`, so two transactions creating the same
+        bucket at once both add to it instead of one of them failing on the primary key.
+
+        Args:
+            metric (str): Name of the aggregate.
+            bucket: Group key; stored as a string.
+            delta (int): Amount to add.
+        """
+        dialect = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+        statement = dialect.insert(cls.__table__).values(metric=metric, bucket=str(bucket), count=delta)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=[cls.metric, cls.bucket],
+            set_={'count': cls.count + statement.excluded.count}
+        ))
+
+    @classmethod
+    def read(cls, metric):
+        """
+        Reads the non-empty counters of an aggregate.
+
+        Args:
+            metric (str): Name of the aggregate.
+
+        Returns:
+            dict: A mapping of bucket to count.
+        """
+        rows = db.session.query(cls.bucket, cls.count) \
+            .filter(cls.metric == metric, cls.count > 0) \
+            .all()
+        return dict(rows)
+
+class Job(db.Model):
+    """
+    Represents the `jobs` table in the database, the queue of bulk writes accepted with `?async=true`.
+
+    A job holds the submitted items and the progress of the worker applying them (see `jobs.py`). `processed`
+    and `failed` are committed together with the rows of every batch, so they always match what is in the
+    database, and a job taken over from a stopped worker resumes after the last committed batch.
+
+    Attributes:
+        id (int): Primary key of the job.
+        kind (str): What the job does, e.g. `create_actors`.
+        permission (str): Permission required to submit the job and to read its status.
+        items (list): The submitted objects; deferred, so status reads do not load them.
+        status (str): `queued`, `running`, `succeeded` or `failed`.
+        total (int): Number of items.
+        processed (int): Items handled so far, applied or rejected.
+        failed (int): Items rejected, e.g. for a missing field.
+        errors (list): The first rejected items as `{"index": ..., "message": ...}`.
+        error (str): Why the job failed, if it did.
+        attempts (int): Number of times a worker claimed the job.
+        created_at, started_at, heartbeat_at, finished_at (datetime): UTC timestamps; `heartbeat_at` is
+            refreshed with every batch.
+    """
+    __tablename__ = 'jobs'
+
+    id = Column(Integer(), primary_key=True)
+    kind = Column(String(), nullable=False)
+    permission = Column(String(), nullable=False)
+    items = deferred(Column(JSON(), nullable=False))
+    status = Column(String(), nullable=False, default='queued', index=True)
+    total = Column(Integer(), nullable=False)
+    processed = Column(Integer(), nullable=False, default=0)
+    failed = Column(Integer(), nullable=False, default=0)
+    errors = Column(JSON(), nullable=False, default=list)
+    error = Column(String())
+    attempts = Column(Integer(), nullable=False, default=0)
+    created_at = Column(DateTime(), nullable=False, default=datetime.utcnow)
+    started_at = Column(DateTime())
+    heartbeat_at = Column(DateTime())
+    finished_at = Column(DateTime())
+
+    def format(self):
+        """
+        Returns a dictionary representation of the job's progress.
+
+        `rows_per_second` is the number of processed items divided by the time since the job started, up to
+        now or to when it finished.
+        """
+        elapsed = 0
+        if self.started_at is not None:
+            elapsed = ((self.finished_at or datetime.utcnow()) - self.started_at).total_seconds()
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'total': self.total,
+            'processed': self.processed,
+            'failed': self.failed,
+            'progress': round(self.processed / self.total, 4) if self.total else 1.0,
+            'rows_per_second': round(self.processed / elapsed, 1) if elapsed > 0 else 0.0,
+            'attempts': self.attempts,
+            'errors': self.errors,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+    @classmethod
+    def get_by_id(cls, record_id):
+        """
+        Retrieves a job by its ID.
+
+        Args:
+            record_id (int): The ID of the job to retrieve.
+
+        Returns:
+            Job: The job instance if found, or None if not found.
+        """
+        return _get_by_id(cls, record_id)
+
+    @classmethod
+    def claim(cls, stale_before):
+        """
+        Marks the oldest queued job as running and commits, so no other worker picks it up.
+
+        A running job whose heartbeat is older than `stale_before` counts as queued again: the worker applying
+        it has stopped. On PostgreSQL concurrent workers skip the row another one is claiming; everywhere the
+        conditional `UPDATE` lets only one of them win.
+
+        Args:
+            stale_before (datetime): Heartbeats before this UTC time belong to stopped workers.
+
+        Returns:
+            Job: The claimed job, or None if there is none or another worker claimed it first.
+        """
+        claimable = or_(cls.status == 'queued', and_(cls.status == 'running', cls.heartbeat_at < stale_before))
+        job_id = db.session.query(cls.id) \
+            .filter(claimable) \
+            .order_by(cls.id) \
+            .limit(1) \
+            .with_for_update(skip_locked=True) \
+            .scalar()
+        claimed = 0
+        if job_id is not None:
+            now = datetime.utcnow()
+            claimed = db.session.query(cls) \
+                .filter(cls.id == job_id, claimable) \
+                .update({
+                    cls.status: 'running',
+                    cls.attempts: cls.attempts + 1,
+                    cls.started_at: func.coalesce(cls.started_at, now),
+                    cls.heartbeat_at: now
+                }, synchronize_session=False)
+        db.session.commit()
+        return db.session.get(cls, job_id) if claimed else None
+
+def rebuild_stats_summary():
+    """
+    Recomputes the `stats_summary` table, including the row counters, from the `movies` and `actors` tables
+    and commits.
+
+    Run this once after enabling `STATS_SUMMARY_TABLE` on an existing database.
+    """
+    db.session.query(StatsSummary).delete()
+    year_counts = db.session.query(Movie.release_year, func.count(Movie.id)) \
+        .filter(Movie.release_year.isnot(None)) \
+        .group_by(Movie.release_year)
+    gender_counts = db.session.query(Actor.gender, func.count(Actor.id)) \
+        .filter(Actor.gender.isnot(None)) \
+        .group_by(Actor.gender)
+    for year, count in year_counts:
+        db.session.add(StatsSummary(metric='movies_by_release_year', bucket=str(year), count=count))
+    for gender, count in gender_counts:
+        db.session.add(StatsSummary(metric='actors_by_gender', bucket=gender, count=count))
+    for model in (Movie, Actor):
+        count = db.session.query(func.count(model.id)).scalar()
+        db.session.add(StatsSummary(metric=ROW_COUNT_METRIC, bucket=model.__tablename__, count=count))
+    db.session.commit()
+    bump_table_version('movies', 'actors')
@@ -0,0 +1,208 @@
+"""
+PostgreSQL Partitioning of the Actors Table
+
+`actors` is the largest table and grows without bound. With `ACTORS_PARTITIONING` set, migration 0004 turns it
+into a declaratively partitioned table keyed by `movie_id`:
+
+    - `hash`: `ACTORS_HASH_PARTITIONS` partitions `actors_p<remainder>`, each holding the movies whose hash
+      leaves that remainder. Rows spread evenly, so every partition and its indexes stay `1/n` of the table.
+    - `range`: one partition `actors_p<k>` per `ACTORS_RANGE_SIZE` movie IDs, `[k * size, (k + 1) * size)`, and
+      `actors_default` for IDs past the last range. New movies have the highest IDs, so inserts, updates and
+      deletes gather in the newest partitions; older partitions stop changing and vacuum has nothing to do there.
+
+The columns, the ID sequence and the `ON DELETE` rule of `actors.movie_id` are kept. PostgreSQL requires the
+partition key in every unique constraint, so the primary key becomes `(id, movie_id)`; IDs still come from the
+one sequence and stay unique. A partitioned index on `movie_id` gives each partition an index of its own.
+
+Queries on `movie_id = ...` are pruned to a single partition: `Actor.get_actors_by_movie_id`, the cast count in
+`Movie.delete()` and the `ON DELETE` rule deleting a movie's actors. `movie_id IN (...)` reads only the
+partitions holding those IDs. Lookups by `id` alone probe the primary key of every partition, and the list route
+reads them all, as before.
+
+Range partitions are not added automatically. Actors of movies past the last range go to `actors_default`,
+which queries are still pruned to. `python manage.py extend_partitions` adds ranges up to the newest movie and
+moves their rows out of the default partition.
+
+Converting copies every row while holding an exclusive lock on `actors`, so plan for the downtime on large
+tables. To switch layouts, downgrade to revision 0003 and upgrade again with the new settings.
+
+Functions:
+    partition_method(connection, table='actors'): Returns how a table is partitioned, or None.
+    partition_clause(method): Returns the `PARTITION BY` clause of a layout.
+    create_partitions(connection, table, method, partitions, range_size, upto): Creates the partitions of a table.
+    partition_actors(connection, method, partitions, range_size): Converts `actors` to a partitioned table.
+    unpartition_actors(connection): Converts `actors` back to a single table.
+    extend_actor_partitions(connection, range_size, ahead=1): Adds range partitions up to the newest movie.
+"""
+from sqlalchemy import text
+
+METHODS = ('hash', 'range')
+# pg_partitioned_table.partstrat
+STRATEGIES = {'h': 'hash', 'r': 'range', 'l': 'list'}
+# pg_constraint.confdeltype
+DELETE_RULES = {'a': 'NO ACTION', 'r': 'RESTRICT', 'c': 'CASCADE', 'n': 'SET NULL', 'd': 'SET DEFAULT'}
+# Names used by `create_tables()` and migration 0001
+PRIMARY_KEY = 'actors_pkey'
+FOREIGN_KEY = 'actors_movie_id_fkey'
+MOVIE_INDEX = 'ix_actors_movie_id'
+
+
+def partition_method(connection, table='actors'):
+    """
+    Returns how a table is partitioned: `hash`, `range`, `list`, or None if it is not partitioned.
+    """
+    strategy = connection.execute(
+        text('SELECT partstrat FROM pg_partitioned_table WHERE partrelid = CAST(:table AS regclass)'),
+        {'table': table}
+    ).scalar()
+    return STRATEGIES.get(strategy)
+
+
+def partition_clause(method):
+    """
+    Returns the `PARTITION BY` clause partitioning a table by `movie_id` with `hash` or `range`.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Partitioning method must be 'hash' or 'range', not {method!r}")
+    return f'PARTITION BY {method.upper()} (movie_id)'
+
+
+def _partition_names(connection, table):
+    rows = connection.execute(
+        text('SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+             'WHERE i.inhparent = CAST(:table AS regclass)'),
+        {'table': table}
+    )
+    return {name for name, in rows}
+
+
+def create_partitions(connection, table, method, partitions, range_size, upto):
+    """
+    Creates the partitions of a table created with `partition_clause(method)`.
+
+    Args:
+        connection (Connection): A connection inside a transaction.
+        table (str): Name of the partitioned table; partitions are named `<table>_p<n>`.
+        method (str): `hash` or `range`.
+        partitions (int): Number of hash partitions.
+        range_size (int): Movie IDs per range partition.
+        upto (int): Highest movie ID the range partitions must cover; a default partition takes the rest.
+    """
+    if method == 'hash':
+        for remainder in range(partitions):
+            connection.exec_driver_sql(
+                f'CREATE TABLE {table}_p{remainder} PARTITION OF {table} '
+                f'FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})'
+            )
+        return
+    for index in range(upto // range_size + 1):
+        connection.exec_driver_sql(
+            f'CREATE TABLE {table}_p{index} PARTITION OF {table} '
+            f'FOR VALUES FROM ({index * range_size}) TO ({(index + 1) * range_size})'
+        )
+    connection.exec_driver_sql(f'CREATE TABLE {table}_default PARTITION OF {table} DEFAULT')
+
+
+def _rebuild_actors(connection, clause, primary_key, create=None):
+    """
+    Replaces `actors` by a copy created with `clause` (empty or a `PARTITION BY` clause), keeping the columns,
+    the sequence and the `ON DELETE` rule. `create` is called to add partitions before the rows are copied.
+    """
+    sequence = connection.execute(text("SELECT pg_get_serial_sequence('actors', 'id')")).scalar()
+    rule = connection.execute(
+        text("SELECT confdeltype FROM pg_constraint WHERE conrelid = 'actors'::regclass AND contype = 'f'")
+    ).scalar()
+    for statement in (
+        'ALTER TABLE actors RENAME TO actors_previous',
+        f'ALTER INDEX {PRIMARY_KEY} RENAME TO actors_previous_pkey',
+        # The sequence belongs to the old column and would be dropped with it
+        f'ALTER SEQUENCE {sequence} OWNED BY NONE',
+        f'CREATE TABLE actors (LIKE actors_previous INCLUDING DEFAULTS INCLUDING CONSTRAINTS) {clause}'
+    ):
+        connection.exec_driver_sql(statement)
+    if create is not None:
+        create()
+    # Keys and indexes are built once after the copy instead of row by row
+    for statement in (
+        'INSERT INTO actors SELECT * FROM actors_previous',
+        'DROP TABLE actors_previous',
+        f'ALTER TABLE actors ADD CONSTRAINT {PRIMARY_KEY} PRIMARY KEY ({primary_key})',
+        f'ALTER TABLE actors ADD CONSTRAINT {FOREIGN_KEY} FOREIGN KEY (movie_id) REFERENCES movies (id) '
+        f'ON DELETE {DELETE_RULES.get(rule, "NO ACTION")}',
+        f'ALTER SEQUENCE {sequence} OWNED BY actors.id',
+        'ANALYZE actors'
+    ):
+        connection.exec_driver_sql(statement)
+
+
+def partition_actors(connection, method, partitions, range_size):
+    """
+    Converts `actors` into a table partitioned by `movie_id`, copying its rows.
+
+    Range partitions cover the existing movies and one more range.
+
+    Args:
+        connection (Connection): A connection inside a transaction.
+        method (str): `hash` or `range`.
+        partitions (int): Number of hash partitions.
+        range_size (int): Movie IDs per range partition.
+    """
+    newest = connection.execute(text('SELECT COALESCE(MAX(id), 0) FROM movies')).scalar()
+
+    def create():
+        create_partitions(connection, 'actors', method, partitions, range_size, newest + range_size)
+
+    _rebuild_actors(connection, partition_clause(method), 'id, movie_id', create)
+    connection.exec_driver_sql(f'CREATE INDEX {MOVIE_INDEX} ON actors (movie_id)')
+
+
+def unpartition_actors(connection):
+    """
+    Converts a partitioned `actors` table back into a single table with the schema of `create_tables()`.
+
+    Args:
+        connection (Connection): A connection inside a transaction.
+    """
+    _rebuild_actors(connection, '', 'id')
+
+
+def extend_actor_partitions(connection, range_size, ahead=1):
+    """
+    Adds range partitions of `actors` up to the newest movie plus `ahead` ranges.
+
+    Rows of the new ranges that went to `actors_default` in the meantime are moved to their partition.
+
+    Args:
+        connection (Connection): A connection inside a transaction.
+        range_size (int): Movie IDs per range partition, as used when partitioning.
+        ahead (int, optional): Empty ranges to create past the newest movie. Defaults to 1.
+
+    Returns:
+        list: The names of the partitions created.
+
+    Raises:
+        ValueError: If `actors` is not partitioned by range.
+    """
+    if partition_method(connection) != 'range':
+        raise ValueError('The actors table is not partitioned by range.')
+    newest = connection.execute(text('SELECT COALESCE(MAX(id), 0) FROM movies')).scalar()
+    existing = _partition_names(connection, 'actors')
+    created = []
+    for index in range((newest + ahead * range_size) // range_size + 1):
+        name = f'actors_p{index}'
+        if name in existing:
+            continue
+        bounds = {'low': index * range_size, 'high': (index + 1) * range_size}
+        # A range cannot be attached while the default partition holds rows of it
+        connection.exec_driver_sql('CREATE TEMPORARY TABLE actors_moving (LIKE actors)')
+        connection.execute(text(
+            'WITH moved AS (DELETE FROM actors_default WHERE movie_id >= :low AND movie_id < :high RETURNING *) '
+            'INSERT INTO actors_moving SELECT * FROM moved'
+        ), bounds)
+        connection.exec_driver_sql(
+            f"CREATE TABLE {name} PARTITION OF actors FOR VALUES FROM ({bounds['low']}) TO ({bounds['high']})"
+        )
+        connection.exec_driver_sql('INSERT INTO actors SELECT * FROM actors_moving')
+        connection.exec_driver_sql('DROP TABLE actors_moving')
+        created.append(name)
+    return created
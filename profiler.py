@@ -0,0 +1,226 @@
+"""
+On-Demand Request Profiler for a Flask Application
+
+This module profiles individual live requests on demand. A request is profiled only when all of the
+following hold:
+
+    1. `PROFILER_ENABLED` is set (environment or app config),
+    2. it carries the `X-Profile` header,
+    3. its bearer token grants the `profile:requests` permission.
+
+The profiler runs from `before_request` to `after_request`, so it covers `requires_auth`, the model query,
+`format` and `jsonify`. The value of the `X-Profile` header selects the profiler:
+
+    cprofile: deterministic `cProfile` run stored as a `.prof` file (open with `snakeviz` or `pstats`).
+    sampling: stack sampling every `PROFILER_SAMPLE_INTERVAL` seconds, stored as collapsed-stack
+        `.folded` text ready for `flamegraph.pl` or speedscope.
+
+Any other value uses `PROFILER_MODE`. The name of the stored profile is returned in the `X-Profile-Id`
+response header; only the newest `PROFILER_KEEP` profiles are kept in `PROFILER_DIR`.
+
+When the profiler is disabled no hook and no route is registered, so requests pay nothing for it.
+
+Endpoints (only when enabled, both requiring `profile:requests`):
+    GET /profiles: Lists the stored profiles, newest first.
+    GET /profiles/<name>: Downloads a stored profile.
+
+Functions:
+    register_profiler(app): Installs the profiling hooks and routes if the profiler is enabled.
+"""
+import cProfile
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from flask import request, jsonify, send_from_directory, g
+from auth import AuthError, requires_auth, get_token_auth_header, verify_decode_jwt
+from settings import (
+    PROFILER_ENABLED, PROFILER_DIR, PROFILER_MODE, PROFILER_SAMPLE_INTERVAL, PROFILER_KEEP
+)
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_PERMISSION = 'profile:requests'
+PROFILE_EXTENSIONS = {'cprofile': '.prof', 'sampling': '.folded'}
+
+
+class SamplingProfiler:
+    """
+    Samples the call stack of one thread at a fixed interval and aggregates it into collapsed stacks.
+
+    Args:
+        thread_id (int): Identifier of the thread to sample, as returned by `threading.get_ident()`.
+        interval (float): Seconds between samples.
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def dump_stats(self, path):
+        """
+        Writes the samples in collapsed-stack format, one `frame;frame;frame count` line per stack.
+        """
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+def _has_profile_permission():
+    """
+    Returns True if the request's bearer token grants `profile:requests`. Invalid tokens are ignored here;
+    the view's own `requires_auth` reports them.
+    """
+    try:
+        payload = verify_decode_jwt(get_token_auth_header())
+    except AuthError:
+        return False
+    return PROFILE_PERMISSION in payload.get('permissions', [])
+
+
+def _profile_name(mode):
+    path = re.sub(r'[^A-Za-z0-9]+', '_', request.path).strip('_') or 'root'
+    timestamp = time.strftime('%Y%m%dT%H%M%S')
+    return f'{timestamp}-{request.method}-{path}-{uuid.uuid4().hex[:8]}{PROFILE_EXTENSIONS[mode]}'
+
+
+def _list_profiles(directory):
+    """
+    Returns the stored profiles as `(name, size, mtime)` tuples, newest first.
+    """
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in os.listdir(directory):
+        if os.path.splitext(name)[1] in PROFILE_EXTENSIONS.values():
+            stat = os.stat(os.path.join(directory, name))
+            profiles.append((name, stat.st_size, stat.st_mtime))
+    return sorted(profiles, key=lambda profile: profile[2], reverse=True)
+
+
+def _prune_profiles(directory, keep):
+    for name, size, mtime in _list_profiles(directory)[keep:]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            pass
+
+
+def register_profiler(app):
+    """
+    Installs the profiling hooks and the `/profiles` routes when the profiler is enabled.
+
+    Settings are read from `app.config` first, falling back to `settings.py`.
+
+    Args:
+        app (Flask): The Flask application instance.
+    """
+    if not app.config.get('PROFILER_ENABLED', PROFILER_ENABLED):
+        return
+
+    directory = os.path.abspath(app.config.get('PROFILER_DIR', PROFILER_DIR))
+    default_mode = app.config.get('PROFILER_MODE', PROFILER_MODE)
+    interval = app.config.get('PROFILER_SAMPLE_INTERVAL', PROFILER_SAMPLE_INTERVAL)
+    keep = app.config.get('PROFILER_KEEP', PROFILER_KEEP)
+    os.makedirs(directory, exist_ok=True)
+
+    @app.before_request
+    def start_profiler():
+        mode = request.headers.get(PROFILE_HEADER)
+        if mode is None or not _has_profile_permission():
+            return
+        if mode not in PROFILE_EXTENSIONS:
+            mode = default_mode
+
+        if mode == 'sampling':
+            profiler = SamplingProfiler(threading.get_ident(), interval)
+            profiler.start()
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        g.profiler = (mode, profiler)
+
+    @app.after_request
+    def stop_profiler(response):
+        mode, profiler = g.pop('profiler', (None, None))
+        if profiler is None:
+            return response
+
+        if mode == 'sampling':
+            profiler.stop()
+        else:
+            profiler.disable()
+
+        name = _profile_name(mode)
+        profiler.dump_stats(os.path.join(directory, name))
+        _prune_profiles(directory, keep)
+        response.headers['X-Profile-Id'] = name
+        return response
+
+    @app.teardown_request
+    def discard_profiler(error):
+        # after_request is skipped when an exception propagates; never leave a sampler thread running
+        mode, profiler = g.pop('profiler', (None, None))
+        if mode == 'sampling':
+            profiler.stop()
+        elif profiler is not None:
+            profiler.disable()
+
+    @app.route('/profiles', methods=['GET'])
+    @requires_auth(PROFILE_PERMISSION)
+    def get_profiles(payload):
+        """
+        List the stored profiles, newest first.
+
+        Args:
+            payload (dict): Decoded JWT payload.
+
+        Returns:
+            JSON response containing the name, size and creation time of every profile.
+        """
+        return jsonify({
+            'success': True,
+            'profiles': [
+                {'name': name, 'size': size, 'created': mtime}
+                for name, size, mtime in _list_profiles(directory)
+            ]
+        })
+
+    @app.route('/profiles/<name>', methods=['GET'])
+    @requires_auth(PROFILE_PERMISSION)
+    def download_profile(payload, name):
+        """
+        Download a stored profile.
+
+        Args:
+            payload (dict): Decoded JWT payload.
+            name (str): Name of the profile, as listed by GET /profiles.
+
+        Returns:
+            The profile file, or 404 if not found.
+        """
+        return send_from_directory(directory, name, as_attachment=True)
@@ -1,6 +1,81 @@
-from flask import Flask, request, abort, jsonify
+from flask import Flask, request, abort, jsonify, url_for
 from auth import requires_auth
-from models import Actor, Movie
+from models import Actor, Movie, Job, COUNT_STRATEGIES
+from cache import cached
+from coalescing import coalesced
+from batch import parse_operations, run_batch
+from snapshot import current_snapshot
+from fragments import list_response, encoded_list_response
+from jobs import parse_items, enqueue
+from settings import STATS_CACHE_TTL, TOTAL_COUNT_STRATEGY, BATCH_MAX_OPERATIONS
+
+
+def _is_async():
+    """
+    Returns True if the request asks for its writes to be queued as a job with `?async=true`.
+    """
+    return request.args.get('async', '').lower() == 'true'
+
+
+def _enqueue_create(kind):
+    """
+    Queues the objects of a create request as a job of the given kind.
+    """
+    try:
+        items = parse_items(request.get_json(force=True, silent=True))
+    except ValueError:
+        abort(400)
+    return _accepted(enqueue(kind, items))
+
+
+def _enqueue_update(kind, record_id):
+    """
+    Queues the body of an update request for the row `record_id` as a job of the given kind.
+    """
+    body = request.get_json(force=True, silent=True)
+    if not isinstance(body, dict):
+        abort(400)
+    return _accepted(enqueue(kind, [dict(body, id=record_id)]))
+
+
+def _accepted(job):
+    """
+    Answers 202 with the ID of a queued job and where to poll its status.
+    """
+    response = jsonify({
+        'success': True,
+        'job_id': job.id,
+        'total': job.total
+    })
+    response.status_code = 202
+    response.headers['Location'] = url_for('get_job', job_id=job.id)
+    return response
+
+
+def _count_strategy():
+    """
+    Returns the `?count=` strategy of a list request.
+
+    Raises:
+        ValueError: If the strategy is unknown.
+    """
+    strategy = request.args.get('count') or TOTAL_COUNT_STRATEGY
+    if strategy not in COUNT_STRATEGIES:
+        raise ValueError(f'Unknown count strategy: {strategy}.')
+    return strategy
+
+
+def _snapshot_list(table, name, fields):
+    """
+    Lists the rows of a snapshot table, sending the JSON stored in the snapshot when every field is requested.
+    """
+    if fields == table.fields:
+        return encoded_list_response(name, table.encoded_rows())
+    return jsonify({
+        'success': True,
+        name: table.rows(fields)
+    })
+
 
 def register_routes(app):
     """
@@ -27,6 +102,7 @@ def register_routes(app):
     ### Movies ###
     @app.route('/movies', methods=['GET'])
     @requires_auth('view:movies')
+    @coalesced
     def get_movies(payload):
         """
         Retrieve all movies.
@@ -34,19 +110,71 @@ def register_routes(app):
         Args:
             payload (dict): Decoded JWT payload.
 
+        Query Parameters:
+            fields (str, optional): Comma-separated columns to return, e.g. `id,title`. Defaults to every column.
+            count (str, optional): How to compute `X-Total-Count`: `exact`, `cached` or `estimate`.
+                Defaults to `TOTAL_COUNT_STRATEGY`.
+
         Returns:
-            JSON response containing a list of movies or 404 if no movies found.
+            JSON response containing a list of movies with the total number of movies in the `X-Total-Count`
+            header, or 400 if a requested field or the count strategy is unknown. When served from the
+            shared snapshot (see `snapshot.py`), the count is exact for the snapshot whatever the strategy.
         """
-        movies = Movie.get_all()
+        snapshot = current_snapshot()
+        try:
+            fields = Movie.parse_fields(request.args.get('fields'))
+            strategy = _count_strategy()
+        except ValueError:
+            abort(400)
+
+        if snapshot is not None:
+            table = snapshot.table('movies')
+            total = table.size
+            response = _snapshot_list(table, 'movies', fields)
+        else:
+            total = Movie.count(strategy)
+            # Joins the cached JSON of unchanged rows instead of encoding every row again
+            response = list_response(Movie, 'movies', fields)
 
         # if not movies:
         #     abort(404)
 
-        movies = [movie.format() for movie in movies]
+        response.headers['X-Total-Count'] = str(total)
+        return response
+
+    @app.route('/movies/<int:movie_id>', methods=['GET'])
+    @requires_auth('view:movies')
+    def get_movie(payload, movie_id):
+        """
+        Retrieve a movie by ID.
+
+        Args:
+            payload (dict): Decoded JWT payload.
+            movie_id (int): ID of the movie to retrieve.
+
+        Query Parameters:
+            fields (str, optional): Comma-separated columns to return, e.g. `id,title`. Defaults to every column.
+
+        Returns:
+            JSON response containing the movie, 400 if a requested field is unknown or 404 if not found.
+        """
+        try:
+            fields = Movie.parse_fields(request.args.get('fields'))
+        except ValueError:
+            abort(400)
+
+        snapshot = current_snapshot()
+        if snapshot is not None:
+            movie = snapshot.table('movies').get(movie_id, fields)
+        else:
+            movie = Movie.get_fields_by_id(movie_id, fields)
+
+        if movie is None:
+            abort(404)
 
         return jsonify({
             'success': True,
-            'movies': movies
+            'movie': movie
         })
     
     @app.route('/movies/new', methods=['POST'])
@@ -58,9 +186,16 @@ def register_routes(app):
         Args:
             payload (dict): Decoded JWT payload.
 
+        Query Parameters:
+            async (str, optional): `true` queues the body, an object or a list of objects, as a job (see `jobs.py`)
+                and responds with 202 and the job ID, or 400 if the body is malformed.
+
         Returns:
             JSON response with the ID of the created movie or 422 if input is invalid.
         """
+        if _is_async():
+            return _enqueue_create('create_movies')
+
         body = request.get_json()
 
         title = body.get('title')
@@ -95,17 +230,19 @@ def register_routes(app):
             movie_id (int): ID of the movie to be deleted.
 
         Returns:
-            JSON response indicating success or 404 if movie not found.
+            JSON response with the number of actors deleted along with the movie, 404 if the movie is not found
+            or 422 if the delete policy is `restrict` and the movie still has actors.
         """
         movie = Movie.get_by_id(movie_id)
 
         if movie:
             try:
-                movie.delete()
+                actors_deleted = movie.delete()
 
                 return jsonify({
                     'success': True,
-                    'deleted': movie_id
+                    'deleted': movie_id,
+                    'actors_deleted': actors_deleted
                 })
             except Exception as e:
                 print(e)
@@ -124,9 +261,16 @@ def register_routes(app):
             payload (dict): Decoded JWT payload.
             movie_id (int): ID of the movie to be updated.
 
+        Query Parameters:
+            async (str, optional): `true` queues the update as a job (see `jobs.py`) and responds with 202 and the
+                job ID; an unknown ID is then reported in the job's errors.
+
         Returns:
             JSON response with the updated movie ID or 404 if not found.
         """
+        if _is_async():
+            return _enqueue_update('update_movies', movie_id)
+
         movie = Movie.get_by_id(movie_id)
 
         if movie:
@@ -157,6 +301,7 @@ def register_routes(app):
     ### Actors ###
     @app.route('/actors', methods=['GET'])
     @requires_auth('view:actors')
+    @coalesced
     def get_actors(payload):
         """
         Retrieve all actors.
@@ -164,19 +309,71 @@ def register_routes(app):
         Args:
             payload (dict): Decoded JWT payload.
 
+        Query Parameters:
+            fields (str, optional): Comma-separated columns to return, e.g. `id,name`. Defaults to every column.
+            count (str, optional): How to compute `X-Total-Count`: `exact`, `cached` or `estimate`.
+                Defaults to `TOTAL_COUNT_STRATEGY`.
+
         Returns:
-            JSON response containing a list of actors or 404 if no actors found.
+            JSON response containing a list of actors with the total number of actors in the `X-Total-Count`
+            header, or 400 if a requested field or the count strategy is unknown. When served from the
+            shared snapshot (see `snapshot.py`), the count is exact for the snapshot whatever the strategy.
         """
-        actors = Actor.get_all()
+        snapshot = current_snapshot()
+        try:
+            fields = Actor.parse_fields(request.args.get('fields'))
+            strategy = _count_strategy()
+        except ValueError:
+            abort(400)
+
+        if snapshot is not None:
+            table = snapshot.table('actors')
+            total = table.size
+            response = _snapshot_list(table, 'actors', fields)
+        else:
+            total = Actor.count(strategy)
+            # Joins the cached JSON of unchanged rows instead of encoding every row again
+            response = list_response(Actor, 'actors', fields)
 
         # if not actors:
         #     abort(404)
 
-        actors = [actor.format() for actor in actors]
+        response.headers['X-Total-Count'] = str(total)
+        return response
+
+    @app.route('/actors/<int:actor_id>', methods=['GET'])
+    @requires_auth('view:actors')
+    def get_actor(payload, actor_id):
+        """
+        Retrieve an actor by ID.
+
+        Args:
+            payload (dict): Decoded JWT payload.
+            actor_id (int): ID of the actor to retrieve.
+
+        Query Parameters:
+            fields (str, optional): Comma-separated columns to return, e.g. `id,name`. Defaults to every column.
+
+        Returns:
+            JSON response containing the actor, 400 if a requested field is unknown or 404 if not found.
+        """
+        try:
+            fields = Actor.parse_fields(request.args.get('fields'))
+        except ValueError:
+            abort(400)
+
+        snapshot = current_snapshot()
+        if snapshot is not None:
+            actor = snapshot.table('actors').get(actor_id, fields)
+        else:
+            actor = Actor.get_fields_by_id(actor_id, fields)
+
+        if actor is None:
+            abort(404)
 
         return jsonify({
             'success': True,
-            'actors': actors
+            'actor': actor
         })
     
     @app.route('/actors/new', methods=['POST'])
@@ -188,9 +385,16 @@ def register_routes(app):
         Args:
             payload (dict): Decoded JWT payload.
 
+        Query Parameters:
+            async (str, optional): `true` queues the body, an object or a list of objects, as a job (see `jobs.py`)
+                and responds with 202 and the job ID, or 400 if the body is malformed.
+
         Returns:
             JSON response with the ID of the created actor or 422 if input is invalid.
         """
+        if _is_async():
+            return _enqueue_create('create_actors')
+
         body = request.get_json(force=True)
 
         name = body.get('name')
@@ -252,10 +456,17 @@ def register_routes(app):
             payload (dict): Decoded JWT payload.
             actor_id (int): ID of the actor to be updated.
 
+        Query Parameters:
+            async (str, optional): `true` queues the update as a job (see `jobs.py`) and responds with 202 and the
+                job ID; an unknown ID is then reported in the job's errors.
+
         Returns:
             JSON response with the updated actor ID or 404 if not found.
         """
-        actor = Actor.query.get(actor_id)
+        if _is_async():
+            return _enqueue_update('update_actors', actor_id)
+
+        actor = Actor.get_by_id(actor_id)
 
         if actor:
             try:
@@ -288,3 +499,128 @@ def register_routes(app):
 
         else:
             abort(404)
+
+    ### Statistics ###
+    @app.route('/stats/actors/gender', methods=['GET'])
+    @requires_auth('view:actors')
+    @coalesced
+    def get_actor_gender_stats(payload):
+        """
+        Count actors per gender.
+
+        Args:
+            payload (dict): Decoded JWT payload.
+
+        Returns:
+            JSON response containing the number of actors for every gender.
+        """
+        counts = cached('stats:actors_by_gender', ('actors',), Actor.count_by_gender, STATS_CACHE_TTL)
+
+        return jsonify({
+            'success': True,
+            'actors_by_gender': [
+                {'gender': gender, 'count': count} for gender, count in counts
+            ]
+        })
+
+    @app.route('/stats/actors/age', methods=['GET'])
+    @requires_auth('view:actors')
+    @coalesced
+    def get_actor_age_stats(payload):
+        """
+        Compute the age distribution of the cast of every movie.
+
+        Args:
+            payload (dict): Decoded JWT payload.
+
+        Returns:
+            JSON response containing the actor count and min, max and average age per movie.
+        """
+        rows = cached('stats:age_by_movie', ('actors',), Actor.age_distribution_by_movie, STATS_CACHE_TTL)
+
+        return jsonify({
+            'success': True,
+            'age_by_movie': [
+                {
+                    'movie_id': movie_id,
+                    'count': count,
+                    'min_age': min_age,
+                    'max_age': max_age,
+                    'avg_age': float(avg_age) if avg_age is not None else None
+                } for movie_id, count, min_age, max_age, avg_age in rows
+            ]
+        })
+
+    @app.route('/stats/movies/release-year', methods=['GET'])
+    @requires_auth('view:movies')
+    @coalesced
+    def get_movie_release_year_stats(payload):
+        """
+        Count movies per release year.
+
+        Args:
+            payload (dict): Decoded JWT payload.
+
+        Returns:
+            JSON response containing the number of movies for every release year.
+        """
+        counts = cached('stats:movies_by_release_year', ('movies',), Movie.count_by_release_year, STATS_CACHE_TTL)
+
+        return jsonify({
+            'success': True,
+            'movies_by_release_year': [
+                {'release_year': year, 'count': count} for year, count in counts
+            ]
+        })
+
+    ### Batch ###
+    @app.route('/batch', methods=['POST'])
+    @requires_auth()
+    def run_batch_operations(payload):
+        """
+        Run several read operations in one request.
+
+        The token is verified once; each operation checks its own permission. See `batch.py` for the operations.
+
+        Args:
+            payload (dict): Decoded JWT payload.
+
+        Returns:
+            JSON response with one result per operation in request order, or 400 if the body is invalid.
+        """
+        try:
+            operations = parse_operations(request.get_json(silent=True), BATCH_MAX_OPERATIONS)
+        except ValueError:
+            abort(400)
+
+        return jsonify({
+            'success': True,
+            'results': run_batch(operations, payload.get('permissions', []), current_snapshot())
+        })
+
+    ### Jobs ###
+    @app.route('/jobs/<int:job_id>', methods=['GET'])
+    @requires_auth()
+    def get_job(payload, job_id):
+        """
+        Report the progress of a job queued with `?async=true`.
+
+        Args:
+            payload (dict): Decoded JWT payload.
+            job_id (int): ID of the job.
+
+        Returns:
+            JSON response with the job's status, progress, rows/sec and rejected items, 404 if not found or 403
+            if the token lacks the permission the job required.
+        """
+        job = Job.get_by_id(job_id)
+
+        if job is None:
+            abort(404)
+        if job.permission not in payload.get('permissions', []):
+            abort(403)
+
+        return jsonify({
+            'success': True,
+            'job': job.format()
+        })
@@ -0,0 +1 @@
+gunicorn -c gunicorn.conf.py app:app
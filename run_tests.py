@@ -0,0 +1,80 @@
+"""
+Parallel Test Runner
+
+Runs the unittest suite across several processes. Every process is a test worker with its own database
+(see `testing.py`) and receives every N-th test of the discovered suite, so workers never share state.
+
+Usage:
+    python run_tests.py            # one worker per CPU core
+    python run_tests.py -j 4       # four workers
+    python run_tests.py -j 1 -v    # serial, verbose
+
+Set `TEST_DATABASE_URL` to run against PostgreSQL, e.g. `postgresql://postgres:1@localhost:5433/casting_test`;
+each worker then uses `casting_test_w<i>`. Without it, every worker uses a SQLite file in the temp directory.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+import unittest
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def _flatten(suite):
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            yield from _flatten(test)
+        else:
+            yield test
+
+
+def run_shard(index, count, verbosity):
+    """
+    Runs every `count`-th discovered test starting at `index`. Returns the process exit code.
+    """
+    sys.path.insert(0, ROOT)
+    suite = unittest.defaultTestLoader.discover(ROOT, pattern='test_*.py', top_level_dir=ROOT)
+    tests = list(_flatten(suite))[index::count]
+    result = unittest.TextTestRunner(verbosity=verbosity).run(unittest.TestSuite(tests))
+    return 0 if result.wasSuccessful() else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('-v', '--verbose', action='store_true')
+    parser.add_argument('--shard', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    verbosity = 2 if args.verbose else 1
+
+    if args.shard:
+        index, count = (int(part) for part in args.shard.split('/'))
+        sys.exit(run_shard(index, count, verbosity))
+
+    started = time.perf_counter()
+    workers = []
+    for index in range(args.jobs):
+        env = dict(os.environ, TEST_WORKER=f'w{index}')
+        command = [sys.executable, __file__, '--shard', f'{index}/{args.jobs}']
+        if args.verbose:
+            command.append('-v')
+        workers.append(subprocess.Popen(
+            command, cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+        ))
+
+    failed = 0
+    for index, worker in enumerate(workers):
+        output, _ = worker.communicate()
+        print(f'--- worker w{index} ---')
+        print(output.rstrip())
+        failed += worker.returncode != 0
+
+    elapsed = time.perf_counter() - started
+    print(f'\n{args.jobs} workers finished in {elapsed:.1f}s, {failed} failed')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
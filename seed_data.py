@@ -0,0 +1,284 @@
+"""
+Synthetic Data Generator for the Casting Database
+
+This module fills the `movies` and `actors` tables with large, realistic-looking datasets for benchmarks
+and load tests. Rows are generated lazily and written in batches, so memory stays flat from thousands to
+hundreds of millions of rows. On PostgreSQL rows are streamed with `COPY`; on other databases they are
+written with batched multi-row `INSERT`s.
+
+The same seed and parameters always generate the same rows. IDs continue after the current maximum, so a
+dataset can be appended to an existing database.
+
+Distributions:
+    cast size: `actors` are spread over the movies following a Zipf law with exponent `cast_skew`
+        (0 gives every movie the same expected cast size; 1 gives a few blockbusters very large casts).
+    age: normal with `age_mean`/`age_std`, clipped to 5..95.
+    gender: weighted mix such as `female=0.48,male=0.48,non-binary=0.04`.
+    title length: uniform number of words between `title_words` bounds.
+    release year: uniform between `release_years` bounds.
+
+Usage:
+    python manage.py seed --movies 1000000 --actors 10000000 --seed 42
+
+Functions:
+    generate_movies(rng, count, first_id, ...): Yields movie rows.
+    generate_actors(rng, count, first_id, ...): Yields actor rows.
+    seed(movies, ...): Generates and writes a dataset.
+"""
+import bisect
+import io
+import itertools
+import math
+import random
+import time
+
+from sqlalchemy import func, text
+from models import db, Movie, Actor, rebuild_stats_summary
+from cache import bump_table_version
+from settings import STATS_SUMMARY_TABLE
+
+TITLE_WORDS = (
+    'the', 'last', 'night', 'city', 'dark', 'river', 'love', 'war', 'story', 'of', 'silent', 'secret',
+    'summer', 'winter', 'house', 'road', 'star', 'dream', 'king', 'queen', 'lost', 'golden', 'shadow',
+    'fire', 'ice', 'storm', 'island', 'garden', 'letter', 'promise', 'escape', 'return', 'hunt', 'song',
+    'empire', 'heart', 'sky', 'ocean', 'mountain', 'stranger', 'edge', 'light', 'glass', 'iron', 'wild'
+)
+FIRST_NAMES = (
+    'Anna', 'Ben', 'Chloe', 'David', 'Elena', 'Farid', 'Grace', 'Hiro', 'Ines', 'Jamal', 'Kate', 'Liam',
+    'Maya', 'Noah', 'Olga', 'Pablo', 'Quinn', 'Rosa', 'Sam', 'Thuy', 'Uma', 'Victor', 'Wen', 'Yara', 'Zoe'
+)
+LAST_NAMES = (
+    'Adams', 'Baker', 'Chen', 'Diaz', 'Evans', 'Fischer', 'Garcia', 'Hughes', 'Ito', 'Jensen', 'Kim', 'Le',
+    'Moreau', 'Nguyen', 'Okafor', 'Patel', 'Rossi', 'Silva', 'Tanaka', 'Usman', 'Weber', 'Young', 'Zhang'
+)
+DEFAULT_GENDER_MIX = 'female=0.48,male=0.48,non-binary=0.04'
+
+
+def parse_gender_mix(value):
+    """
+    Parses a `gender=weight,...` specification.
+
+    Args:
+        value (str): The specification, e.g. `female=0.5,male=0.5`.
+
+    Returns:
+        tuple: The genders and their cumulative weights.
+
+    Raises:
+        ValueError: If the specification is malformed or has no positive weight.
+    """
+    genders = []
+    weights = []
+    for part in value.split(','):
+        gender, weight = part.split('=')
+        genders.append(gender.strip())
+        weights.append(float(weight))
+    cumulative = list(itertools.accumulate(weights))
+    if not genders or cumulative[-1] <= 0:
+        raise ValueError('The gender mix needs at least one positive weight.')
+    return genders, cumulative
+
+
+def _weighted_choice(rng, choices, cumulative):
+    index = bisect.bisect_right(cumulative, rng.random() * cumulative[-1])
+    return choices[min(index, len(choices) - 1)]
+
+
+def _expm1_ratio(x):
+    # (e^x - 1) / x, continuous at 0
+    return math.expm1(x) / x if abs(x) > 1e-8 else 1.0 + x / 2
+
+
+def _log1p_ratio(x):
+    # log(1 + x) / x, continuous at 0
+    return math.log1p(x) / x if abs(x) > 1e-8 else 1.0 - x / 2
+
+
+def _movie_picker(rng, movie_count, first_id, skew):
+    """
+    Returns a function drawing movie IDs, Zipf-distributed with exponent `skew` (uniform when 0).
+
+    Ranks are drawn by rejection-inversion (Hörmann and Derflinger, 1996): a rank is proposed by inverting the
+    integral of the continuous density `x ** -skew` and accepted or redrawn, so no per-movie table is built and
+    memory stays constant however many movies there are. Fewer than 1.2 proposals are needed per draw.
+    """
+    if skew <= 0:
+        return lambda: first_id + rng.randrange(movie_count)
+
+    def density(x):
+        return math.exp(-skew * math.log(x))
+
+    def integral(x):
+        # Antiderivative of `density`: (x ** (1 - skew) - 1) / (1 - skew), or log(x) when skew is 1
+        log_x = math.log(x)
+        return _expm1_ratio((1 - skew) * log_x) * log_x
+
+    def inverse(y):
+        t = max(y * (1 - skew), -1.0)
+        return math.exp(_log1p_ratio(t) * y)
+
+    low = integral(1.5) - 1
+    high = integral(movie_count + 0.5)
+    # Proposals this close to their rank are always accepted
+    shortcut = 2 - inverse(integral(2.5) - density(2))
+
+    def pick():
+        while True:
+            u = high + rng.random() * (low - high)
+            x = inverse(u)
+            rank = min(max(int(x + 0.5), 1), movie_count)
+            if rank - x <= shortcut or u >= integral(rank + 0.5) - density(rank):
+                return first_id + rank - 1
+    return pick
+
+
+def generate_movies(rng, count, first_id, title_words=(1, 4), release_years=(1920, 2025)):
+    """
+    Yields `(id, title, release_year)` rows.
+
+    Args:
+        rng (random.Random): Source of randomness.
+        count (int): Number of movies.
+        first_id (int): ID of the first movie.
+        title_words (tuple, optional): Minimum and maximum number of words in a title.
+        release_years (tuple, optional): First and last release year.
+    """
+    for record_id in range(first_id, first_id + count):
+        words = rng.randint(*title_words)
+        title = ' '.join(rng.choice(TITLE_WORDS) for _ in range(words)).capitalize()
+        yield record_id, title, rng.randint(*release_years)
+
+
+def generate_actors(rng, count, first_id, pick_movie, age_mean=38.0, age_std=12.0,
+                    gender_mix=DEFAULT_GENDER_MIX):
+    """
+    Yields `(id, name, age, gender, movie_id)` rows.
+
+    Args:
+        rng (random.Random): Source of randomness.
+        count (int): Number of actors.
+        first_id (int): ID of the first actor.
+        pick_movie (callable): Zero-argument function returning the movie of the next actor.
+        age_mean (float, optional): Mean of the age distribution.
+        age_std (float, optional): Standard deviation of the age distribution.
+        gender_mix (str, optional): Weighted gender mix, see `parse_gender_mix`.
+    """
+    genders, cumulative = parse_gender_mix(gender_mix)
+    for record_id in range(first_id, first_id + count):
+        name = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+        age = min(95, max(5, int(round(rng.gauss(age_mean, age_std)))))
+        yield record_id, name, age, _weighted_choice(rng, genders, cumulative), pick_movie()
+
+
+def _batches(rows, size):
+    iterator = iter(rows)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+
+
+def _write_rows(table, columns, rows, batch_size, use_copy):
+    """
+    Writes rows to a table, committing after every batch. Returns the number of rows written.
+    """
+    written = 0
+    if use_copy:
+        connection = db.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            sql = f"COPY {table.name} ({', '.join(columns)}) FROM STDIN"
+            for batch in _batches(rows, batch_size):
+                buffer = io.StringIO()
+                for row in batch:
+                    buffer.write('\t'.join(_copy_value(value) for value in row))
+                    buffer.write('\n')
+                buffer.seek(0)
+                cursor.copy_expert(sql, buffer)
+                connection.commit()
+                written += len(batch)
+        finally:
+            connection.close()
+    else:
+        statement = table.insert()
+        for batch in _batches(rows, batch_size):
+            db.session.execute(statement, [dict(zip(columns, row)) for row in batch])
+            db.session.commit()
+            written += len(batch)
+    return written
+
+
+def _reset_sequence(table):
+    # Rows were written with explicit IDs; move the serial sequence past them
+    db.session.execute(text(
+        f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), (SELECT MAX(id) FROM {table.name}))"
+    ))
+    db.session.commit()
+
+
+def seed(movies, actors=None, actors_per_movie=8, cast_skew=1.0, age_mean=38.0, age_std=12.0,
+         gender_mix=DEFAULT_GENDER_MIX, title_words=(1, 4), release_years=(1920, 2025), seed=0,
+         batch_size=10000, use_copy=None, report=print):
+    """
+    Generates a synthetic dataset and writes it to the database.
+
+    Args:
+        movies (int): Number of movies.
+        actors (int, optional): Number of actors. Defaults to `movies * actors_per_movie`.
+        actors_per_movie (int, optional): Average cast size when `actors` is not given.
+        cast_skew (float, optional): Zipf exponent of the cast-size distribution.
+        age_mean (float, optional): Mean actor age.
+        age_std (float, optional): Standard deviation of the actor age.
+        gender_mix (str, optional): Weighted gender mix, see `parse_gender_mix`.
+        title_words (tuple, optional): Minimum and maximum words per title.
+        release_years (tuple, optional): First and last release year.
+        seed (int, optional): Seed of the random generator.
+        batch_size (int, optional): Rows per batch and commit.
+        use_copy (bool, optional): Stream with `COPY`. Defaults to True on PostgreSQL.
+        report (callable, optional): Receives progress messages. Defaults to print.
+
+    Returns:
+        tuple: The numbers of movies and actors written.
+    """
+    if actors is None:
+        actors = movies * actors_per_movie
+    if actors and not movies:
+        raise ValueError('Actors need at least one movie.')
+    postgres = db.engine.dialect.name == 'postgresql'
+    if use_copy is None:
+        use_copy = postgres
+
+    rng = random.Random(seed)
+    first_movie_id = (db.session.query(func.max(Movie.id)).scalar() or 0) + 1
+    first_actor_id = (db.session.query(func.max(Actor.id)).scalar() or 0) + 1
+    db.session.commit()
+
+    started = time.perf_counter()
+    movie_rows = generate_movies(rng, movies, first_movie_id, title_words, release_years)
+    written_movies = _write_rows(Movie.__table__, ('id', 'title', 'release_year'), movie_rows,
+                                 batch_size, use_copy)
+    elapsed = time.perf_counter() - started
+    report(f'movies: {written_movies} rows in {elapsed:.1f}s ({written_movies / max(elapsed, 1e-9):.0f} rows/s)')
+
+    started = time.perf_counter()
+    pick_movie = _movie_picker(rng, movies, first_movie_id, cast_skew) if movies else None
+    actor_rows = generate_actors(rng, actors, first_actor_id, pick_movie, age_mean, age_std, gender_mix)
+    written_actors = _write_rows(Actor.__table__, ('id', 'name', 'age', 'gender', 'movie_id'), actor_rows,
+                                 batch_size, use_copy)
+    elapsed = time.perf_counter() - started
+    report(f'actors: {written_actors} rows in {elapsed:.1f}s ({written_actors / max(elapsed, 1e-9):.0f} rows/s)')
+
+    if postgres:
+        _reset_sequence(Movie.__table__)
+        _reset_sequence(Actor.__table__)
+    if STATS_SUMMARY_TABLE:
+        rebuild_stats_summary()
+    bump_table_version('movies', 'actors')
+    return written_movies, written_actors
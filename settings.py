@@ -1,5 +1,6 @@
 from dotenv import load_dotenv
 import os
+import tempfile
 
 # load .env file
 load_dotenv()
@@ -8,9 +9,76 @@ load_dotenv()
 AUTH0_DOMAIN = os.getenv('AUTH0_DOMAIN')
 API_IDENTIFIER = os.getenv('API_IDENTIFIER')
 ALGORITHMS = os.getenv('ALGORITHMS')
+AUTH0_JWKS_URL = os.getenv('AUTH0_JWKS_URL', f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
 
 DATABASE_URL = os.getenv('DATABASE_URL')
 
+# Aggregate statistics: cache lifetime in seconds and the optional incrementally maintained summary table
+STATS_CACHE_TTL = int(os.getenv('STATS_CACHE_TTL', '60'))
+STATS_SUMMARY_TABLE = os.getenv('STATS_SUMMARY_TABLE', 'false').lower() == 'true'
+
+# On-demand request profiler; see profiler.py. Off unless PROFILER_ENABLED=true
+PROFILER_ENABLED = os.getenv('PROFILER_ENABLED', 'false').lower() == 'true'
+PROFILER_DIR = os.getenv('PROFILER_DIR', 'profiles')
+PROFILER_MODE = os.getenv('PROFILER_MODE', 'cprofile')
+PROFILER_SAMPLE_INTERVAL = float(os.getenv('PROFILER_SAMPLE_INTERVAL', '0.001'))
+PROFILER_KEEP = int(os.getenv('PROFILER_KEEP', '50'))
+
+# Slow-query log; see slow_queries.py. Off unless a threshold is set (0 disables it)
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv('SLOW_QUERY_THRESHOLD_MS', '0'))
+SLOW_QUERY_BUFFER_SIZE = int(os.getenv('SLOW_QUERY_BUFFER_SIZE', '50'))
+SLOW_QUERY_ANALYZE_RATE = float(os.getenv('SLOW_QUERY_ANALYZE_RATE', '0'))
+
+# Commit model writes once per request (unit_of_work.py) instead of once per write method
+UNIT_OF_WORK = os.getenv('UNIT_OF_WORK', 'true').lower() == 'true'
+
+# What deleting a movie does to its actors: 'cascade' deletes them, 'restrict' refuses the delete
+MOVIE_DELETE_POLICY = os.getenv('MOVIE_DELETE_POLICY', 'cascade').lower()
+if MOVIE_DELETE_POLICY not in ('cascade', 'restrict'):
+    raise ValueError(f"MOVIE_DELETE_POLICY must be 'cascade' or 'restrict', not {MOVIE_DELETE_POLICY!r}")
+
+# How the list routes compute X-Total-Count unless the request passes ?count=: 'exact' runs COUNT(*),
+# 'cached' reads the row counter of stats_summary (STATS_SUMMARY_TABLE) or reuses a count until the table is
+# written, 'estimate' reads PostgreSQL's planner statistics
+TOTAL_COUNT_STRATEGY = os.getenv('TOTAL_COUNT_STRATEGY', 'exact').lower()
+if TOTAL_COUNT_STRATEGY not in ('exact', 'cached', 'estimate'):
+    raise ValueError(f"TOTAL_COUNT_STRATEGY must be 'exact', 'cached' or 'estimate', not {TOTAL_COUNT_STRATEGY!r}")
+
+# Let concurrent identical GET requests share one computed response; see coalescing.py
+REQUEST_COALESCING = os.getenv('REQUEST_COALESCING', 'true').lower() == 'true'
+
+# Maximum number of read operations in one POST /batch request
+BATCH_MAX_OPERATIONS = int(os.getenv('BATCH_MAX_OPERATIONS', '50'))
+
+# Serve movie and actor reads from a memory-mapped snapshot shared by all workers; see snapshot.py
+SNAPSHOT_ENABLED = os.getenv('SNAPSHOT_ENABLED', 'false').lower() == 'true'
+SNAPSHOT_PATH = os.getenv('SNAPSHOT_PATH', os.path.join(tempfile.gettempdir(), 'casting-snapshot.bin'))
+SNAPSHOT_REFRESH_INTERVAL = float(os.getenv('SNAPSHOT_REFRESH_INTERVAL', '1'))
+SNAPSHOT_MAX_AGE = float(os.getenv('SNAPSHOT_MAX_AGE', '60'))
+
+# Rows whose encoded JSON is kept for assembling list responses; see fragments.py. Off by default (0): it only
+# beats jsonify while few rows change between reads, and costs more on a cold cache (benchmarks/bench_fragments.py)
+FRAGMENT_CACHE_SIZE = int(os.getenv('FRAGMENT_CACHE_SIZE', '0'))
+
+# Background workers applying writes submitted with ?async=true; see jobs.py. JOB_WORKERS threads run in every
+# app process (0 runs none, e.g. when `python manage.py work` processes apply the jobs instead)
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '1'))
+JOB_BATCH_SIZE = int(os.getenv('JOB_BATCH_SIZE', '500'))
+JOB_MAX_RETRIES = int(os.getenv('JOB_MAX_RETRIES', '3'))
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', '1'))
+# Seconds without progress after which a running job is taken over; must exceed the time one batch takes
+JOB_STALE_AFTER = float(os.getenv('JOB_STALE_AFTER', '300'))
+if JOB_BATCH_SIZE < 1:
+    raise ValueError(f'JOB_BATCH_SIZE must be at least 1, not {JOB_BATCH_SIZE}')
+
+# PostgreSQL layout of the actors table applied by migration 0004; see partitioning.py. 'none' keeps one table,
+# 'hash' splits it into ACTORS_HASH_PARTITIONS partitions by movie_id, 'range' into one per ACTORS_RANGE_SIZE movie IDs
+ACTORS_PARTITIONING = os.getenv('ACTORS_PARTITIONING', 'none').lower()
+if ACTORS_PARTITIONING not in ('none', 'hash', 'range'):
+    raise ValueError(f"ACTORS_PARTITIONING must be 'none', 'hash' or 'range', not {ACTORS_PARTITIONING!r}")
+ACTORS_HASH_PARTITIONS = int(os.getenv('ACTORS_HASH_PARTITIONS', '16'))
+ACTORS_RANGE_SIZE = int(os.getenv('ACTORS_RANGE_SIZE', '100000'))
+
 print(f"AUTH0_DOMAIN {AUTH0_DOMAIN}")
 print(f"API_IDENTIFIER {API_IDENTIFIER}")
 print(f"ALGORITHMS {ALGORITHMS}")
@@ -0,0 +1,231 @@
+"""
+Slow-Query Log with EXPLAIN Capture for a Flask Application
+
+This module hooks the SQLAlchemy engine events of the `db` engine from `models.py` and records every
+statement that runs longer than `SLOW_QUERY_THRESHOLD_MS`, together with its parameters and the route
+that issued it. For `SELECT` statements the query plan is captured in the background on a separate
+connection: `EXPLAIN` normally, `EXPLAIN ANALYZE` for a sampled fraction (`SLOW_QUERY_ANALYZE_RATE`)
+on PostgreSQL. `WITH` statements only get `EXPLAIN`: a CTE may modify data, and `EXPLAIN ANALYZE` would run
+that write a second time. The request that ran the slow statement never waits for the plan.
+
+The log is off by default (`SLOW_QUERY_THRESHOLD_MS=0`); set a threshold to turn it on.
+
+Only the worst `SLOW_QUERY_BUFFER_SIZE` statements are kept, in memory, per process. Every slow
+statement is also logged through the `slow_queries` logger.
+
+Endpoints (requiring `view:slow-queries`):
+    GET /slow-queries: Lists the worst recorded statements, slowest first.
+
+Classes:
+    SlowQueryLog: Bounded buffer of the worst statements and the background EXPLAIN worker.
+
+Functions:
+    register_slow_query_log(app): Attaches the log to the app's engine unless the threshold is 0.
+"""
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from flask import request, jsonify, has_request_context
+from sqlalchemy import event
+from auth import requires_auth
+from models import db
+from settings import SLOW_QUERY_THRESHOLD_MS, SLOW_QUERY_BUFFER_SIZE, SLOW_QUERY_ANALYZE_RATE
+
+logger = logging.getLogger('slow_queries')
+
+# Execution option marking the log's own EXPLAIN statements, so they are not timed themselves
+SKIP_OPTION = 'slow_query_log_skip'
+# Plans waiting to be captured; slow statements beyond this are recorded without a plan
+MAX_PENDING_PLANS = 16
+# Parameter sets of an executemany statement kept in the entry
+MAX_LOGGED_PARAMETER_SETS = 10
+
+
+class SlowQueryLog:
+    """
+    Keeps the worst statements seen by an engine and captures their plans in the background.
+
+    Args:
+        engine (Engine): The SQLAlchemy engine to capture plans with.
+        threshold_ms (float): Statements at least this slow are recorded.
+        size (int): Number of statements to keep.
+        analyze_rate (float): Fraction of plans captured with `EXPLAIN ANALYZE` on PostgreSQL.
+    """
+
+    def __init__(self, engine, threshold_ms, size, analyze_rate):
+        self.engine = engine
+        self.threshold = threshold_ms / 1000.0
+        self.size = size
+        self.analyze_rate = analyze_rate
+
+        self._heap = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='slow-query-explain')
+        self._pending = set()
+
+    def attach(self):
+        """
+        Registers the timing listeners on the engine.
+        """
+        event.listen(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(self.engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def detach(self):
+        """
+        Removes the timing listeners from the engine.
+        """
+        event.remove(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.remove(self.engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # Kept on the statement's execution context, which is discarded with it even if the statement fails
+        context._slow_query_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_slow_query_start', None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        if elapsed < self.threshold or conn.get_execution_options().get(SKIP_OPTION):
+            return
+        self.record(statement, parameters, elapsed, executemany)
+
+    def record(self, statement, parameters, elapsed, executemany=False):
+        """
+        Records a slow statement and schedules the capture of its plan.
+
+        Args:
+            statement (str): The SQL as sent to the driver.
+            parameters: The driver parameters.
+            elapsed (float): Execution time in seconds.
+            executemany (bool, optional): Whether the statement ran once per parameter set.
+        """
+        route = None
+        if has_request_context():
+            route = f'{request.method} {request.path}'
+
+        entry = {
+            'duration_ms': round(elapsed * 1000, 3),
+            'statement': statement,
+            # An executemany list may hold thousands of sets; only the first few are kept
+            'parameters': repr(parameters[:MAX_LOGGED_PARAMETER_SETS] if executemany else parameters)[:1000],
+            'route': route,
+            'timestamp': time.time(),
+            'plan': None,
+            'analyzed': False
+        }
+        logger.warning('Slow query (%.1f ms) from %s: %s %s',
+                       entry['duration_ms'], route, statement, entry['parameters'])
+
+        with self._lock:
+            item = (elapsed, next(self._counter), entry)
+            if len(self._heap) < self.size:
+                heapq.heappush(self._heap, item)
+            elif elapsed > self._heap[0][0]:
+                heapq.heapreplace(self._heap, item)
+            else:
+                return
+            explainable = (
+                not executemany
+                and statement.lstrip().upper().startswith(('SELECT', 'WITH'))
+                and len(self._pending) < MAX_PENDING_PLANS
+            )
+            if explainable:
+                future = self._executor.submit(self._explain, entry, statement, parameters)
+                self._pending.add(future)
+                future.add_done_callback(self._pending.discard)
+
+    def _explain(self, entry, statement, parameters):
+        postgres = self.engine.dialect.name == 'postgresql'
+        # ANALYZE executes the statement; only a plain SELECT is known not to write
+        analyze = (
+            postgres
+            and statement.lstrip().upper().startswith('SELECT')
+            and random.random() < self.analyze_rate
+        )
+        if analyze:
+            prefix = 'EXPLAIN ANALYZE '
+        elif postgres:
+            prefix = 'EXPLAIN '
+        else:
+            prefix = 'EXPLAIN QUERY PLAN '
+
+        try:
+            with self.engine.connect() as conn:
+                conn = conn.execution_options(**{SKIP_OPTION: True})
+                rows = conn.exec_driver_sql(prefix + statement, parameters).fetchall()
+        except Exception as e:
+            entry['plan'] = f'EXPLAIN failed: {e}'
+            return
+        entry['plan'] = '\n'.join(str(row[-1]) for row in rows)
+        entry['analyzed'] = analyze
+
+    def worst(self):
+        """
+        Returns the recorded statements, slowest first.
+
+        Returns:
+            list: A list of dictionaries with the duration, statement, parameters, route and plan.
+        """
+        with self._lock:
+            items = sorted(self._heap, reverse=True)
+        return [dict(entry) for elapsed, seq, entry in items]
+
+    def drain(self, timeout=None):
+        """
+        Waits until every scheduled plan has been captured.
+
+        Args:
+            timeout (float, optional): Maximum number of seconds to wait.
+        """
+        wait(list(self._pending), timeout=timeout)
+
+
+def register_slow_query_log(app):
+    """
+    Attaches a `SlowQueryLog` to the app's engine and registers the `/slow-queries` route.
+
+    Settings are read from `app.config` first, falling back to `settings.py`. A threshold of 0 disables
+    the log entirely. The log is available as `app.extensions['slow_query_log']`.
+
+    Args:
+        app (Flask): The Flask application instance.
+    """
+    threshold_ms = app.config.get('SLOW_QUERY_THRESHOLD_MS', SLOW_QUERY_THRESHOLD_MS)
+    if not threshold_ms:
+        return
+
+    with app.app_context():
+        engine = db.engine
+    slow_query_log = SlowQueryLog(
+        engine,
+        threshold_ms,
+        app.config.get('SLOW_QUERY_BUFFER_SIZE', SLOW_QUERY_BUFFER_SIZE),
+        app.config.get('SLOW_QUERY_ANALYZE_RATE', SLOW_QUERY_ANALYZE_RATE)
+    )
+    slow_query_log.attach()
+    app.extensions['slow_query_log'] = slow_query_log
+
+    @app.route('/slow-queries', methods=['GET'])
+    @requires_auth('view:slow-queries')
+    def get_slow_queries(payload):
+        """
+        List the slowest statements recorded by this process.
+
+        Args:
+            payload (dict): Decoded JWT payload.
+
+        Returns:
+            JSON response containing the worst statements, slowest first.
+        """
+        return jsonify({
+            'success': True,
+            'threshold_ms': threshold_ms,
+            'queries': slow_query_log.worst()
+        })
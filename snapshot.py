@@ -0,0 +1,529 @@
+"""
+Shared Memory-Mapped Snapshot of the Catalog
+
+With `SNAPSHOT_ENABLED=true`, reads of movies and actors are served from a snapshot file instead of the database.
+The list and detail routes and `POST /batch` then run no query at all. The snapshot stores both tables
+column by column, sorted by ID:
+    - integer columns are arrays of 64-bit integers, with `INT_NULL` standing in for NULL,
+    - string columns are an array of byte offsets, a NULL flag per row and one UTF-8 blob,
+    - the columns in `GROUP_FIELDS` also get an index: their values sorted, and the row positions in that order,
+    - every row is also stored as JSON with all its fields, encoded like `fragments.py` encodes rows and joined
+      with commas in ID order.
+
+Every worker maps the file read-only and reads the arrays in place through typed `memoryview`s. The pages live
+once in the operating system's page cache and are shared by all workers, so memory does not grow with the
+worker count. Detail reads are a binary search over the ID column, and casts a binary search over the index of
+`movie_id`. Listing every field of a table copies the stored JSON into the response without touching the rows.
+
+One worker per host holds an exclusive lock on `<SNAPSHOT_PATH>.lock` and rebuilds the snapshot. A rebuild
+happens when a write committed through the model methods of any worker on the host touches `<SNAPSHOT_PATH>.dirty`,
+and in any case once the snapshot is older than `SNAPSHOT_MAX_AGE`, which picks up writes from other hosts or
+made outside the application. The new snapshot is written to a temporary file and renamed over the old one.
+Workers check for a new file at most every `SNAPSHOT_REFRESH_INTERVAL` seconds. Reads may therefore lag writes
+by about that interval plus the rebuild time. If the worker holding the lock exits, another one takes over.
+
+Classes:
+    Snapshot: A mapped snapshot file.
+    SnapshotTable: Column access to one table of a snapshot.
+    SnapshotStore: Per-process handle that follows the newest snapshot file.
+    SnapshotRefresher: Rebuilds the snapshot in the worker holding the lock.
+
+Functions:
+    build_snapshot(path): Writes a snapshot of both tables from the database.
+    register_snapshot(app): Enables snapshot reads for the app if `SNAPSHOT_ENABLED` is set.
+    current_snapshot(): Returns the snapshot of the current app, or None to read from the database.
+"""
+import bisect
+import json
+import logging
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+from array import array
+
+try:
+    import fcntl
+except ImportError:
+    # Without file locks (Windows) every process refreshes its own snapshot
+    fcntl = None
+
+from flask import current_app
+from sqlalchemy import select
+from cache import add_version_listener
+from fragments import row_encoder
+from models import db, Movie, Actor
+from settings import SNAPSHOT_ENABLED, SNAPSHOT_PATH, SNAPSHOT_REFRESH_INTERVAL, SNAPSHOT_MAX_AGE
+
+logger = logging.getLogger('snapshot')
+
+MAGIC = b'CASTSNP2'
+MODELS = (Movie, Actor)
+TABLES = tuple(model.__tablename__ for model in MODELS)
+# Integer columns `SnapshotTable.group` selects rows by
+GROUP_FIELDS = {'actors': ('movie_id',)}
+# Stored in integer columns in place of NULL
+INT_NULL = -2 ** 63
+# Rows fetched and written per step of `build_snapshot`
+BUILD_BATCH_SIZE = 1000
+
+
+def build_snapshot(path):
+    """
+    Reads the `FIELDS` of every movie and actor and writes them to a new snapshot file at `path`.
+
+    Runs in an app context: rows are encoded as JSON with the app's settings. Rows are streamed from the database
+    `BUILD_BATCH_SIZE` at a time and every array is appended to its own temporary file next to `path`, so memory
+    stays flat with the table size; only the `GROUP_FIELDS` columns are held in memory, to sort their index.
+
+    Args:
+        path (str): Destination of the snapshot. It is replaced atomically.
+
+    Returns:
+        dict: The number of rows written per table.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    # (spool, location) in file order; locations are filled in once every section is written
+    sections = []
+
+    def section():
+        spool = tempfile.TemporaryFile(dir=directory)
+        location = {}
+        sections.append((spool, location))
+        return spool, location
+
+    tables = {}
+    try:
+        encoder = row_encoder()
+        for model in MODELS:
+            tables[model.__tablename__] = _build_table(model, section, encoder)
+
+        offset = 0
+        for spool, location in sections:
+            location.update(offset=offset, length=spool.tell())
+            # Keep every array 8-byte aligned
+            offset += location['length'] + -location['length'] % 8
+
+        header = json.dumps({'built_at': time.time(), 'tables': tables}).encode('utf-8')
+        header += b' ' * (-len(header) % 8)
+        temporary = f'{path}.{os.getpid()}.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<q', len(header)))
+            f.write(header)
+            for spool, location in sections:
+                spool.seek(0)
+                shutil.copyfileobj(spool, f)
+                f.write(b'\0' * (-location['length'] % 8))
+    finally:
+        for spool, location in sections:
+            spool.close()
+    os.replace(temporary, path)
+    return {name: table['rows'] for name, table in tables.items()}
+
+
+def _build_table(model, section, encoder):
+    """
+    Streams the rows of one table into new sections and returns the table's header entry.
+    """
+    fields = model.FIELDS
+    grouped = {field: array('q') for field in GROUP_FIELDS.get(model.__tablename__, ())}
+    columns = {}
+    streams = {}
+    for field in fields:
+        if model.__table__.c[field].type.python_type is int:
+            spool, location = section()
+            columns[field] = {'kind': 'int', 'values': location}
+            streams[field] = (spool,)
+            continue
+        (offsets, offsets_location), (nulls, nulls_location), (data, data_location) = section(), section(), section()
+        offsets.write(array('q', [0]).tobytes())
+        columns[field] = {'kind': 'str', 'offsets': offsets_location, 'nulls': nulls_location, 'data': data_location}
+        streams[field] = (offsets, nulls, data)
+    encoded, json_location = section()
+
+    count = 0
+    result = db.session.execute(
+        select(*(getattr(model, field) for field in fields))
+        .order_by(model.id)
+        .execution_options(stream_results=True)
+    )
+    for rows in result.partitions(BUILD_BATCH_SIZE):
+        for index, field in enumerate(fields):
+            values = [row[index] for row in rows]
+            if columns[field]['kind'] == 'int':
+                stored = array('q', [INT_NULL if value is None else value for value in values])
+                streams[field][0].write(stored.tobytes())
+                if field in grouped:
+                    grouped[field].extend(stored)
+                continue
+            offsets, nulls, data = streams[field]
+            blob = bytearray()
+            # The data section only grows, so its position is its length
+            end = data.tell()
+            positions = array('q')
+            flags = bytearray(len(values))
+            for position, value in enumerate(values):
+                if value is None:
+                    flags[position] = 1
+                else:
+                    blob += value.encode('utf-8')
+                positions.append(end + len(blob))
+            offsets.write(positions.tobytes())
+            nulls.write(bytes(flags))
+            data.write(bytes(blob))
+        if count:
+            encoded.write(b',')
+        encoded.write(b','.join(encoder.encode(dict(zip(fields, row))).encode('utf-8') for row in rows))
+        count += len(rows)
+
+    for field, stored in grouped.items():
+        # A stable sort, so the rows of one value stay ordered by ID
+        order = sorted(range(len(stored)), key=stored.__getitem__)
+        (values, values_location), (positions, positions_location) = section(), section()
+        values.write(array('q', [stored[position] for position in order]).tobytes())
+        positions.write(array('q', order).tobytes())
+        columns[field]['index'] = {'values': values_location, 'positions': positions_location}
+
+    return {
+        'rows': count,
+        'fields': list(fields),
+        'columns': columns,
+        'json': json_location
+    }
+
+
+class SnapshotTable:
+    """
+    Reads the rows of one table from the mapped columns.
+
+    Attributes:
+        size (int): Number of rows.
+        fields (tuple): Names of the stored columns.
+    """
+
+    def __init__(self, data, meta):
+        self.size = meta['rows']
+        self.fields = tuple(meta['fields'])
+        self._columns = {}
+        self._indexes = {}
+        for field, column in meta['columns'].items():
+            if column['kind'] == 'int':
+                self._columns[field] = (_section(data, column['values']).cast('q'), None, None)
+                if 'index' in column:
+                    self._indexes[field] = (
+                        _section(data, column['index']['values']).cast('q'),
+                        _section(data, column['index']['positions']).cast('q')
+                    )
+            else:
+                self._columns[field] = (
+                    _section(data, column['offsets']).cast('q'),
+                    _section(data, column['nulls']),
+                    _section(data, column['data'])
+                )
+        self._ids = self._columns['id'][0]
+        self._json = _section(data, meta['json'])
+
+    def _value(self, field, index):
+        values, nulls, data = self._columns[field]
+        if data is None:
+            value = values[index]
+            return None if value == INT_NULL else value
+        if nulls[index]:
+            return None
+        return str(data[values[index]:values[index + 1]], 'utf-8')
+
+    def _column(self, field):
+        values, nulls, data = self._columns[field]
+        if data is None:
+            return [None if value == INT_NULL else value for value in values.tolist()]
+        offsets = values.tolist()
+        return [
+            None if null else str(data[start:end], 'utf-8')
+            for start, end, null in zip(offsets, offsets[1:], nulls.tolist())
+        ]
+
+    def _row(self, index, fields):
+        return {field: self._value(field, index) for field in fields}
+
+    def _index(self, record_id):
+        index = bisect.bisect_left(self._ids, record_id)
+        if index < self.size and self._ids[index] == record_id:
+            return index
+        return None
+
+    def rows(self, fields=None):
+        """
+        Returns every row, ordered by ID.
+
+        Args:
+            fields (tuple, optional): Fields to include. Defaults to every stored field.
+
+        Returns:
+            list: A list of dictionaries keyed by field name.
+        """
+        fields = fields or self.fields
+        columns = [self._column(field) for field in fields]
+        return [dict(zip(fields, row)) for row in zip(*columns)]
+
+    def encoded_rows(self):
+        """
+        Returns the stored JSON of every row with all fields, joined with commas in ID order.
+
+        Returns:
+            memoryview: A read-only view of the mapped file; see `fragments.encoded_list_response`.
+        """
+        return self._json
+
+    def get(self, record_id, fields=None):
+        """
+        Returns the row with the given ID, or None.
+        """
+        index = self._index(record_id)
+        return None if index is None else self._row(index, fields or self.fields)
+
+    def get_many(self, record_ids, fields=None):
+        """
+        Returns a mapping of ID to row for the IDs that exist.
+        """
+        found = {}
+        for record_id in record_ids:
+            index = self._index(record_id)
+            if index is not None:
+                found[record_id] = self._row(index, fields or self.fields)
+        return found
+
+    def group(self, field, values, fields=None):
+        """
+        Returns the rows whose integer `field` is one of `values`, grouped by that value and ordered by ID.
+
+        Args:
+            field (str): An integer column of `GROUP_FIELDS`, e.g. `movie_id`.
+            values (list): The integer values to select.
+            fields (tuple, optional): Fields to include. Defaults to every stored field.
+
+        Returns:
+            dict: A mapping of value to its rows. Values without rows are left out.
+        """
+        sorted_values, positions = self._indexes[field]
+        groups = {}
+        for value in dict.fromkeys(values):
+            start = bisect.bisect_left(sorted_values, value)
+            end = bisect.bisect_right(sorted_values, value, start)
+            if start < end:
+                groups[value] = [self._row(positions[index], fields or self.fields) for index in range(start, end)]
+        return groups
+
+
+def _section(data, location):
+    return data[location['offset']:location['offset'] + location['length']]
+
+
+class Snapshot:
+    """
+    A snapshot file mapped read-only into the process.
+
+    Args:
+        path (str): Path of a file written by `build_snapshot`.
+
+    Attributes:
+        built_at (float): Unix time the snapshot was built.
+        identity (tuple): Inode and modification time of the mapped file.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self.identity = (stat.st_ino, stat.st_mtime_ns)
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        if view[:len(MAGIC)] != MAGIC:
+            raise ValueError(f'{path} is not a snapshot file.')
+        header_length, = struct.unpack_from('<q', view, len(MAGIC))
+        start = len(MAGIC) + 8
+        header = json.loads(bytes(view[start:start + header_length]))
+        data = view[start + header_length:]
+
+        self.built_at = header['built_at']
+        self.tables = {name: SnapshotTable(data, meta) for name, meta in header['tables'].items()}
+
+    def table(self, name):
+        """
+        Returns the `SnapshotTable` of `movies` or `actors`.
+        """
+        return self.tables[name]
+
+
+class SnapshotStore:
+    """
+    Follows the newest snapshot file within one process.
+
+    Args:
+        path (str): Path of the snapshot file.
+        check_interval (float, optional): Minimum number of seconds between checks for a new file.
+    """
+
+    def __init__(self, path, check_interval=SNAPSHOT_REFRESH_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def current(self):
+        """
+        Returns the newest snapshot, or None while no snapshot has been built.
+        """
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            self._reload()
+        return self._snapshot
+
+    def _reload(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.identity == (stat.st_ino, stat.st_mtime_ns):
+            return
+        with self._lock:
+            try:
+                self._snapshot = Snapshot(self.path)
+            except (OSError, ValueError):
+                logger.exception('Could not open snapshot %s', self.path)
+
+
+_NEVER = object()
+
+
+class SnapshotRefresher:
+    """
+    Rebuilds the snapshot from a background thread of the worker that holds the lock file.
+
+    Args:
+        app (Flask): The application, whose database the snapshot is built from.
+        path (str): Path of the snapshot file.
+        interval (float): Seconds between checks for changes.
+        max_age (float): Seconds after which the snapshot is rebuilt even without a recorded change.
+    """
+
+    def __init__(self, app, path, interval, max_age):
+        self.app = app
+        self.path = path
+        self.marker_path = f'{path}.dirty'
+        self.lock_path = f'{path}.lock'
+        self.interval = interval
+        self.max_age = max_age
+        self._pid = None
+        self._leader = False
+        self._marker_seen = _NEVER
+
+    def notify(self, tables):
+        """
+        Records that movies or actors changed by touching the marker file; used as a version listener.
+        """
+        if not set(tables) & set(TABLES):
+            return
+        with open(self.marker_path, 'a'):
+            os.utime(self.marker_path)
+
+    def ensure_started(self):
+        """
+        Starts the refresher thread once in every process, including workers forked from a preloaded master.
+        """
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._leader = False
+        self._marker_seen = _NEVER
+        threading.Thread(target=self._run, name='snapshot-refresher', daemon=True).start()
+
+    def _run(self):
+        lock_file = open(self.lock_path, 'a')
+        while True:
+            if self._acquire(lock_file):
+                try:
+                    self.refresh_if_stale()
+                except Exception:
+                    logger.exception('Snapshot refresh failed')
+            time.sleep(self.interval)
+
+    def _acquire(self, lock_file):
+        if self._leader or fcntl is None:
+            self._leader = True
+            return True
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return False
+        self._leader = True
+        return True
+
+    def refresh_if_stale(self):
+        """
+        Rebuilds the snapshot if it is missing, a write was recorded since the last build or it is too old.
+
+        Returns:
+            bool: Whether the snapshot was rebuilt.
+        """
+        marker = _mtime_ns(self.marker_path)
+        built = _mtime_ns(self.path)
+        stale = (
+            built is None
+            or marker != self._marker_seen
+            or time.time() - built / 1e9 > self.max_age
+        )
+        if not stale:
+            return False
+
+        # Read the marker before building, so writes made during the build trigger the next one
+        self._marker_seen = marker
+        started = time.perf_counter()
+        with self.app.app_context():
+            try:
+                counts = build_snapshot(self.path)
+            finally:
+                db.session.remove()
+        logger.info('Built snapshot %s with %s in %.2fs', self.path, counts, time.perf_counter() - started)
+        return True
+
+
+def _mtime_ns(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def register_snapshot(app):
+    """
+    Serves movie and actor reads from the shared snapshot when `SNAPSHOT_ENABLED` is set.
+
+    Settings are read from `app.config` first, falling back to `settings.py`. Until the first snapshot has been
+    built, reads go to the database.
+
+    Args:
+        app (Flask): The Flask application instance.
+    """
+    if not app.config.get('SNAPSHOT_ENABLED', SNAPSHOT_ENABLED):
+        return
+
+    path = app.config.get('SNAPSHOT_PATH', SNAPSHOT_PATH)
+    interval = app.config.get('SNAPSHOT_REFRESH_INTERVAL', SNAPSHOT_REFRESH_INTERVAL)
+    refresher = SnapshotRefresher(app, path, interval, app.config.get('SNAPSHOT_MAX_AGE', SNAPSHOT_MAX_AGE))
+    add_version_listener(refresher.notify)
+    app.extensions['snapshot'] = SnapshotStore(path, interval)
+    app.before_request(refresher.ensure_started)
+
+
+def current_snapshot():
+    """
+    Returns the snapshot to serve reads of the current app from, or None to read from the database.
+    """
+    store = current_app.extensions.get('snapshot')
+    return store.current() if store is not None else None
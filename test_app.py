@@ -1,48 +1,39 @@
 import json
+import os
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
 import unittest
+from unittest import mock
 
-from flask_sqlalchemy import SQLAlchemy
-
+from testing import DatabaseTestCase, engine
+from flask import jsonify
+from sqlalchemy import MetaData, event, text
+from sqlalchemy.exc import IntegrityError, OperationalError
 from app import create_app
-from models import setup_db, Movie, Actor
+from cache import get_fragment
+from coalescing import SingleFlight
+from jobs import JobWorkers
+from partitioning import partition_actors
+from models import db, unit_of_work, rebuild_stats_summary, Movie, Actor, StatsSummary
+from seed_data import seed, generate_movies, generate_actors
+from slow_queries import SlowQueryLog
+from snapshot import build_snapshot, Snapshot, SnapshotStore
 
 
-class CastingTestCase(unittest.TestCase):
+class CastingTestCase(DatabaseTestCase):
 
     def setUp(self):
-        self.app = create_app()
-        self.client = self.app.test_client
-        setup_db(self.app)
+        super().setUp()
 
         self.test_movie = {
             'title': 'Movie Title',
             'release_year': 2020
         }
 
-        with self.app.app_context():
-            self.db = SQLAlchemy()
-            self.db.init_app(self.app)
-            self.db.drop_all()
-            self.db.create_all()
-
-        # Setup authentication tokens info
-        with open('auth_config.json', 'r') as f:
-            self.auth = json.loads(f.read())
-
-        assistant_jwt = self.auth["roles"]["Casting_Assistant"]["jwt_token"]
-        director_jwt = self.auth["roles"]["Casting_Director"]["jwt_token"]
-        producer_jwt = self.auth["roles"]["Executive_Producer"]["jwt_token"]
-
-        self.auth_headers = {
-            "Casting_Assistant": f'Bearer {assistant_jwt}',
-            "Casting_Director": f'Bearer {director_jwt}',
-            "Executive_Producer": f'Bearer {producer_jwt}'
-        }
-
-
-    def tearDown(self):
-        pass
-
     # GET Endpoint Tests
     # -------------------------------------------------------------------------
 
@@ -118,8 +109,8 @@ class CastingTestCase(unittest.TestCase):
         # check movie id is exist or not
         movie = Movie.get_all()
         if not movie:
-            movie = Movie(title="Some Movie Title", release_year=2020)
-            movie.insert()
+            movie = [Movie(title="Some Movie Title", release_year=2020)]
+            movie[0].insert()
 
         test_movie_id = movie[0].id
 
@@ -152,8 +143,8 @@ class CastingTestCase(unittest.TestCase):
         # check movie id is exist or not
         movie = Movie.get_all()
         if not movie:
-            movie = Movie(title="Some Movie Title", release_year=2020)
-            movie.insert()
+            movie = [Movie(title="Some Movie Title", release_year=2020)]
+            movie[0].insert()
 
         test_movie_id = movie[0].id
 
@@ -188,16 +179,16 @@ class CastingTestCase(unittest.TestCase):
         # check movie id is exist or not
         movie = Movie.get_all()
         if not movie:
-            movie = Movie(title="Some Movie Title", release_year=2020)
-            movie.insert()
+            movie = [Movie(title="Some Movie Title", release_year=2020)]
+            movie[0].insert()
 
         test_movie_id = movie[0].id
 
         # check actor id is exist or not
         actor = Actor.get_all()
         if not actor:
-            actor = Actor(name="Actor Name", age=33, gender="female", movie_id=test_movie_id)
-            actor.insert()
+            actor = [Actor(name="Actor Name", age=33, gender="female", movie_id=test_movie_id)]
+            actor[0].insert()
 
         test_actor_id = actor[0].id
         
@@ -233,8 +224,8 @@ class CastingTestCase(unittest.TestCase):
         # check movie id is exist or not
         movie = Movie.get_all()
         if not movie:
-            movie = Movie(title="Some Movie Title", release_year=2020)
-            movie.insert()
+            movie = [Movie(title="Some Movie Title", release_year=2020)]
+            movie[0].insert()
 
         test_movie_id = movie[0].id
 
@@ -250,6 +241,84 @@ class CastingTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertTrue(data['deleted'])
 
+    def test_delete_movie_with_actors(self):
+        headers = {
+            'Authorization': self.auth_headers["Executive_Producer"]
+        }
+        movie = Movie(title="Some Movie Title", release_year=2020)
+        movie.insert()
+        movie_id = movie.id
+        for i in range(3):
+            Actor(name=f"Actor {i}", age=33, gender="female", movie_id=movie_id).insert()
+
+        res = self.client().delete(f'/movies/delete/{movie_id}', headers=headers)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['deleted'], movie_id)
+        self.assertEqual(data['actors_deleted'], 3)
+        self.assertEqual(Actor.get_actors_by_movie_id(movie_id), [])
+
+    def test_delete_movie_forgets_loaded_actors(self):
+        movie = Movie(title="Some Movie Title", release_year=2020)
+        movie.insert()
+        actor = Actor(name="Some Actor", age=33, gender="female", movie_id=movie.id)
+        actor.insert()
+        actor_id = actor.id
+
+        with unit_of_work():
+            self.assertEqual(Actor.get_many([actor_id]), [actor])
+            Movie.get_by_id(movie.id).delete()
+
+            self.assertIsNone(Actor.get_by_id(actor_id))
+            self.assertEqual(Actor.get_many([actor_id]), [])
+
+    def _restrict_movie_deletes(self):
+        """
+        Recreates `actors` as MOVIE_DELETE_POLICY=restrict does; the test transaction undoes it.
+        """
+        metadata = MetaData()
+        Movie.__table__.to_metadata(metadata)
+        restricted = Actor.__table__.to_metadata(metadata)
+        for constraint in restricted.foreign_key_constraints:
+            constraint.ondelete = 'RESTRICT'
+        Actor.__table__.drop(self.connection)
+        restricted.create(self.connection)
+
+    def test_delete_movie_restrict(self):
+        headers = {
+            'Authorization': self.auth_headers["Executive_Producer"]
+        }
+        self._restrict_movie_deletes()
+
+        movie = Movie(title="Some Movie Title", release_year=2020)
+        movie.insert()
+        movie_id = movie.id
+        Actor(name="Some Actor", age=33, gender="female", movie_id=movie_id).insert()
+
+        with mock.patch('models.MOVIE_DELETE_POLICY', 'restrict'):
+            res = self.client().delete(f'/movies/delete/{movie_id}', headers=headers)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertIsNotNone(Movie.get_by_id(movie_id))
+        self.assertEqual(len(Actor.get_actors_by_movie_id(movie_id)), 1)
+
+    def test_delete_movie_restrict_without_unit_of_work(self):
+        self._restrict_movie_deletes()
+        movie = Movie(title="Some Movie Title", release_year=2020)
+        movie.insert()
+        movie_id = movie.id
+        Actor(name="Some Actor", age=33, gender="female", movie_id=movie_id).insert()
+
+        # Outside a unit of work, as with UNIT_OF_WORK=false, the delete commits immediately and fails
+        with mock.patch('models.MOVIE_DELETE_POLICY', 'restrict'), self.assertRaises(IntegrityError):
+            Movie.get_by_id(movie_id).delete()
+
+        # The failed commit was rolled back, so the session keeps working
+        self.assertIsNotNone(Movie.get_by_id(movie_id))
+        self.assertEqual(len(Actor.get_actors_by_movie_id(movie_id)), 1)
+
     def test_delete_movie_fail(self):
         headers = {
             'Authorization': self.auth_headers["Executive_Producer"]
@@ -269,16 +338,16 @@ class CastingTestCase(unittest.TestCase):
         # check movie id is exist or not
         movie = Movie.get_all()
         if not movie:
-            movie = Movie(title="Some Movie Title", release_year=2020)
-            movie.insert()
+            movie = [Movie(title="Some Movie Title", release_year=2020)]
+            movie[0].insert()
 
         test_movie_id = movie[0].id
 
         # check actor id is exist or not
         actor = Actor.get_all()
         if not actor:
-            actor = Actor(name="Actor Name", age=33, gender="female", movie_id=test_movie_id)
-            actor.insert()
+            actor = [Actor(name="Actor Name", age=33, gender="female", movie_id=test_movie_id)]
+            actor[0].insert()
 
         test_actor_id = actor[0].id
 
@@ -301,7 +370,943 @@ class CastingTestCase(unittest.TestCase):
         self.assertEqual(data['error'], 404)
         self.assertEqual(data['message'], 'Resource not found')
 
-    
+
+    # Unit of Work Tests
+    # -------------------------------------------------------------------------
+
+    def test_unit_of_work_commit(self):
+        with unit_of_work():
+            movie = Movie(title="Some Movie Title", release_year=2020)
+            movie.insert()
+            actor = Actor(name="Actor Name", age=33, gender="female", movie_id=movie.id)
+            actor.insert()
+            movie_id, actor_id = movie.id, actor.id
+
+        self.assertEqual(Movie.get_by_id(movie_id).title, "Some Movie Title")
+        self.assertEqual(Actor.get_by_id(actor_id).movie_id, movie_id)
+
+    def test_unit_of_work_rollback(self):
+        with self.assertRaises(RuntimeError):
+            with unit_of_work():
+                movie = Movie(title="Rolled Back Movie", release_year=2020)
+                movie.insert()
+                movie_id = movie.id
+                raise RuntimeError()
+
+        self.assertIsNone(Movie.get_by_id(movie_id))
+
+    def test_get_many(self):
+        with unit_of_work():
+            movies = [Movie(title=f"Movie {i}", release_year=2020) for i in range(3)]
+            for movie in movies:
+                movie.insert()
+            movie_ids = [movie.id for movie in movies]
+
+        found = Movie.get_many([movie_ids[2], 100000000, movie_ids[0], movie_ids[2]])
+
+        self.assertEqual([movie.id for movie in found], [movie_ids[2], movie_ids[0]])
+
+    # Synthetic Data Tests
+    # -------------------------------------------------------------------------
+
+    def test_generate_is_deterministic(self):
+        def dataset(seed_value):
+            rng = random.Random(seed_value)
+            movies = list(generate_movies(rng, 10, 1))
+            actors = list(generate_actors(rng, 50, 1, lambda: rng.randint(1, 10)))
+            return movies, actors
+
+        self.assertEqual(dataset(7), dataset(7))
+        self.assertNotEqual(dataset(7), dataset(8))
+
+    def test_seed(self):
+        movie_count = len(Movie.get_all())
+        actor_count = len(Actor.get_all())
+
+        # COPY would write through its own connection, outside the test transaction
+        written = seed(movies=20, actors=100, seed=1, batch_size=30, use_copy=False, report=lambda message: None)
+
+        self.assertEqual(written, (20, 100))
+        self.assertEqual(len(Movie.get_all()), movie_count + 20)
+        self.assertEqual(len(Actor.get_all()), actor_count + 100)
+
+    # Sparse Fieldset Tests
+    # -------------------------------------------------------------------------
+
+    def test_get_movies_fields(self):
+        headers = {
+            'Authorization': self.auth_headers["Casting_Assistant"]
+        }
+        Movie(title="Some Movie Title", release_year=2020).insert()
+
+        res = self.client().get('/movies?fields=id,title', headers=headers)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertTrue(data['movies'])
+        for movie in data['movies']:
+            self.assertEqual(set(movie), {'id', 'title'})
+
+    def test_get_movies_fields_fail(self):
+        headers = {
+            'Authorization': self.auth_headers["Casting_Assistant"]
+        }
+        res = self.client().get('/movies?fields=id,budget', headers=headers)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertFalse(data['success'])
+
+    def test_get_actor_fields(self):
+        headers = {
+            'Authorization': self.auth_headers["Casting_Assistant"]
+        }
+        movie = Movie(title="Some Movie Title", release_year=2020)
+        movie.insert()
+        actor = Actor(name="Actor Name", age=33, gender="female", movie_id=movie.id)
+        actor.insert()
+        actor_id = actor.id
+
+        res = self.client().get(f'/actors/{actor_id}?fields=name,age', headers=headers)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertEqual(data['actor'], {'name': 'Actor Name', 'age': 33})
+
+    def test_get_actor_fail(self):
+        headers = {
+            'Authorization': self.auth_headers["Casting_Assistant"]
+        }
+        res = self.client().get('/actors/100000000', headers=headers)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertFalse(data['success'])
+        self.assertEqual(data['message'], 'Resource not found')
+
+    # JSON Fragment Tests
+    # -------------------------------------------------------------------------
+
+    def _enable_fragment_cache(self):
+        for module in ('cache', 'fragments'):
+            patcher = mock.patch(f'{module}.FRAGMENT_CACHE_SIZE', 1000)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_get_movies_from_fragments(self):
+        headers = {
+            'Authorization': self.auth_headers["Casting_Assistant"]
+        }
+        self._enable_fragment_cache()
+        movie = Movie(title="Some Movie Title", release_year=2020)
+        movie.insert()
+        movie_id = movie.id
+
+        res = self.client().get('/movies', headers=headers)
+        with self.app.test_request_context():
+            expected = jsonify({'success': True, 'movies': [movie.format() for movie in Movie.get_all()]}).get_data()
+
+        self.assertEqual(res.data, expected)
+        self.assertIsNotNone(get_fragment('movies', movie_id, 1, Movie.FIELDS))
+
+        movie = Movie.get_by_id(movie_id)
+        movie.title = "Updated Movie Title"
+        movie.update()
+
+        self.assertEqual(movie.version, 2)
+        self.assertIsNone(get_fragment('movies', movie_id, 1, Movie.FIELDS))
+        data = json.loads(self.client().get('/movies', headers=headers).data)
+        self.assertIn({'id': movie_id, 'title': "Updated Movie Title", 'release_year': 2020}, data['movies'])
+
+    def test_update_after_concurrent_write_gets_new_version(self):
+        movie = Movie(title="Some Movie Title", release_year=2020)
+        movie.insert()
+        movie_id = movie.id
+
+        movie = Movie.get_by_id(movie_id)
+        self.assertEqual(movie.version, 1)
+        # Another worker updates the row after it was read
+        self.connection.execute(
+            text('UPDATE movies SET title = :title, version = version + 1 WHERE id = :id'),
+            {'title': "Other Title", 'id': movie_id}
+        )
+        movie.title = "Updated Movie Title"
+        movie.update()
+
+        self.assertEqual(movie.version, 3)
+        self.assertEqual(Movie.get_by_id(movie_id).title, "Updated Movie Title")
+
+    def test_deleted_rows_leave_fragment_cache(self):
+        headers = {
+            'Authorization': self.auth_headers["Casting_Assistant"]
+        }
+        self._enable_fragment_cache()
+        movie = Movie(title="Some Movie Title", release_year=2020)
+        movie.insert()
+        actor = Actor(name="Deleted Actor", age=33, gender="female", movie_id=movie.id)
+        actor.insert()
+        movie_id, actor_id = movie.id, actor.id
+        self.client().get('/actors', headers=headers)
+        self.assertIsNotNone(get_fragment('actors', actor_id, 1, Actor.FIELDS))
+
+        # Cascades to the actor, which the session no longer holds after the request
+        Movie.get_by_id(movie_id).delete()
+        self.assertIsNone(get_fragment('actors', actor_id, 1, Actor.FIELDS))
+
+        # SQLite hands the highest deleted ID out again
+        movie = Movie(title="Other Movie Title", release_year=2021)
+        movie.insert()
+        Actor(name="New Actor", age=34, gender="male", movie_id=movie.id).insert()
+        data = json.loads(self.client().get('/actors', headers=headers).data)
+        names = [actor['name'] for actor in data['actors']]
+
+        self.assertIn("New Actor", names)
+        self.assertNotIn("Deleted Actor", names)
+
+    # Total Count Tests
+    # -------------------------------------------------------------------------
+
+    def test_get_actors_total_count(self):
+        headers = {
+            'Authorization': self.auth_headers["Casting_Assistant"]
+        }
+        movie = Movie(title="Some Movie Title", release_year=2020)
+        movie.insert()
+        Actor(name="Actor Name", age=33, gender="female", movie_id=movie.id).insert()
+
+        res = self.client().get('/actors', headers=headers)
+        data = json.loads(res.data)
+        self.assertEqual(int(res.headers['X-Total-Count']), len(data['actors']))
+
+        # Without planner statistics the estimate falls back to an exact count
+        for strategy in ('cached', 'estimate'):
+            res = self.client().get(f'/actors?count={strategy}', headers=headers)
+            self.assertEqual(int(res.headers['X-Total-Count']), len(data['actors']))
+
+    def test_cached_total_count_follows_writes(self):
+        headers = {
+            'Authorization': self.auth_headers["Casting_Assistant"]
+        }
+        total = int(self.client().get('/movies?count=cached', headers=headers).headers['X-Total-Count'])
+        Movie(title="Some Movie Title", release_year=2020).insert()
+
+        res = self.client().get('/movies?count=cached', headers=headers)
+
+        self.assertEqual(int(res.headers['X-Total-Count']), total + 1)
+
+    def test_cached_total_count_reads_row_counter(self):
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement.lower())
+
+        with mock.patch('models.STATS_SUMMARY_TABLE', True):
+            rebuild_stats_summary()
+            movie = Movie(title="Some Movie Title", release_year=2020)
+            movie.insert()
+            Movie.insert_many([Movie(title="Other Movie Title", release_year=2021)])
+            Actor.insert_many([Actor(name="Actor Name", age=33, gender="female", movie_id=movie.id),
+                               Actor(name="Other Actor", age=34, gender="male", movie_id=movie.id)])
+            actor = Actor(name="Third Actor", age=35, gender="female", movie_id=movie.id)
+            actor.insert()
+            actor.delete()
+            movie.delete()
+
+            event.listen(self.connection, 'before_cursor_execute', record)
+            try:
+                counts = (Movie.count('cached'), Actor.count('cached'))
+            finally:
+                event.remove(self.connection, 'before_cursor_execute', record)
+
+        self.assertEqual(counts, (Movie.count('exact'), Actor.count('exact')))
+        self.assertFalse([statement for statement in statements if 'count(' in statement])
+
+    def test_get_movies_total_count_fail(self):
+        headers = {
+            'Authorization': self.auth_headers["Casting_Assistant"]
+        }
+        res = self.client().get('/movies?count=guess', headers=headers)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertFalse(data['success'])
+
+    # Batch Endpoint Tests
+    # -------------------------------------------------------------------------
+
+    def test_batch(self):
+        headers = {
+            'Authorization': self.auth_headers["Casting_Assistant"]
+        }
+        movie = Movie(title="Some Movie Title", release_year=2020)
+        movie.insert()
+        actors = [Actor(name=f"Actor {i}", age=30 + i, gender="female", movie_id=movie.id) for i in range(2)]
+        for actor in actors:
+            actor.insert()
+        movie_id, actor_ids = movie.id, [actor.id for actor in actors]
+
+        statements = []
+        event.listen(self.connection, 'before_cursor_execute',
+                     lambda conn, cursor, statement, *args: statements.append(statement))
+        res = self.client().post('/batch', json={'operations': [
+            {'op': 'get_actor', 'id': actor_ids[1]},
+            {'op': 'get_movie', 'id': movie_id},
+            {'op': 'list_movie_actors', 'movie_id': movie_id},
+            {'op': 'get_actor', 'id': actor_ids[0]},
+            {'op': 'get_movie', 'id': 100000000}
+        ]}, headers=headers)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        results = data['results']
+        self.assertEqual(results[0]['actor']['id'], actor_ids[1])
+        self.assertEqual(results[1]['movie']['title'], "Some Movie Title")
+        self.assertEqual([actor['id'] for actor in results[2]['actors']], actor_ids)
+        self.assertEqual(results[3]['actor']['id'], actor_ids[0])
+        self.assertEqual(results[4]['error'], 404)
+        # At most one query for the movies, one for the actors and one for the cast
+        self.assertLessEqual(len([s for s in statements if s.lstrip().upper().startswith('SELECT')]), 3)
+
+    def test_batch_checks_permissions(self):
+        movie = Movie(title="Some Movie Title", release_year=2020)
+        movie.insert()
+        movie_id = movie.id
+
+        res = self.client().post('/batch', json={'operations': [
+            {'op': 'get_movie', 'id': movie_id},
+            {'op': 'list_movie_actors', 'movie_id': movie_id}
+        ]}, headers={'Authorization': self.token('view:movies')})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['results'][0]['success'])
+        self.assertEqual(data['results'][1]['error'], 403)
+
+    def test_batch_rejects_out_of_range_ids(self):
+        headers = {
+            'Authorization': self.auth_headers["Casting_Assistant"]
+        }
+        movie = Movie(title="Some Movie Title", release_year=2020)
+        movie.insert()
+        movie_id = movie.id
+
+        res = self.client().post('/batch', json={'operations': [
+            {'op': 'get_movie', 'id': 10 ** 20},
+            {'op': 'get_actor', 'id': 0},
+            {'op': 'list_movie_actors', 'movie_id': -(2 ** 63) - 1},
+            {'op': 'get_movie', 'id': movie_id}
+        ]}, headers=headers)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([result.get('error') for result in data['results']], [400, 400, 400, None])
+        self.assertEqual(data['results'][3]['movie']['id'], movie_id)
+
+    def test_batch_fail(self):
+        headers = {
+            'Authorization': self.auth_headers["Casting_Assistant"]
+        }
+        res = self.client().post('/batch', json={'operations': [{'op': 'delete_movie', 'id': 1}]}, headers=headers)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertFalse(data['success'])
+
+    # Snapshot Tests
+    # -------------------------------------------------------------------------
+
+    def test_snapshot(self):
+        movie = Movie(title="Snapshot Movie Title", release_year=2020)
+        movie.insert()
+        actors = [
+            Actor(name="Actor Name", age=33, gender="female", movie_id=movie.id),
+            Actor(name="Ünïcode Name", age=None, gender=None, movie_id=movie.id)
+        ]
+        for actor in actors:
+            actor.insert()
+        movie_id, actor_ids = movie.id, [actor.id for actor in actors]
+        path = os.path.join(tempfile.mkdtemp(), 'snapshot.bin')
+
+        # One row per batch, so every section is written in several steps
+        with self.app.app_context(), mock.patch('snapshot.BUILD_BATCH_SIZE', 1):
+            counts = build_snapshot(path)
+        snapshot = Snapshot(path)
+
+        self.assertEqual(counts['actors'], len(Actor.get_all()))
+        self.assertEqual(snapshot.table('movies').get(movie_id), Movie.get_by_id(movie_id).format())
+        self.assertEqual(snapshot.table('actors').get(actor_ids[1], ('name', 'age', 'gender')),
+                         {'name': "Ünïcode Name", 'age': None, 'gender': None})
+        self.assertIsNone(snapshot.table('actors').get(100000000))
+        self.assertEqual(snapshot.table('actors').rows(), [actor.format() for actor in Actor.get_all()])
+        self.assertEqual(json.loads(b'[' + bytes(snapshot.table('actors').encoded_rows()) + b']'),
+                         [actor.format() for actor in Actor.get_all()])
+        cast = snapshot.table('actors').group('movie_id', [movie_id])[movie_id]
+        self.assertEqual([actor['id'] for actor in cast], actor_ids)
+        self.assertEqual(snapshot.table('actors').group('movie_id', [100000000]), {})
+
+    def test_get_actor_from_snapshot(self):
+        headers = {
+            'Authorization': self.auth_headers["Casting_Assistant"]
+        }
+        movie = Movie(title="Snapshot Movie Title", release_year=2020)
+        movie.insert()
+        actor = Actor(name="Actor Name", age=33, gender="female", movie_id=movie.id)
+        actor.insert()
+        actor_id = actor.id
+        path = os.path.join(tempfile.mkdtemp(), 'snapshot.bin')
+        with self.app.app_context():
+            build_snapshot(path)
+        # Changes after the build are not visible until the next one
+        actor.name = "Renamed"
+        actor.update()
+
+        self.app.extensions['snapshot'] = SnapshotStore(path, check_interval=0)
+        try:
+            res = self.client().get(f'/actors/{actor_id}', headers=headers)
+        finally:
+            del self.app.extensions['snapshot']
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['actor']['name'], "Actor Name")
+
+    def test_get_actors_from_snapshot(self):
+        headers = {
+            'Authorization': self.auth_headers["Casting_Assistant"]
+        }
+        movie = Movie(title="Snapshot Movie Title", release_year=2020)
+        movie.insert()
+        Actor(name="Ünïcode Name", age=33, gender="female", movie_id=movie.id).insert()
+        expected = self.client().get('/actors', headers=headers)
+        path = os.path.join(tempfile.mkdtemp(), 'snapshot.bin')
+        with self.app.app_context():
+            build_snapshot(path)
+
+        self.app.extensions['snapshot'] = SnapshotStore(path, check_interval=0)
+        try:
+            res = self.client().get('/actors', headers=headers)
+            names = self.client().get('/actors?fields=name', headers=headers)
+            bad_count = self.client().get('/actors?count=guess', headers=headers)
+        finally:
+            del self.app.extensions['snapshot']
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data, expected.data)
+        self.assertEqual(res.headers['X-Total-Count'], expected.headers['X-Total-Count'])
+        self.assertEqual(json.loads(names.data)['actors'], [{'name': actor.name} for actor in Actor.get_all()])
+        self.assertEqual(bad_count.status_code, 400)
+
+    # Request Coalescing Tests
+    # -------------------------------------------------------------------------
+
+    def test_single_flight_shares_result(self):
+        flight = SingleFlight()
+        calls = []
+        results = []
+
+        def load():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'payload'
+
+        threads = [
+            threading.Thread(target=lambda: results.append(flight.do('key', load))) for _ in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['payload'] * 10)
+        # Nothing is kept once the flight has landed
+        self.assertEqual(flight.do('key', lambda: 'fresh'), 'fresh')
+
+    def test_single_flight_shares_error(self):
+        flight = SingleFlight()
+        errors = []
+
+        def load():
+            time.sleep(0.2)
+            raise ValueError('failed')
+
+        def call():
+            try:
+                flight.do('key', load)
+            except ValueError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=call) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(errors), 5)
+        self.assertEqual(len(set(map(id, errors))), 1)
+
+    def _get_actors_concurrently(self, requests):
+        """
+        Sends `(path, Authorization)` requests to the app at once, returning the responses, the keys computed by
+        the coalescing and the SELECT statements run.
+        """
+        computed = []
+        statements = []
+        lock = threading.Lock()
+
+        class RecordingFlight(SingleFlight):
+            def do(self, key, fn):
+                def compute():
+                    computed.append(key)
+                    # Keep the flight open while the other requests arrive
+                    time.sleep(0.2)
+                    # Requests of different keys share the test's connection, so they query one at a time
+                    with lock:
+                        return fn()
+                return super().do(key, compute)
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith('SELECT'):
+                statements.append(statement)
+
+        responses = [None] * len(requests)
+
+        def send(index, path, token):
+            responses[index] = self.client().get(path, headers={'Authorization': token})
+
+        threads = [threading.Thread(target=send, args=(index, *request)) for index, request in enumerate(requests)]
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            with mock.patch('coalescing._requests', RecordingFlight()):
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+        return responses, computed, statements
+
+    def test_get_actors_coalesced(self):
+        movie = Movie(title="Some Movie Title", release_year=2020)
+        movie.insert()
+        Actor(name="Some Actor", age=33, gender="female", movie_id=movie.id).insert()
+        viewer = self.token('view:actors')
+        editor = self.token('view:actors', 'edit:actor')
+
+        # One request alone, after a first one has warmed the fragment cache
+        self._get_actors_concurrently([('/actors', viewer)])
+        single, _, selects = self._get_actors_concurrently([('/actors', viewer)])
+        self.assertTrue(selects)
+
+        responses, computed, statements = self._get_actors_concurrently(
+            [('/actors', viewer)] * 5 + [('/actors', editor)] * 3
+        )
+
+        # One computation per permission set, each running the SELECTs of a single request
+        self.assertEqual(len(computed), 2)
+        self.assertEqual(len(set(computed)), 2)
+        self.assertEqual(len(statements), 2 * len(selects))
+        for res in responses:
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(res.data, single[0].data)
+            self.assertEqual(res.headers['X-Total-Count'], single[0].headers['X-Total-Count'])
+
+    def test_get_actors_coalesced_abort(self):
+        responses, computed, _ = self._get_actors_concurrently([('/actors?count=guess', self.token('view:actors'))] * 5)
+
+        self.assertEqual(len(computed), 1)
+        for res in responses:
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 400)
+            self.assertEqual(data['success'], False)
+            self.assertEqual(data['error'], 400)
+
+    # Job Tests
+    # -------------------------------------------------------------------------
+
+    def test_async_create_actors(self):
+        movie = Movie(title="Some Movie Title", release_year=2020)
+        movie.insert()
+        movie_id = movie.id
+        headers = {
+            'Authorization': self.token('create:actor')
+        }
+
+        res = self.client().post('/actors/new?async=true', json=[
+            {'name': "Actor One", 'age': 30, 'gender': "female", 'movie_id': movie_id},
+            {'name': "Actor Two", 'age': 31, 'movie_id': movie_id},
+            {'name': "Actor Three", 'age': 32, 'gender': "male", 'movie_id': 100000000},
+            {'name': "Actor Four", 'age': "33", 'gender': "male", 'movie_id': movie_id}
+        ], headers=headers)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 202)
+        self.assertTrue(data['success'])
+        self.assertEqual(data['total'], 4)
+        self.assertTrue(res.headers['Location'].endswith(f"/jobs/{data['job_id']}"))
+
+        workers = JobWorkers(self.app, 0, 2, 3, 1, 300)
+        self.assertTrue(workers.run_next())
+        self.assertFalse(workers.run_next())
+
+        res = self.client().get(f"/jobs/{data['job_id']}", headers=headers)
+        job = json.loads(res.data)['job']
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(job['status'], 'succeeded')
+        self.assertEqual((job['processed'], job['failed'], job['progress']), (4, 2, 1.0))
+        self.assertEqual([error['index'] for error in job['errors']], [1, 2])
+        self.assertEqual(sorted(actor.name for actor in Actor.get_actors_by_movie_id(movie_id)),
+                         ["Actor Four", "Actor One"])
+
+    def test_async_create_rejects_malformed_items(self):
+        headers = {
+            'Authorization': self.token('create:movie')
+        }
+        res = self.client().post('/movies/new?async=true', json=[
+            {'title': "Good Movie", 'release_year': 2020},
+            {'title': {'first': "x"}, 'release_year': 2021},
+            {'title': "   ", 'release_year': 2022},
+            {'title': "Far Future Movie", 'release_year': 10 ** 20}
+        ], headers=headers)
+        job_id = json.loads(res.data)['job_id']
+
+        JobWorkers(self.app, 0, 500, 3, 1, 300).run_next()
+        job = json.loads(self.client().get(f'/jobs/{job_id}', headers=headers).data)['job']
+
+        self.assertEqual(job['status'], 'succeeded')
+        self.assertEqual((job['processed'], job['failed']), (4, 3))
+        self.assertEqual([error['index'] for error in job['errors']], [1, 2, 3])
+        self.assertIn("Good Movie", [movie.title for movie in Movie.get_all()])
+
+    def test_async_update_rejects_malformed_items(self):
+        movie = Movie(title="Some Movie Title", release_year=2020)
+        movie.insert()
+        actor = Actor(name="Actor Name", age=33, gender="female", movie_id=movie.id)
+        actor.insert()
+        actor_id = actor.id
+        headers = {
+            'Authorization': self.token('edit:actor')
+        }
+
+        res = self.client().patch(f'/actors/update/{actor_id}?async=true', json={'name': {'first': "x"}},
+                                  headers=headers)
+        job_id = json.loads(res.data)['job_id']
+        JobWorkers(self.app, 0, 500, 3, 1, 300).run_next()
+        job = json.loads(self.client().get(f'/jobs/{job_id}', headers=headers).data)['job']
+
+        self.assertEqual(job['status'], 'succeeded')
+        self.assertEqual(job['failed'], 1)
+        self.assertEqual(job['errors'][0]['message'], 'name and gender must be strings')
+        self.assertEqual(Actor.get_by_id(actor_id).name, "Actor Name")
+
+    def test_async_create_fail(self):
+        res = self.client().post('/movies/new?async=true', json=[],
+                                 headers={'Authorization': self.token('create:movie')})
+
+        self.assertEqual(res.status_code, 400)
+        self.assertFalse(json.loads(res.data)['success'])
+
+    def test_async_update_retries_transient_error(self):
+        movie = Movie(title="Some Movie Title", release_year=2020)
+        movie.insert()
+        actor = Actor(name="Actor Name", age=33, gender="female", movie_id=movie.id)
+        actor.insert()
+        actor_id = actor.id
+
+        res = self.client().patch(f'/actors/update/{actor_id}?async=true', json={'name': "Updated Name"},
+                                  headers={'Authorization': self.token('edit:actor')})
+        job_id = json.loads(res.data)['job_id']
+        self.assertEqual(res.status_code, 202)
+
+        failures = []
+
+        def fail_once(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('UPDATE actors') and not failures:
+                failures.append(statement)
+                raise OperationalError(statement, parameters, Exception('database is locked'))
+
+        event.listen(self.connection, 'before_cursor_execute', fail_once)
+        JobWorkers(self.app, 0, 500, 3, 1, 300).run_next()
+        event.remove(self.connection, 'before_cursor_execute', fail_once)
+
+        self.assertEqual(len(failures), 1)
+        self.assertEqual(Actor.get_by_id(actor_id).name, "Updated Name")
+        res = self.client().get(f'/jobs/{job_id}', headers={'Authorization': self.token('edit:actor')})
+        self.assertEqual(json.loads(res.data)['job']['status'], 'succeeded')
+
+        res = self.client().get(f'/jobs/{job_id}', headers={'Authorization': self.token('create:actor')})
+        self.assertEqual(res.status_code, 403)
+        res = self.client().get('/jobs/100000000', headers={'Authorization': self.token('edit:actor')})
+        self.assertEqual(res.status_code, 404)
+
+    def test_async_update_fails_on_permanent_error(self):
+        movie = Movie(title="Some Movie Title", release_year=2020)
+        movie.insert()
+        actor = Actor(name="Actor Name", age=33, gender="female", movie_id=movie.id)
+        actor.insert()
+        actor_id = actor.id
+
+        res = self.client().patch(f'/actors/update/{actor_id}?async=true', json={'name': "Updated Name"},
+                                  headers={'Authorization': self.token('edit:actor')})
+        job_id = json.loads(res.data)['job_id']
+
+        failures = []
+
+        def fail(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('UPDATE actors'):
+                failures.append(statement)
+                raise OperationalError(statement, parameters, Exception('no such column: name'))
+
+        event.listen(self.connection, 'before_cursor_execute', fail)
+        JobWorkers(self.app, 0, 500, 3, 1, 300).run_next()
+        event.remove(self.connection, 'before_cursor_execute', fail)
+
+        # Not retried
+        self.assertEqual(len(failures), 1)
+        self.assertEqual(Actor.get_by_id(actor_id).name, "Actor Name")
+        res = self.client().get(f'/jobs/{job_id}', headers={'Authorization': self.token('edit:actor')})
+        job = json.loads(res.data)['job']
+        self.assertEqual(job['status'], 'failed')
+        self.assertIn('no such column', job['error'])
+
+    # Partitioning Tests
+    # -------------------------------------------------------------------------
+
+    @unittest.skipUnless(engine.dialect.name == 'postgresql', 'partitioning needs PostgreSQL')
+    def test_partitioned_actors_prune_by_movie(self):
+        movie = Movie(title="Some Movie Title", release_year=2020)
+        movie.insert()
+        actor = Actor(name="Actor Name", age=33, gender="female", movie_id=movie.id)
+        actor.insert()
+        movie_id, actor_id = movie.id, actor.id
+
+        partition_actors(self.connection, 'hash', 4, 1000)
+
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append((statement, parameters))
+
+        event.listen(self.connection, 'before_cursor_execute', record)
+        actors = Actor.get_actors_by_movie_id(movie_id)
+        event.remove(self.connection, 'before_cursor_execute', record)
+        plan = ' '.join(row[0] for row in self.connection.exec_driver_sql(f'EXPLAIN {statements[-1][0]}',
+                                                                           statements[-1][1]))
+
+        self.assertEqual([actor.id for actor in actors], [actor_id])
+        self.assertEqual(len(set(re.findall(r'actors_p\d+', plan))), 1)
+        self.assertEqual(Movie.get_by_id(movie_id).delete(), 1)
+        self.assertIsNone(Actor.get_by_id(actor_id))
+
+    @unittest.skipUnless(engine.dialect.name == 'postgresql', 'planner statistics need PostgreSQL')
+    def test_estimated_count_of_plain_and_partitioned_tables(self):
+        movie = Movie(title="Some Movie Title", release_year=2020)
+        movie.insert()
+        Actor.insert_many([Actor(name=f"Actor {i}", age=30 + i, gender="female", movie_id=movie.id) for i in range(3)])
+
+        partition_actors(self.connection, 'hash', 4, 1000)
+        self.connection.exec_driver_sql('ANALYZE movies')
+        self.connection.exec_driver_sql('ANALYZE actors')
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement.lower())
+
+        event.listen(self.connection, 'before_cursor_execute', record)
+        estimates = (Movie.count('estimate'), Actor.count('estimate'))
+        event.remove(self.connection, 'before_cursor_execute', record)
+
+        self.assertEqual(estimates, (Movie.count('exact'), Actor.count('exact')))
+        # Both came from the statistics, not from the exact fallback
+        self.assertFalse([statement for statement in statements if 'count(' in statement])
+
+    # Profiler Tests
+    # -------------------------------------------------------------------------
+
+    def test_get_profiles_disabled(self):
+        headers = {
+            'Authorization': self.auth_headers["Executive_Producer"]
+        }
+        res = self.client().get('/profiles', headers=headers)
+
+        self.assertEqual(res.status_code, 404)
+
+    # Slow-Query Log Tests
+    # -------------------------------------------------------------------------
+
+    def test_slow_query_log(self):
+        slow_query_log = SlowQueryLog(self.connection.engine, threshold_ms=0.000001, size=10, analyze_rate=0)
+        slow_query_log.attach()
+        try:
+            headers = {
+                'Authorization': self.auth_headers["Casting_Assistant"]
+            }
+            res = self.client().get('/movies', headers=headers)
+            self.assertEqual(res.status_code, 200)
+        finally:
+            slow_query_log.detach()
+
+        slow_query_log.drain(timeout=5)
+        queries = slow_query_log.worst()
+
+        self.assertTrue(queries)
+        self.assertLessEqual(len(queries), 10)
+        movie_queries = [
+            query for query in queries
+            if query['route'] == 'GET /movies' and query['statement'].startswith('SELECT')
+        ]
+        self.assertTrue(movie_queries)
+        self.assertTrue(movie_queries[0]['plan'])
+
+    def test_slow_query_log_explains_without_side_effects(self):
+        slow_query_log = SlowQueryLog(self.connection.engine, threshold_ms=1, size=10, analyze_rate=1)
+        slow_query_log.record('WITH ids AS (SELECT id FROM movies) SELECT * FROM ids', (), 1.0)
+        slow_query_log.record('INSERT INTO movies (title) VALUES (?)', [(f'Movie {i}',) for i in range(10000)], 2.0,
+                              executemany=True)
+        slow_query_log.drain(timeout=5)
+        inserted, selected = slow_query_log.worst()
+
+        # A CTE may write, so it is never run again by EXPLAIN ANALYZE
+        self.assertTrue(selected['plan'])
+        self.assertFalse(selected['analyzed'])
+        self.assertIn("'Movie 9'", inserted['parameters'])
+        self.assertNotIn("'Movie 10'", inserted['parameters'])
+
+    # Statistics Endpoint Tests
+    # -------------------------------------------------------------------------
+
+    def test_stats_summary_adjust(self):
+        StatsSummary.adjust('test_metric', 'bucket', 2)
+        StatsSummary.adjust('test_metric', 'bucket', 3)
+        StatsSummary.adjust('test_metric', 'empty', -1)
+
+        self.assertEqual(StatsSummary.read('test_metric'), {'bucket': 5})
+
+    def test_get_actor_gender_stats(self):
+        headers = {
+            'Authorization': self.auth_headers["Casting_Assistant"]
+        }
+        res = self.client().get('/stats/actors/gender', headers=headers)
+        before = {row['gender']: row['count'] for row in json.loads(res.data)['actors_by_gender']}
+
+        movie = Movie(title="Some Movie Title", release_year=2020)
+        movie.insert()
+        Actor(name="Actor One", age=30, gender="female", movie_id=movie.id).insert()
+        Actor(name="Actor Two", age=40, gender="female", movie_id=movie.id).insert()
+        Actor(name="Actor Three", age=50, gender="male", movie_id=movie.id).insert()
+
+        res = self.client().get('/stats/actors/gender', headers=headers)
+        data = json.loads(res.data)
+        after = {row['gender']: row['count'] for row in data['actors_by_gender']}
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertEqual(after['female'] - before.get('female', 0), 2)
+        self.assertEqual(after['male'] - before.get('male', 0), 1)
+
+    def test_get_actor_age_stats(self):
+        headers = {
+            'Authorization': self.auth_headers["Casting_Assistant"]
+        }
+        movie = Movie(title="Some Movie Title", release_year=2020)
+        movie.insert()
+        movie_id = movie.id
+        Actor(name="Actor One", age=30, gender="female", movie_id=movie_id).insert()
+        Actor(name="Actor Two", age=40, gender="male", movie_id=movie_id).insert()
+
+        res = self.client().get('/stats/actors/age', headers=headers)
+        data = json.loads(res.data)
+        ages = {row['movie_id']: row for row in data['age_by_movie']}
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertEqual(ages[movie_id], {
+            'movie_id': movie_id,
+            'count': 2,
+            'min_age': 30,
+            'max_age': 40,
+            'avg_age': 35.0
+        })
+
+    def test_get_movie_release_year_stats(self):
+        headers = {
+            'Authorization': self.auth_headers["Casting_Assistant"]
+        }
+        res = self.client().get('/stats/movies/release-year', headers=headers)
+        before = {row['release_year']: row['count'] for row in json.loads(res.data)['movies_by_release_year']}
+
+        Movie(title="First Movie", release_year=1901).insert()
+        Movie(title="Second Movie", release_year=1901).insert()
+        Movie(title="Third Movie", release_year=1902).insert()
+
+        res = self.client().get('/stats/movies/release-year', headers=headers)
+        data = json.loads(res.data)
+        after = {row['release_year']: row['count'] for row in data['movies_by_release_year']}
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertEqual(after[1901] - before.get(1901, 0), 2)
+        self.assertEqual(after[1902] - before.get(1902, 0), 1)
+
+
+class ProfilerTestCase(DatabaseTestCase):
+    """
+    Runs requests against a second app built with the profiler enabled.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.profile_dir = tempfile.mkdtemp()
+        cls.app = create_app({
+            **DatabaseTestCase.app.config,
+            'PROFILER_ENABLED': True,
+            'PROFILER_DIR': cls.profile_dir
+        })
+        # create_app binds the models to the app it builds; keep the harness app bound for every other test
+        db.app = DatabaseTestCase.app
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        slow_query_log = cls.app.extensions.get('slow_query_log')
+        if slow_query_log is not None:
+            slow_query_log.detach()
+        db.get_engine(cls.app).dispose()
+        shutil.rmtree(cls.profile_dir)
+
+    def tearDown(self):
+        super().tearDown()
+        for name in os.listdir(self.profile_dir):
+            os.remove(os.path.join(self.profile_dir, name))
+
+    def test_profile_requires_permission(self):
+        headers = {
+            'Authorization': self.auth_headers["Casting_Assistant"],
+            'X-Profile': 'cprofile'
+        }
+        res = self.client().get('/movies', headers=headers)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn('X-Profile-Id', res.headers)
+        self.assertEqual(os.listdir(self.profile_dir), [])
+
+    def test_profile_request(self):
+        token = self.token('view:movies', 'profile:requests')
+        res = self.client().get('/movies', headers={'Authorization': token, 'X-Profile': 'cprofile'})
+
+        self.assertEqual(res.status_code, 200)
+        profile_id = res.headers['X-Profile-Id']
+        self.assertTrue(profile_id.endswith('.prof'))
+
+        res = self.client().get('/profiles', headers={'Authorization': token})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([profile['name'] for profile in data['profiles']], [profile_id])
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,158 @@
+"""
+Offline, Database-Isolated Test Harness
+
+Importing this module prepares the process for tests, before `settings.py` reads the environment:
+
+    - An `AuthStub` signs RS256 tokens with a local key and serves its JWKS on localhost, so `requires_auth`
+      runs unchanged without Auth0 or network access. The permissions of every role are read from
+      `auth_config.json`.
+    - Every test worker gets its own database: `TEST_DATABASE_URL` with the worker id appended to the
+      database name (created on demand on PostgreSQL), or a SQLite file in the temp directory by default.
+      The worker id comes from `TEST_WORKER` (set by `run_tests.py`) or pytest-xdist.
+    - The schema is dropped and created once per worker.
+
+`DatabaseTestCase` then runs every test inside a transaction that is rolled back afterwards. The model and
+route code still commits and rolls back as usual; those calls act on a SAVEPOINT that is restarted after
+each of them, so tests see their own writes and leave nothing behind.
+
+Import this module before `app` or `settings`.
+
+Classes:
+    DatabaseTestCase: unittest base class with a shared app, transactional isolation and role tokens.
+"""
+import json
+import os
+import tempfile
+import unittest
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.orm import scoped_session
+
+from auth_stub import AuthStub
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+WORKER = os.getenv('TEST_WORKER') or os.getenv('PYTEST_XDIST_WORKER') or 'main'
+DOMAIN = 'casting-tests.local'
+AUDIENCE = 'casting-tests'
+
+
+def _database_url():
+    """
+    Returns the URL of this worker's database, creating the database on PostgreSQL if needed.
+    """
+    base = os.getenv('TEST_DATABASE_URL')
+    if not base:
+        # Concurrency tests send requests from threads over the test's connection, one query at a time
+        path = os.path.join(tempfile.gettempdir(), f'casting_test_{WORKER}.db')
+        return f'sqlite:///{path}?check_same_thread=false'
+
+    url = make_url(base)
+    name = f'{url.database}_{WORKER}'
+    if url.get_backend_name() == 'postgresql':
+        admin = create_engine(url.set(database='postgres'), isolation_level='AUTOCOMMIT')
+        with admin.connect() as conn:
+            exists = conn.execute(text('SELECT 1 FROM pg_database WHERE datname = :name'), {'name': name}).scalar()
+            if not exists:
+                conn.exec_driver_sql(f'CREATE DATABASE "{name}"')
+        admin.dispose()
+    return str(url.set(database=name))
+
+
+with open(os.path.join(ROOT, 'auth_config.json')) as f:
+    ROLE_PERMISSIONS = {
+        role: config['permissions'] for role, config in json.load(f)['roles'].items()
+    }
+
+auth_stub = AuthStub(DOMAIN, AUDIENCE)
+os.environ.update({
+    'AUTH0_DOMAIN': DOMAIN,
+    'API_IDENTIFIER': AUDIENCE,
+    'ALGORITHMS': 'RS256',
+    'AUTH0_JWKS_URL': auth_stub.start(),
+    'DATABASE_URL': _database_url(),
+    # Tests run queued jobs themselves with `app.extensions['jobs'].run_next()`
+    'JOB_WORKERS': '0'
+})
+
+from app import app
+from models import db
+from cache import clear_cache
+
+with app.app_context():
+    engine = db.engine
+    db.drop_all()
+    db.create_all()
+
+if engine.dialect.name == 'sqlite':
+    # pysqlite manages transactions itself and breaks SAVEPOINTs; let SQLAlchemy emit BEGIN instead
+    @event.listens_for(engine, 'connect')
+    def _disable_pysqlite_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def _emit_begin(conn):
+        conn.exec_driver_sql('BEGIN')
+
+    engine.dispose()
+
+
+class _TestScopedSession(scoped_session):
+    """
+    A scoped session that survives the `remove()` Flask-SQLAlchemy issues after every request.
+
+    The session is bound to the test's connection and holds its SAVEPOINT, so removing it would end the
+    test transaction. Expunging mirrors what a fresh session would see.
+    """
+
+    def remove(self):
+        if self.registry.has():
+            self.registry().expunge_all()
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """
+    Runs each test in a transaction that is rolled back afterwards.
+
+    Attributes:
+        app (Flask): The application, created once per worker.
+        client (callable): Returns a test client for `app`.
+        auth_headers (dict): `Authorization` header values for every role in `auth_config.json`.
+    """
+
+    app = app
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = cls.app.test_client
+        cls.auth_headers = {
+            role: f'Bearer {auth_stub.token(permissions)}' for role, permissions in ROLE_PERMISSIONS.items()
+        }
+
+    def setUp(self):
+        self.connection = engine.connect()
+        self.transaction = self.connection.begin()
+
+        self._app_session = db.session
+        db.session = _TestScopedSession(db.create_session({'bind': self.connection, 'binds': {}}))
+        db.session.begin_nested()
+
+        @event.listens_for(db.session, 'after_transaction_end')
+        def restart_savepoint(session, transaction):
+            if transaction.nested and not transaction._parent.nested:
+                session.expire_all()
+                session.begin_nested()
+
+    def tearDown(self):
+        db.session.close()
+        db.session = self._app_session
+        self.transaction.rollback()
+        self.connection.close()
+        # Cached results may describe rows that were just rolled back
+        clear_cache()
+
+    def token(self, *permissions):
+        """
+        Returns an `Authorization` header value for a token granting exactly `permissions`.
+        """
+        return f'Bearer {auth_stub.token(permissions)}'
@@ -0,0 +1,54 @@
+"""
+Request-Scoped Unit of Work for a Flask Application
+
+With the unit of work installed, the `Movie`/`Actor` write methods no longer commit one by one. They flush
+their changes, so constraint errors still surface inside the handler, and every request is committed once
+after the view returns:
+
+    - responses with a status below 400 are committed,
+    - error responses and unhandled exceptions are rolled back.
+
+A handler touching several rows therefore pays for a single commit. Pass `commit=True` to a write method to
+commit immediately anyway, or set `UNIT_OF_WORK=false` to restore commit-per-method for the whole app.
+
+Functions:
+    register_unit_of_work(app): Installs the request hooks unless disabled.
+"""
+from models import begin_unit_of_work, end_unit_of_work, in_unit_of_work, commit_session, rollback_session
+from settings import UNIT_OF_WORK
+
+
+def register_unit_of_work(app):
+    """
+    Installs hooks wrapping every request in a single transaction.
+
+    The setting is read from `app.config` first, falling back to `settings.py`.
+
+    Args:
+        app (Flask): The Flask application instance.
+    """
+    if not app.config.get('UNIT_OF_WORK', UNIT_OF_WORK):
+        return
+
+    @app.before_request
+    def begin_request_transaction():
+        begin_unit_of_work()
+
+    @app.after_request
+    def finish_request_transaction(response):
+        if not in_unit_of_work():
+            return response
+        end_unit_of_work()
+        if response.status_code < 400:
+            # A failing commit propagates and turns the response into a 500
+            commit_session()
+        else:
+            rollback_session()
+        return response
+
+    @app.teardown_request
+    def discard_request_transaction(error):
+        # after_request is skipped when an exception propagates
+        if in_unit_of_work():
+            end_unit_of_work()
+            rollback_session()